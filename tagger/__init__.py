@@ -1,3 +1,8 @@
-from .app import main
+def main() -> None:
+    # 延迟导入界面，训练脚本与命令行工具使用 tagger 时不需要安装 PyQt5
+    from .app import main as run_app
+
+    run_app()
+
 
 __all__ = ["main"]
@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+MAGIC = b"TAGPACK\x00"
+VERSION = 1
+# magic, version, flags, index_offset, index_size
+_HEADER = struct.Struct("<8sIIQQ")
+
+_OPEN_LOCK = threading.Lock()
+_OPEN: Dict[Path, Tuple[Tuple[int, int], "PackedArchive"]] = {}
+
+
+class ArchiveError(OSError):
+    """归档文件格式错误；继承 OSError，调用方可以与普通读写失败一并处理"""
+
+
+@dataclass
+class ArchiveEntry:
+    base_name: str
+    image_name: Optional[str]
+    tag_offset: int
+    tag_size: int
+    image_offset: int
+    image_size: int
+    locked: bool
+
+    @property
+    def embedded(self) -> bool:
+        return self.image_size > 0
+
+
+class PackedArchive:
+    """单文件数据集：文件头 + 连续的标签区 + 可选图片区 + 末尾的偏移索引。
+
+    通过 mmap 随机访问，读取某一条标签只触及对应的几十个字节。
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as exc:
+            self._file.close()
+            raise ArchiveError(f"归档文件为空：{path}") from exc
+        try:
+            self.tag_suffix, self.entries = self._read_index()
+        except (ArchiveError, ValueError, KeyError, TypeError) as exc:
+            self.close()
+            if isinstance(exc, ArchiveError):
+                raise
+            raise ArchiveError(f"归档索引损坏：{path}") from exc
+        self._by_name = {entry.base_name: entry for entry in self.entries}
+
+    def _read_index(self) -> Tuple[str, List[ArchiveEntry]]:
+        if len(self._map) < _HEADER.size:
+            raise ArchiveError(f"不是标签归档文件：{self.path}")
+        magic, version, _, offset, size = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ArchiveError(f"不是标签归档文件：{self.path}")
+        if version != VERSION:
+            raise ArchiveError(f"不支持的归档版本 {version}：{self.path}")
+        if offset + size > len(self._map):
+            raise ArchiveError(f"归档文件不完整：{self.path}")
+        index = json.loads(self._map[offset : offset + size].decode("utf-8"))
+        entries = [
+            ArchiveEntry(base, image, tag_offset, tag_size, image_offset, image_size, bool(locked))
+            for base, image, tag_offset, tag_size, image_offset, image_size, locked in index["records"]
+        ]
+        return index["tag_suffix"], entries
+
+    def __enter__(self) -> "PackedArchive":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def entry(self, base_name: str) -> Optional[ArchiveEntry]:
+        return self._by_name.get(base_name)
+
+    def member_name(self, path: Path) -> Optional[str]:
+        """把 归档路径/记录名+后缀 形式的成员路径还原为记录名"""
+        try:
+            relative = path.relative_to(self.path).as_posix()
+        except ValueError:
+            return None
+        if relative.endswith(self.tag_suffix) and relative[: -len(self.tag_suffix)] in self._by_name:
+            return relative[: -len(self.tag_suffix)]
+        folder, _, name = relative.rpartition("/")
+        stem = os.path.splitext(name)[0]
+        base = f"{folder}/{stem}" if folder else stem
+        entry = self._by_name.get(base)
+        if entry is not None and entry.embedded and entry.image_name == name:
+            return base
+        return None
+
+    def tag_text(self, base_name: str) -> str:
+        entry = self._by_name[base_name]
+        return self._map[entry.tag_offset : entry.tag_offset + entry.tag_size].decode("utf-8")
+
+    def image_bytes(self, base_name: str) -> Optional[bytes]:
+        entry = self._by_name[base_name]
+        if not entry.embedded:
+            return None
+        return self._map[entry.image_offset : entry.image_offset + entry.image_size]
+
+    def close(self) -> None:
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+class ArchiveWriter:
+    """顺序写出归档：先写占位文件头，标签与图片依次追加，最后写索引并回填文件头"""
+
+    def __init__(self, fp: BinaryIO, tag_suffix: str) -> None:
+        self._fp = fp
+        self.tag_suffix = tag_suffix
+        self._rows: List[list] = []
+        self._fp.write(_HEADER.pack(MAGIC, VERSION, 0, 0, 0))
+        self.bytes = _HEADER.size
+
+    def add_tags(self, base_name: str, text: str, locked: bool) -> None:
+        data = text.encode("utf-8")
+        self._rows.append([base_name, None, self.bytes, len(data), 0, 0, int(locked)])
+        self._fp.write(data)
+        self.bytes += len(data)
+
+    def add_image(self, base_name: str, image_name: str, source: Optional[BinaryIO]) -> None:
+        """为最近一次 add_tags 的记录附上图片；source 为 None 时只记录文件名，不嵌入内容"""
+        row = self._rows[-1]
+        if row[0] != base_name:
+            raise ValueError(f"图片与标签记录不匹配：{base_name}")
+        row[1] = image_name
+        if source is None:
+            return
+        offset = self.bytes
+        while True:
+            chunk = source.read(1024 * 1024)
+            if not chunk:
+                break
+            self._fp.write(chunk)
+            self.bytes += len(chunk)
+        row[4], row[5] = offset, self.bytes - offset
+
+    def finish(self) -> int:
+        index = json.dumps(
+            {"tag_suffix": self.tag_suffix, "records": self._rows},
+            ensure_ascii=False,
+            separators=(",", ":"),
+        ).encode("utf-8")
+        offset = self.bytes
+        self._fp.write(index)
+        self.bytes += len(index)
+        self._fp.seek(0)
+        self._fp.write(_HEADER.pack(MAGIC, VERSION, 0, offset, len(index)))
+        self._fp.seek(self.bytes)
+        return len(self._rows)
+
+
+def is_archive(path: Path) -> bool:
+    try:
+        with open(path, "rb") as fp:
+            return fp.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def open_archive(path: Path) -> PackedArchive:
+    """打开（或复用已打开的）归档；文件被替换后按 (mtime, size) 判断并重新映射"""
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _OPEN_LOCK:
+        cached = _OPEN.get(path)
+        if cached and cached[0] == signature:
+            return cached[1]
+        archive = PackedArchive(path)
+        if cached:
+            cached[1].close()
+        _OPEN[path] = (signature, archive)
+        return archive
+
+
+def close_archive(path: Path) -> None:
+    with _OPEN_LOCK:
+        cached = _OPEN.pop(path, None)
+    if cached:
+        cached[1].close()
+
+
+def find_member(path: Path) -> Optional[Tuple[PackedArchive, str]]:
+    """在已打开的归档中查找成员路径，返回 (归档, 记录名)"""
+    if not _OPEN:
+        return None
+    with _OPEN_LOCK:
+        for parent in path.parents:
+            cached = _OPEN.get(parent)
+            if cached is None:
+                continue
+            name = cached[1].member_name(path)
+            return (cached[1], name) if name is not None else None
+    return None
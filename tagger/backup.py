@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .config import BACKUP_FILENAME, INDEX_DIRNAME
+from .tagcache import tag_cache
+
+BACKUP_SUFFIX = ".bak"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    content TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS versions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS versions_path ON versions(path, created, id);
+"""
+
+
+@dataclass
+class Version:
+    id: int
+    digest: str
+    created: float
+    tags: List[str]
+
+
+def _content(tags: Iterable[str]) -> str:
+    return ", ".join(tag.strip() for tag in tags if tag.strip())
+
+
+def _split(content: str) -> List[str]:
+    return [piece.strip() for piece in content.replace("\n", ",").split(",") if piece.strip()]
+
+
+def backup_before_write(path: Path) -> Optional["BackupStore"]:
+    """覆盖标签文件前把当前内容登记到所属数据集的备份库，返回需要在替换前 flush 的备份库。
+
+    优先使用标签缓存中已解析的内容，批量操作刚读过的文件不会再读一次。
+    备份失败不阻止写入，与旧版 .bak 的行为一致。
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    cached = tag_cache.get(path, (stat.st_mtime_ns, stat.st_size))
+    try:
+        tags = list(cached) if cached is not None else _split(path.read_text(encoding="utf-8"))
+        store = store_for(path)
+        store.record(path, tags)
+    except (OSError, UnicodeDecodeError, sqlite3.Error):
+        return None
+    return store
+
+
+class BackupStore:
+    """数据集级别的内容寻址备份：标签内容按哈希只存一份，每个标签文件保留一条版本记录序列。
+
+    全部数据保存在 <数据集>/.tagger/backups.sqlite3 中，不在工作目录里产生任何旁路文件。
+    写入先在事务中暂存，flush() 提交后才允许覆盖原文件。
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.path = root / INDEX_DIRNAME / BACKUP_FILENAME
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._dirty = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            conn.executescript(_SCHEMA)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def key(self, path: Path) -> str:
+        try:
+            return path.relative_to(self.root).as_posix()
+        except ValueError:
+            return path.as_posix()
+
+    def record(self, path: Path, tags: Iterable[str], created: Optional[float] = None) -> bool:
+        """登记一个版本；与该文件最近一个版本内容相同时不重复登记，返回是否新增"""
+        content = _content(tags)
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        key = self.key(path)
+        with self._lock:
+            conn = self._connect()
+            latest = conn.execute(
+                "SELECT digest FROM versions WHERE path = ? ORDER BY id DESC LIMIT 1", (key,)
+            ).fetchone()
+            if latest and latest[0] == digest:
+                return False
+            conn.execute("INSERT OR IGNORE INTO blobs (digest, content) VALUES (?, ?)", (digest, content))
+            conn.execute(
+                "INSERT INTO versions (path, digest, created) VALUES (?, ?, ?)",
+                (key, digest, time.time() if created is None else created),
+            )
+            self._dirty = True
+        return True
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._dirty and self._conn is not None:
+                self._conn.commit()
+                self._dirty = False
+
+    def versions(self, path: Path) -> List[Version]:
+        """按时间顺序返回文件的全部版本"""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT v.id, v.digest, v.created, b.content FROM versions v "
+                "JOIN blobs b ON b.digest = v.digest WHERE v.path = ? ORDER BY v.created, v.id",
+                (self.key(path),),
+            ).fetchall()
+        return [Version(row[0], row[1], row[2], _split(row[3])) for row in rows]
+
+    def initial(self, path: Path) -> Optional[List[str]]:
+        """最早的备份，即本工具第一次修改该文件之前的内容"""
+        return self._pick(path, "ORDER BY v.created, v.id LIMIT 1", ())
+
+    def before(self, path: Path, timestamp: float) -> Optional[List[str]]:
+        """timestamp 之前最近一次被覆盖前的内容"""
+        return self._pick(path, "AND v.created <= ? ORDER BY v.created DESC, v.id DESC LIMIT 1", (timestamp,))
+
+    def _pick(self, path: Path, clause: str, params: Tuple) -> Optional[List[str]]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT b.content FROM versions v JOIN blobs b ON b.digest = v.digest "
+                f"WHERE v.path = ? {clause}",
+                (self.key(path), *params),
+            ).fetchone()
+        return None if row is None else _split(row[0])
+
+    def rename(self, renames: Dict[Path, Path], deleted: Iterable[Path] = ()) -> None:
+        """文件改名后（例如删除并重排）让历史版本跟随新名称。
+
+        deleted 中的文件已被删除：其历史先在同一事务中移到 //deleted/<时间>/<原路径> 下保留，
+        否则改名到该名称的文件会与它的历史混在一起，恢复时写入另一张图片的标签。
+        """
+        removed = [self.key(path) for path in deleted]
+        if not renames and not removed:
+            return
+        with self._lock:
+            conn = self._connect()
+            stamp = time.time_ns()
+            conn.executemany(
+                "UPDATE versions SET path = ? WHERE path = ?", [(f"//deleted/{stamp}/{key}", key) for key in removed]
+            )
+            moved = [(self.key(old), self.key(new)) for old, new in renames.items()]
+            # 新旧名称可能相互重叠，先整体改为临时名称
+            conn.executemany("UPDATE versions SET path = ? WHERE path = ?", [("//" + old, old) for old, _ in moved])
+            conn.executemany("UPDATE versions SET path = ? WHERE path = ?", [(new, "//" + old) for old, new in moved])
+            conn.commit()
+
+    def counts(self) -> Tuple[int, int]:
+        """返回 (版本数, 去重后的内容数)"""
+        with self._lock:
+            conn = self._connect()
+            versions = conn.execute("SELECT COUNT(*) FROM versions").fetchone()[0]
+            blobs = conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+        return versions, blobs
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self.flush()
+                self._conn.close()
+                self._conn = None
+
+
+_STORES: Dict[Path, BackupStore] = {}
+_ROOTS: Dict[Path, Path] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def dataset_root(folder: Path) -> Path:
+    """向上查找已有 .tagger 目录的数据集根目录；找不到时以该目录为根，结果按目录缓存"""
+    with _REGISTRY_LOCK:
+        root = _ROOTS.get(folder)
+    if root is not None:
+        return root
+    root = folder
+    for candidate in (folder, *folder.parents):
+        if (candidate / INDEX_DIRNAME).is_dir():
+            root = candidate
+            break
+    with _REGISTRY_LOCK:
+        return _ROOTS.setdefault(folder, root)
+
+
+def store_for(path: Path) -> BackupStore:
+    """标签文件所属数据集的备份库"""
+    return store_for_folder(path.parent)
+
+
+def store_for_folder(folder: Path) -> BackupStore:
+    """目录所属数据集的备份库"""
+    root = dataset_root(folder)
+    with _REGISTRY_LOCK:
+        store = _STORES.get(root)
+        if store is None:
+            store = _STORES[root] = BackupStore(root)
+        return store
+
+
+def close_stores() -> None:
+    with _REGISTRY_LOCK:
+        stores = list(_STORES.values())
+        _STORES.clear()
+        _ROOTS.clear()
+    for store in stores:
+        store.close()
+
+
+def migrate_bak_files(folder: Path, tag_suffix: str, recursive: bool = False) -> int:
+    """把旧版写入产生的 <标签文件>.bak 导入备份库作为初始版本并删除，返回迁移数量"""
+    pattern = f"**/*{tag_suffix}{BACKUP_SUFFIX}" if recursive else f"*{tag_suffix}{BACKUP_SUFFIX}"
+    stores = set()
+    migrated: List[Path] = []
+    for backup in sorted(folder.glob(pattern)):
+        if any(part.startswith(".") for part in backup.relative_to(folder).parts):
+            continue
+        try:
+            content = backup.read_text(encoding="utf-8")
+            created = backup.stat().st_mtime
+        except OSError:
+            continue
+        target = backup.with_name(backup.name[: -len(BACKUP_SUFFIX)])
+        store = store_for(target)
+        tags = _split(content)
+        # .bak 的修改时间早于备份库中的任何版本，按时间排序后自然成为初始版本
+        store.record(target, tags, created)
+        stores.add(store)
+        migrated.append(backup)
+    for store in stores:
+        store.flush()
+    for backup in migrated:
+        try:
+            os.unlink(backup)
+        except OSError:
+            pass
+    return len(migrated)
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from .config import BULK_WORKERS, WRITE_GROUP_SIZE
+from .dto import FileRecord
+from .fileops import read_tags
+from .normalizer import deduplicate_tags
+from .writer import TagWriteBatch, WriteStats
+
+# 输入原标签，返回 (新标签, 操作说明)；新标签与原标签相同视为无需修改
+Transform = Callable[[List[str]], Tuple[List[str], List[str]]]
+# 按记录变换：目标标签因文件而异时使用（例如从导出文件导入）
+RecordTransform = Callable[[FileRecord, List[str]], Tuple[List[str], List[str]]]
+Reader = Callable[[FileRecord], List[str]]
+ProgressCallback = Callable[[int, int], None]
+
+CHUNK_SIZE = 64
+
+
+@dataclass
+class BulkChange:
+    record: FileRecord
+    old_count: int
+    tags: List[str]
+    notes: List[str]
+
+
+@dataclass
+class BulkResult:
+    total: int = 0
+    processed: int = 0
+    unchanged: int = 0
+    locked_skipped: List[FileRecord] = field(default_factory=list)
+    changes: List[BulkChange] = field(default_factory=list)
+    failures: List[str] = field(default_factory=list)
+    cancelled: bool = False
+    write_stats: WriteStats = field(default_factory=WriteStats)
+    seconds: float = 0.0
+
+    @property
+    def locked_modified(self) -> int:
+        return sum(1 for change in self.changes if change.record.locked)
+
+
+def add_tags(tags_to_add: Sequence[str]) -> Transform:
+    def transform(tags: List[str]) -> Tuple[List[str], List[str]]:
+        return tags + [tag for tag in tags_to_add if tag not in tags], []
+
+    return transform
+
+
+def replace_tag(source: str, target: str) -> Transform:
+    def transform(tags: List[str]) -> Tuple[List[str], List[str]]:
+        return [target if tag == source else tag for tag in tags], []
+
+    return transform
+
+
+def delete_tag(target: str) -> Transform:
+    def transform(tags: List[str]) -> Tuple[List[str], List[str]]:
+        return [tag for tag in tags if tag != target], []
+
+    return transform
+
+
+def compact_tags(tags: List[str]) -> Tuple[List[str], List[str]]:
+    deduped, _, operations = deduplicate_tags(tags)
+    return deduped, operations
+
+
+class BulkEngine:
+    """与界面无关的批量处理引擎：读取、变换与写入在线程池中并行执行，
+    写入经 TagWriteBatch 分组原子提交；进度通过回调汇报，可随时取消。
+
+    回调在工作线程中调用，界面需自行切回主线程更新控件。
+    """
+
+    def __init__(
+        self,
+        reader: Reader = lambda record: read_tags(record.tag_path),
+        max_workers: int = BULK_WORKERS,
+        group_size: int = WRITE_GROUP_SIZE,
+    ) -> None:
+        self.reader = reader
+        self.max_workers = max(1, max_workers)
+        self.group_size = group_size
+
+    def run(
+        self,
+        records: Sequence[FileRecord],
+        transform: Transform,
+        include_locked: bool = False,
+        progress: Optional[ProgressCallback] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> BulkResult:
+        return self.run_each(records, lambda record, tags: transform(tags), include_locked, progress, cancel)
+
+    def run_each(
+        self,
+        records: Sequence[FileRecord],
+        transform: RecordTransform,
+        include_locked: bool = False,
+        progress: Optional[ProgressCallback] = None,
+        cancel: Optional[threading.Event] = None,
+    ) -> BulkResult:
+        started = time.perf_counter()
+        result = BulkResult(total=len(records))
+        cancel = cancel or threading.Event()
+        batch = TagWriteBatch(group_size=self.group_size)
+        lock = threading.Lock()
+        chunks = [records[i : i + CHUNK_SIZE] for i in range(0, len(records), CHUNK_SIZE)]
+        worker = partial(self._process, transform, include_locked, batch, result, lock, progress, cancel)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for error in pool.map(worker, chunks):
+                if error is not None:
+                    cancel.set()
+                    batch.abort()
+                    raise error
+        # 取消时已暂存的写入仍然提交：每个文件都是原子替换，不会留下半成品
+        batch.commit()
+        failed = {path for path, _ in batch.failures}
+        result.failures.extend(f"{path.name}: 写入失败（{exc}）" for path, exc in batch.failures)
+        result.changes = sorted(
+            (change for change in result.changes if change.record.tag_path not in failed),
+            key=lambda change: change.record.base_name,
+        )
+        result.cancelled = cancel.is_set()
+        result.write_stats = batch.stats
+        result.seconds = time.perf_counter() - started
+        return result
+
+    def _process(
+        self,
+        transform: RecordTransform,
+        include_locked: bool,
+        batch: TagWriteBatch,
+        result: BulkResult,
+        lock: threading.Lock,
+        progress: Optional[ProgressCallback],
+        cancel: threading.Event,
+        chunk: Sequence[FileRecord],
+    ) -> Optional[BaseException]:
+        try:
+            for record in chunk:
+                if cancel.is_set():
+                    return None
+                change, failure = self._apply(record, transform, include_locked, batch)
+                with lock:
+                    result.processed += 1
+                    if failure is not None:
+                        result.failures.append(failure)
+                    elif change is None and record.locked and not include_locked:
+                        result.locked_skipped.append(record)
+                    elif change is None:
+                        result.unchanged += 1
+                    else:
+                        result.changes.append(change)
+                    done = result.processed
+                if progress is not None:
+                    progress(done, result.total)
+        except BaseException as exc:  # noqa: BLE001 - 交给 run 在调用线程中重新抛出
+            return exc
+        return None
+
+    def _apply(
+        self,
+        record: FileRecord,
+        transform: RecordTransform,
+        include_locked: bool,
+        batch: TagWriteBatch,
+    ) -> Tuple[Optional[BulkChange], Optional[str]]:
+        if record.locked and not include_locked:
+            return None, None
+        try:
+            tags = self.reader(record)
+        except OSError as exc:
+            return None, f"{record.base_name}: 读取失败（{exc}）"
+        new_tags, notes = transform(record, tags)
+        if new_tags == tags:
+            return None, None
+        try:
+            written = batch.write(record.tag_path, new_tags)
+        except OSError as exc:
+            return None, f"{record.base_name}: 写入失败（{exc}）"
+        return BulkChange(record, len(tags), written, notes), None
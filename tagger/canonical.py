@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import csv
+import sys
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .config import CANONICAL_TABLES, NORMALIZER_CACHE_SIZE
+from .dto import FileRecord
+
+# e621 数据库导出（tag_aliases / tag_implications）只采用生效中的记录
+ACTIVE_STATUS = "active"
+MAX_CHAIN = 32
+
+
+class CanonicalError(ValueError):
+    """别名或蕴含表格式无效"""
+
+
+def fold(tag: str) -> str:
+    """查表用的形式：小写、空格换成下划线，与 e621 标签名的写法一致"""
+    return tag.strip().lower().replace(" ", "_")
+
+
+class CanonicalMap:
+    """标签规范化表：别名把同义写法映射到唯一的规范名称，蕴含在存在某个标签时补充其上位标签。
+
+    编译后别名链已展开为一步到位的映射，规范名称经 sys.intern 驻留，
+    数百万行别名共享同一批字符串；每次查找是一次折叠加一次哈希查找，并带有有上限的结果缓存。
+    """
+
+    def __init__(self) -> None:
+        self.aliases: Dict[str, str] = {}
+        self.vocabulary: Set[str] = set()
+        self.implications: Dict[str, Tuple[str, ...]] = {}
+        self.sources: List[Path] = []
+        self._closure: Dict[str, Tuple[str, ...]] = {}
+        self._lock = threading.Lock()
+        self.canonical = lru_cache(maxsize=NORMALIZER_CACHE_SIZE)(self._canonical)
+
+    def __bool__(self) -> bool:
+        return bool(self.aliases or self.vocabulary or self.implications)
+
+    def _canonical(self, tag: str) -> str:
+        key = fold(tag)
+        target = self.aliases.get(key)
+        if target is not None:
+            return target
+        if key != tag and key in self.vocabulary:
+            return key
+        return tag
+
+    def has_alias(self, tag: str) -> bool:
+        return self.canonical(tag) != tag
+
+    def implied(self, tag: str) -> Tuple[str, ...]:
+        """tag 蕴含的全部上位标签（传递闭包），按广度优先顺序，结果缓存"""
+        closure = self._closure.get(tag)
+        if closure is not None:
+            return closure
+        found: List[str] = []
+        seen = {tag}
+        queue = list(self.implications.get(tag, ()))
+        while queue:
+            current = queue.pop(0)
+            if current in seen:
+                continue
+            seen.add(current)
+            found.append(current)
+            queue.extend(self.implications.get(current, ()))
+        closure = tuple(found)
+        with self._lock:
+            self._closure[tag] = closure
+        return closure
+
+    def apply(self, tags: Sequence[str], implications: bool = False) -> Tuple[List[str], List[str]]:
+        """把标签替换为规范名称并移除因此产生的重复；implications 为 True 时补充蕴含的标签"""
+        result: List[str] = []
+        seen: Set[str] = set()
+        notes: List[str] = []
+        for tag in tags:
+            canonical = self.canonical(tag)
+            if canonical != tag:
+                notes.append(f"别名：{tag} → {canonical}")
+            key = fold(canonical)
+            if key in seen:
+                notes.append(f"移除重复标签：{tag}")
+                continue
+            seen.add(key)
+            result.append(canonical)
+        if implications and self.implications:
+            for tag in list(result):
+                for extra in self.implied(fold(tag)):
+                    if extra not in seen:
+                        seen.add(extra)
+                        result.append(extra)
+                        notes.append(f"蕴含：{tag} → +{extra}")
+        return result, notes
+
+    def add_alias(self, source: str, target: str) -> None:
+        # 规范名称保留表中的写法，自定义表可以使用空格或大写
+        source, target = fold(source), target.strip()
+        if source and target and source != target:
+            self.aliases[source] = target
+
+    def add_implication(self, source: str, target: str) -> None:
+        source, target = fold(source), fold(target)
+        if source and target and source != target:
+            existing = self.implications.get(source, ())
+            if target not in existing:
+                self.implications[source] = existing + (target,)
+
+    def finalize(self) -> None:
+        """展开别名链（a → b → c 直接记为 a → c；成环的别名互相抵消，保持原样），
+        把蕴含两端换成规范名称，并驻留规范名称"""
+        aliases = self.aliases
+        resolved: Dict[str, str] = {}
+        # 大量别名指向同一个规范名称，每个目标只展开一次
+        finals: Dict[str, str] = {}
+        for source, target in aliases.items():
+            final = finals.get(target)
+            if final is None:
+                final = target
+                visited = {fold(target)}
+                following = aliases.get(fold(target))
+                while following is not None and len(visited) < MAX_CHAIN:
+                    key = fold(following)
+                    if key in visited:
+                        break
+                    visited.add(key)
+                    final = following
+                    following = aliases.get(key)
+                final = finals[target] = sys.intern(final)
+            if final != source:
+                resolved[source] = final
+        self.aliases = resolved
+        implications: Dict[str, Tuple[str, ...]] = {}
+        for source, targets in self.implications.items():
+            source = fold(self.aliases.get(source, source))
+            merged = list(implications.get(source, ()))
+            for target in targets:
+                target = sys.intern(fold(self.aliases.get(target, target)))
+                if target != source and target not in merged:
+                    merged.append(target)
+            implications[sys.intern(source)] = tuple(merged)
+        self.implications = implications
+        self.vocabulary = {sys.intern(name) for name in self.vocabulary}
+        self._closure.clear()
+        self.canonical.cache_clear()
+
+    def counts(self) -> Tuple[int, int, int]:
+        """返回 (别名数, 蕴含数, 词表大小)"""
+        return len(self.aliases), sum(len(targets) for targets in self.implications.values()), len(self.vocabulary)
+
+
+def _read_table(cmap: CanonicalMap, path: Path) -> None:
+    with open(path, "r", encoding="utf-8-sig", newline="") as fp:
+        reader = csv.reader(fp)
+        header = [name.strip().lower() for name in next(reader, [])]
+        columns = {name: index for index, name in enumerate(header)}
+        status = columns.get("status")
+        if "antecedent_name" in columns and "consequent_name" in columns:
+            source, target = columns["antecedent_name"], columns["consequent_name"]
+            add = cmap.add_implication if "implication" in path.name.lower() else cmap.add_alias
+        elif "alias" in columns and "canonical" in columns:
+            source, target, add = columns["alias"], columns["canonical"], cmap.add_alias
+        elif "tag" in columns:
+            # 训练用的 tag_map.csv 是规范词表：只把大小写与空格写法不同的变体折叠到词表中的名称
+            column = columns["tag"]
+            for row in reader:
+                if len(row) > column and row[column].strip():
+                    name = row[column].strip()
+                    key = fold(name)
+                    if key == name:
+                        cmap.vocabulary.add(name)
+                    else:
+                        cmap.aliases.setdefault(key, name)
+            return
+        else:
+            raise CanonicalError(
+                f"{path.name} 缺少可识别的列（antecedent_name/consequent_name、alias/canonical 或 tag）"
+            )
+        width = max(source, target) + 1
+        for row in reader:
+            if len(row) < width:
+                continue
+            if status is not None and len(row) > status and row[status].strip().lower() != ACTIVE_STATUS:
+                continue
+            add(row[source], row[target])
+
+
+def load_tables(paths: Iterable[Path]) -> CanonicalMap:
+    """读取并编译一个或多个表：e621 的 tag_aliases / tag_implications 导出（按文件名区分），
+    两列 alias,canonical 的自定义别名表，或只有 tag 列的规范词表（data/tag_map.csv）"""
+    cmap = CanonicalMap()
+    for path in paths:
+        try:
+            _read_table(cmap, path)
+        except (UnicodeDecodeError, csv.Error) as exc:
+            raise CanonicalError(f"无法解析 {path.name}：{exc}") from exc
+        cmap.sources.append(path)
+    cmap.finalize()
+    return cmap
+
+
+_ACTIVE: Optional[CanonicalMap] = None
+_ACTIVE_LOCK = threading.Lock()
+
+
+def active_map() -> CanonicalMap:
+    """当前生效的规范化表；首次使用时加载 CANONICAL_TABLES 中存在的文件，读取失败时为空表"""
+    global _ACTIVE
+    with _ACTIVE_LOCK:
+        if _ACTIVE is None:
+            try:
+                _ACTIVE = load_tables(path for path in CANONICAL_TABLES if path.is_file())
+            except (OSError, CanonicalError):
+                _ACTIVE = CanonicalMap()
+        return _ACTIVE
+
+
+def set_active_map(cmap: CanonicalMap) -> None:
+    global _ACTIVE
+    with _ACTIVE_LOCK:
+        _ACTIVE = cmap
+
+
+def canonical_reader(
+    reader: Callable[[FileRecord], List[str]],
+    cmap: Optional[CanonicalMap] = None,
+    implications: bool = False,
+) -> Callable[[FileRecord], List[str]]:
+    """包装读取函数，返回规范化后的标签视图；只影响读取结果，不修改标签文件"""
+
+    def read(record: FileRecord) -> List[str]:
+        table = cmap if cmap is not None else active_map()
+        tags = reader(record)
+        return table.apply(tags, implications)[0] if table else tags
+
+    return read
@@ -0,0 +1,268 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .backup import dataset_root
+from .config import CHANGES_FILENAME, INDEX_DIRNAME
+
+# 变更类型：tags 为写入后的完整标签；lock 记录锁定状态；delete/rename 来自删除并重排
+TAGS = "tags"
+LOCK = "lock"
+DELETE = "delete"
+RENAME = "rename"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    created REAL NOT NULL,
+    kind TEXT NOT NULL,
+    path TEXT NOT NULL,
+    tags TEXT,
+    locked INTEGER,
+    target TEXT
+);
+"""
+
+
+class ChangeLogError(OSError):
+    """变更日志无法读取"""
+
+
+@dataclass
+class Change:
+    seq: int
+    created: float
+    kind: str
+    path: str
+    tags: Optional[List[str]] = None
+    locked: Optional[bool] = None
+    target: Optional[str] = None
+
+    def row(self, tag_suffix: Optional[str] = None) -> Dict:
+        """导出用的一行；给定标签后缀时为标签文件附带与导出、导入一致的记录名"""
+        row = {"seq": self.seq, "time": self.created, "kind": self.kind, "path": self.path}
+        if tag_suffix and self.path.endswith(tag_suffix):
+            row["name"] = self.path[: -len(tag_suffix)]
+        if self.tags is not None:
+            row["tags"] = self.tags
+        if self.locked is not None:
+            row["locked"] = self.locked
+        if self.target is not None:
+            row["target"] = self.target
+            if tag_suffix and self.target.endswith(tag_suffix):
+                row["target_name"] = self.target[: -len(tag_suffix)]
+        return row
+
+
+@dataclass
+class ChangesResult:
+    exported: int = 0
+    since: int = 0
+    head: int = 0
+
+
+class ChangeJournal:
+    """数据集级别的只追加变更日志：每次标签写入、锁定变化与重排都追加一条带递增序号的记录。
+
+    保存在 <数据集>/.tagger/changes.sqlite3 中；序号由 SQLite 的 AUTOINCREMENT 分配，
+    不会回退或复用，多个进程同时追加时由数据库锁串行化。追加先在事务中暂存，flush() 后才对其他进程可见。
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.path = root / INDEX_DIRNAME / CHANGES_FILENAME
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._dirty = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+            conn.executescript(_SCHEMA)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def key(self, path: Path) -> str:
+        try:
+            return path.relative_to(self.root).as_posix()
+        except ValueError:
+            return path.as_posix()
+
+    def append(
+        self,
+        kind: str,
+        path: Path,
+        tags: Optional[Iterable[str]] = None,
+        locked: Optional[bool] = None,
+        target: Optional[Path] = None,
+    ) -> None:
+        self.append_many([(kind, path, tags, locked, target)])
+
+    def append_many(
+        self,
+        entries: Iterable[Tuple[str, Path, Optional[Iterable[str]], Optional[bool], Optional[Path]]],
+    ) -> None:
+        now = time.time()
+        rows = [
+            (
+                now,
+                kind,
+                self.key(path),
+                None if tags is None else ", ".join(tags),
+                None if locked is None else int(locked),
+                None if target is None else self.key(target),
+            )
+            for kind, path, tags, locked, target in entries
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._connect().executemany(
+                "INSERT INTO changes (created, kind, path, tags, locked, target) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._dirty = True
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._dirty and self._conn is not None:
+                self._conn.commit()
+                self._dirty = False
+
+    def head(self) -> int:
+        """当前最大序号；日志为空时为 0"""
+        with self._lock:
+            row = self._connect().execute("SELECT MAX(seq) FROM changes").fetchone()
+        return row[0] or 0
+
+    def since(self, seq: int = 0, batch: int = 4096) -> Iterator[Change]:
+        """按序号顺序逐批产出序号大于 seq 的变更，不会一次把整个日志读入内存"""
+        while True:
+            with self._lock:
+                rows = self._connect().execute(
+                    "SELECT seq, created, kind, path, tags, locked, target FROM changes "
+                    "WHERE seq > ? ORDER BY seq LIMIT ?",
+                    (seq, batch),
+                ).fetchall()
+            for row in rows:
+                tags = None if row[4] is None else [tag for tag in row[4].split(", ") if tag]
+                locked = None if row[5] is None else bool(row[5])
+                yield Change(row[0], row[1], row[2], row[3], tags, locked, row[6])
+            if len(rows) < batch:
+                return
+            seq = rows[-1][0]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self.flush()
+                self._conn.close()
+                self._conn = None
+
+
+_JOURNALS: Dict[Path, ChangeJournal] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def journal_for_folder(folder: Path) -> ChangeJournal:
+    """目录所属数据集的变更日志，与备份库使用同一个数据集根目录"""
+    root = dataset_root(folder)
+    with _REGISTRY_LOCK:
+        journal = _JOURNALS.get(root)
+        if journal is None:
+            journal = _JOURNALS[root] = ChangeJournal(root)
+        return journal
+
+
+def close_journals() -> None:
+    with _REGISTRY_LOCK:
+        journals = list(_JOURNALS.values())
+        _JOURNALS.clear()
+    for journal in journals:
+        journal.close()
+
+
+def log_changes(
+    folder: Path,
+    entries: Sequence[Tuple[str, Path, Optional[Iterable[str]], Optional[bool], Optional[Path]]],
+) -> None:
+    """追加并立即提交一组变更；与备份一样，日志失败不影响已完成的文件操作"""
+    if not entries:
+        return
+    try:
+        journal = journal_for_folder(folder)
+        journal.append_many(entries)
+        journal.flush()
+    except sqlite3.Error:
+        pass
+
+
+def compact(changes: Iterable[Change]) -> List[Change]:
+    """去掉被同一文件后续同类变更覆盖的记录，只保留下游同步需要的最新状态。
+
+    删除与改名会改变路径的含义，不跨越它们合并，保证按序号重放的结果与完整日志一致。
+    """
+    kept: List[Change] = []
+    seen = set()
+    for change in reversed(list(changes)):
+        if change.kind in (TAGS, LOCK):
+            key = (change.kind, change.path)
+            if key in seen:
+                continue
+            seen.add(key)
+        else:
+            for path in (change.path, change.target):
+                seen.discard((TAGS, path))
+                seen.discard((LOCK, path))
+        kept.append(change)
+    kept.reverse()
+    return kept
+
+
+def export_changes(
+    folder: Path,
+    target: Path,
+    since: int = 0,
+    tag_suffix: Optional[str] = None,
+    compacted: bool = True,
+) -> ChangesResult:
+    """把序号大于 since 的变更导出为 JSONL，每行一条，按序号排列。
+
+    返回的 head 是导出时的最大序号，下游保存它并在下次同步时作为 since 传入即可增量获取。
+    """
+    journal = journal_for_folder(folder)
+    result = ChangesResult(since=since)
+    temp = target.with_name(f".{target.name}.tmp")
+    try:
+        result.head = journal.head()
+        changes: Iterable[Change] = (change for change in journal.since(since) if change.seq <= result.head)
+        if compacted:
+            changes = compact(changes)
+        with open(temp, "w", encoding="utf-8") as fp:
+            for change in changes:
+                fp.write(json.dumps(change.row(tag_suffix), ensure_ascii=False) + "\n")
+                result.exported += 1
+        os.replace(temp, target)
+    except sqlite3.Error as exc:
+        _remove_quietly(temp)
+        raise ChangeLogError(f"无法读取变更日志：{exc}") from exc
+    except BaseException:
+        _remove_quietly(temp)
+        raise
+    return result
+
+
+def _remove_quietly(path: Path) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
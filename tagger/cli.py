@@ -0,0 +1,379 @@
+from __future__ import annotations
+
+import argparse
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from .backup import close_stores, migrate_bak_files, store_for
+from .bulk import BulkEngine
+from .canonical import CanonicalError, active_map, canonical_reader, load_tables
+from .changelog import close_journals, export_changes
+from .config import ARCHIVE_SUFFIX, BULK_WORKERS, DEFAULT_TAG_SUFFIX, DISCOVERY_WORKERS
+from .dto import FileRecord, PackStats
+from .export import FORMATS, LINK_MODES, export_images, export_records
+from .fileops import pack_dataset, read_tags, scan_records, scan_tree, unpack_archive
+from .fuzzy import DEFAULT_SIMILARITY, find_clusters, merge_map, merge_transform
+from .importer import TagImportError, import_tags, write_import_report
+from .index import DirectoryIndex
+from .query import QueryError, run_query
+from .rules import RuleError, load_rules
+from .stats import collect_stats, write_stats_csv
+from .tagindex import TagIndex
+
+
+def _print_stats(action: str, target: Path, stats: PackStats) -> None:
+    print(
+        f"{action} {stats.records} 条记录（图片 {stats.images}，锁定 {stats.locked}），"
+        f"{stats.bytes / 1_048_576:.1f} MB，用时 {stats.seconds:.2f} s → {target}"
+    )
+
+
+def _pack(args: argparse.Namespace) -> int:
+    folder = Path(args.folder)
+    target = Path(args.output) if args.output else folder.with_name(folder.name + ARCHIVE_SUFFIX)
+    stats = pack_dataset(
+        folder,
+        target,
+        tag_suffix=args.suffix,
+        recursive=args.recursive,
+        embed_images=not args.no_images,
+    )
+    _print_stats("已打包", target, stats)
+    return 0
+
+
+def _unpack(args: argparse.Namespace) -> int:
+    archive = Path(args.archive)
+    target = Path(args.output) if args.output else archive.with_suffix("")
+    stats = unpack_archive(archive, target)
+    _print_stats("已解包", target, stats)
+    return 0
+
+
+def _load_records(args: argparse.Namespace) -> List[FileRecord]:
+    folder = Path(args.folder)
+    if args.recursive:
+        return scan_tree(folder, args.suffix)[0]
+    return scan_records(folder, args.suffix)[0]
+
+
+def _apply_rules(args: argparse.Namespace) -> int:
+    ruleset = load_rules(Path(args.rules))
+    include_locked = ruleset.include_locked or args.include_locked
+    records = _load_records(args)
+    for line in ruleset.describe():
+        print(line)
+    result = BulkEngine().run(records, ruleset.compile(), include_locked)
+    print(
+        f"修改 {len(result.changes)} / 无需修改 {result.unchanged} / 锁定跳过 {len(result.locked_skipped)} / "
+        f"失败 {len(result.failures)}，用时 {result.seconds:.2f} s"
+    )
+    for failure in result.failures:
+        print(failure, file=sys.stderr)
+    return 1 if result.failures else 0
+
+
+def _query(args: argparse.Namespace) -> int:
+    records = _load_records(args)
+    index = TagIndex()
+    index.build(records, lambda record: read_tags(record.tag_path))
+    result = run_query(args.expression, index, records)
+    if not args.count:
+        for record in result.records:
+            print(record.tag_path if args.paths else record.base_name)
+    print(
+        f"命中 {result.count} / {len(records)} 个文件（建立索引 {index.build_seconds:.2f} s，"
+        f"查询 {result.seconds * 1000:.1f} ms）",
+        file=sys.stderr,
+    )
+    return 0
+
+
+def _stats(args: argparse.Namespace) -> int:
+    records = _load_records(args)
+    index = TagIndex()
+    index.build(records, lambda record: read_tags(record.tag_path))
+    stats = collect_stats(index)
+    if args.csv:
+        write_stats_csv(stats, Path(args.csv))
+        print(f"统计已导出到 {args.csv}")
+        return 0
+    print(
+        f"文件 {stats.records} 个（锁定 {stats.locked} / 未锁定 {stats.unlocked}），"
+        f"不同标签 {stats.unique_tags} 个，平均每文件 {stats.mean_tags:.1f} 个"
+    )
+    for tag, count in stats.doc_freq[: args.top]:
+        print(f"{count:>8}  {tag}")
+    return 0
+
+
+def _similarity(text: str) -> float:
+    value = float(text)
+    if not 0.0 < value <= 1.0:
+        raise argparse.ArgumentTypeError(f"相似度必须在 (0, 1] 之间：{text}")
+    return value
+
+
+def _fuzzy(args: argparse.Namespace) -> int:
+    records = _load_records(args)
+
+    def reader(record: FileRecord) -> List[str]:
+        return read_tags(record.tag_path)
+
+    index = TagIndex()
+    index.build(records, reader)
+    clusters = find_clusters(index.spelling_counts(), args.similarity, args.min_count)[: args.top]
+    for cluster in clusters:
+        others = ", ".join(f"{tag} ({count})" for tag, count in cluster.members if tag != cluster.target)
+        print(f"{cluster.total:>8}  {cluster.target}  ←  {others}")
+    print(f"找到 {len(clusters)} 组近似标签", file=sys.stderr)
+    if not args.apply or not clusters:
+        return 0
+    merges = merge_map(clusters)
+    result = BulkEngine().run(index.select_keys(records, merges), merge_transform(merges), args.include_locked)
+    print(
+        f"修改 {len(result.changes)} / 锁定跳过 {len(result.locked_skipped)} / "
+        f"失败 {len(result.failures)}，用时 {result.seconds:.2f} s"
+    )
+    for failure in result.failures:
+        print(failure, file=sys.stderr)
+    return 1 if result.failures else 0
+
+
+def _export(args: argparse.Namespace) -> int:
+    records = _load_records(args)
+    if args.locked_only:
+        records = [record for record in records if record.locked]
+    target = Path(args.output)
+    interactive = sys.stderr.isatty()
+
+    def report(done: int, total: int) -> None:
+        if interactive and (done == total or done % 1000 == 0):
+            print(f"\r导出 {done}/{total}", end="", file=sys.stderr, flush=True)
+
+    reader = lambda record: read_tags(record.tag_path)
+    if args.canonical is not None:
+        cmap = load_tables(Path(path) for path in args.canonical) if args.canonical else active_map()
+        reader = canonical_reader(reader, cmap, args.implications)
+    result = export_records(records, target, args.format, reader, progress=report, max_workers=args.workers)
+    if interactive and records:
+        print(file=sys.stderr)
+    print(
+        f"已导出 {result.exported} 条记录，{result.bytes / 1_048_576:.1f} MB，"
+        f"用时 {result.seconds:.2f} s（{result.records_per_second:.0f} 条/秒） → {target}"
+    )
+    for failure in result.failures:
+        print(failure, file=sys.stderr)
+    return 1 if result.failures else 0
+
+
+def _export_images(args: argparse.Namespace) -> int:
+    records = _load_records(args)
+    target = Path(args.output)
+    result = export_images(records, target, args.mode, incremental=not args.full, max_workers=args.workers)
+    print(
+        f"导出 {result.exported} / 跳过 {result.skipped} / 缺失 {result.missing} / 失败 {len(result.failures)}，"
+        f"复制 {result.bytes_copied / 1_048_576:.1f} MB，链接 {result.bytes_linked / 1_048_576:.1f} MB，"
+        f"改为复制 {result.fallbacks}，用时 {result.seconds:.2f} s → {target}"
+    )
+    for failure in result.failures:
+        print(failure, file=sys.stderr)
+    return 1 if result.failures else 0
+
+
+def _import(args: argparse.Namespace) -> int:
+    folder = Path(args.folder)
+    index = DirectoryIndex(folder)
+    try:
+        if args.recursive:
+            records = scan_tree(folder, args.suffix, index=index)[0]
+        else:
+            records = scan_records(folder, args.suffix, index=index)[0]
+        result = import_tags(Path(args.source), records, index.tags_for, args.include_locked)
+        for change in result.bulk.changes:
+            index.store_tags(change.record, change.tags)
+    finally:
+        index.close()
+    bulk = result.bulk
+    print(
+        f"读取 {result.rows} 条：修改 {len(bulk.changes)} / 无需修改 {bulk.unchanged} / "
+        f"锁定跳过 {len(bulk.locked_skipped)} / 未找到 {result.unknown} / 失败 {len(bulk.failures)}，"
+        f"用时 {bulk.seconds:.2f} s"
+    )
+    if args.report:
+        write_import_report(result, Path(args.report))
+        print(f"变更报告已保存到 {args.report}")
+    for failure in bulk.failures:
+        print(failure, file=sys.stderr)
+    return 1 if bulk.failures else 0
+
+
+def _timestamp(text: str) -> float:
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(f"无效的时间：{text}") from exc
+
+
+def _restore(args: argparse.Namespace) -> int:
+    folder = Path(args.folder)
+    try:
+        if args.migrate_bak:
+            print(f"已迁移 {migrate_bak_files(folder, args.suffix, args.recursive)} 个 .bak 文件")
+        records = _load_records(args)
+        before = args.before
+
+        def restore(record: FileRecord, tags: List[str]) -> Tuple[List[str], List[str]]:
+            store = store_for(record.tag_path)
+            found = store.initial(record.tag_path) if before is None else store.before(record.tag_path, before)
+            return (tags, []) if found is None else (found, [])
+
+        result = BulkEngine().run_each(records, restore, args.include_locked)
+    finally:
+        close_stores()
+    print(
+        f"恢复 {len(result.changes)} / 无需恢复 {result.unchanged} / 锁定跳过 {len(result.locked_skipped)} / "
+        f"失败 {len(result.failures)}，用时 {result.seconds:.2f} s"
+    )
+    for failure in result.failures:
+        print(failure, file=sys.stderr)
+    return 1 if result.failures else 0
+
+
+def _changes(args: argparse.Namespace) -> int:
+    try:
+        result = export_changes(
+            Path(args.folder), Path(args.output), args.since, args.suffix, compacted=not args.all
+        )
+    finally:
+        close_journals()
+    print(f"导出序号 {result.since} 之后的 {result.exported} 条变更 → {args.output}，当前最新序号 {result.head}")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m tagger.cli", description="标签数据集命令行工具")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    pack = commands.add_parser("pack", help="把数据集目录打包为单个归档文件")
+    pack.add_argument("folder", help="数据集目录")
+    pack.add_argument("-o", "--output", help=f"输出文件，默认为 <目录名>{ARCHIVE_SUFFIX}")
+    pack.add_argument("--suffix", default=DEFAULT_TAG_SUFFIX, help="标签文件后缀")
+    pack.add_argument("-r", "--recursive", action="store_true", help="包含子目录（分片数据集）")
+    pack.add_argument("--no-images", action="store_true", help="不嵌入图片，只记录相对路径")
+    pack.set_defaults(handler=_pack)
+
+    unpack = commands.add_parser("unpack", help="把归档文件还原为目录")
+    unpack.add_argument("archive", help="归档文件")
+    unpack.add_argument("-o", "--output", help="输出目录，默认为去掉扩展名的同名目录")
+    unpack.set_defaults(handler=_unpack)
+
+    rules = commands.add_parser("rules", help="按规则文件单次遍历处理数据集")
+    rules.add_argument("folder", help="数据集目录")
+    rules.add_argument("rules", help="JSON 规则文件")
+    rules.add_argument("--suffix", default=DEFAULT_TAG_SUFFIX, help="标签文件后缀")
+    rules.add_argument("-r", "--recursive", action="store_true", help="包含子目录（分片数据集）")
+    rules.add_argument("--include-locked", action="store_true", help="同时处理已锁定的文件")
+    rules.set_defaults(handler=_apply_rules)
+
+    query = commands.add_parser("query", help="按布尔表达式查询数据集，例如 \"wings horns -solo is:unlocked\"")
+    query.add_argument("folder", help="数据集目录")
+    query.add_argument("expression", help="查询表达式：AND/OR/NOT、括号、前缀 wing*、is:locked、tags>20")
+    query.add_argument("--suffix", default=DEFAULT_TAG_SUFFIX, help="标签文件后缀")
+    query.add_argument("-r", "--recursive", action="store_true", help="包含子目录（分片数据集）")
+    query.add_argument("--count", action="store_true", help="只输出命中数量")
+    query.add_argument("--paths", action="store_true", help="输出标签文件路径而不是记录名")
+    query.set_defaults(handler=_query)
+
+    stats = commands.add_parser("stats", help="统计标签频次、每文件标签数与锁定状态")
+    stats.add_argument("folder", help="数据集目录")
+    stats.add_argument("--suffix", default=DEFAULT_TAG_SUFFIX, help="标签文件后缀")
+    stats.add_argument("-r", "--recursive", action="store_true", help="包含子目录（分片数据集）")
+    stats.add_argument("--top", type=int, default=30, help="输出出现最多的前 N 个标签")
+    stats.add_argument("--csv", help="导出为 CSV 文件")
+    stats.set_defaults(handler=_stats)
+
+    fuzzy = commands.add_parser("fuzzy", help="查找拼写相近的标签（如 colour / color、blue_fur / bluefur），可批量合并")
+    fuzzy.add_argument("folder", help="数据集目录")
+    fuzzy.add_argument("--suffix", default=DEFAULT_TAG_SUFFIX, help="标签文件后缀")
+    fuzzy.add_argument("-r", "--recursive", action="store_true", help="包含子目录（分片数据集）")
+    fuzzy.add_argument(
+        "--similarity",
+        type=_similarity,
+        default=DEFAULT_SIMILARITY,
+        help="相似度下限：编辑距离不超过 (1 - 相似度) × 较长标签长度；wolfs / wolves 这类短标签的不规则复数需要 0.66",
+    )
+    fuzzy.add_argument("--min-count", type=int, default=1, help="忽略出现次数少于该值的标签")
+    fuzzy.add_argument("--top", type=int, default=50, help="输出出现次数最多的前 N 组")
+    fuzzy.add_argument("--apply", action="store_true", help="把列出的各组合并到出现最多的写法")
+    fuzzy.add_argument("--include-locked", action="store_true", help="合并时同时修改已锁定的文件")
+    fuzzy.set_defaults(handler=_fuzzy)
+
+    export = commands.add_parser("export", help="流式导出标签为 JSON / JSONL / Parquet 或 TXT 目录")
+    export.add_argument("folder", help="数据集目录")
+    export.add_argument("output", help="输出文件（按扩展名推断格式）或 TXT 导出目录")
+    export.add_argument("-f", "--format", choices=FORMATS, help="导出格式，默认按输出扩展名推断")
+    export.add_argument("--suffix", default=DEFAULT_TAG_SUFFIX, help="标签文件后缀")
+    export.add_argument("-r", "--recursive", action="store_true", help="包含子目录（分片数据集）")
+    export.add_argument("--locked-only", action="store_true", help="只导出已锁定的文件")
+    export.add_argument("--workers", type=int, default=BULK_WORKERS, help="并行读取的线程数")
+    export.add_argument(
+        "--canonical",
+        nargs="*",
+        metavar="TABLE",
+        help="导出前按别名表规范化（不修改标签文件）；不给出文件时使用 data/ 下的默认表",
+    )
+    export.add_argument("--implications", action="store_true", help="与 --canonical 一起使用，补充蕴含的标签")
+    export.set_defaults(handler=_export)
+
+    images = commands.add_parser("export-images", help="并行导出图片，可使用链接并跳过已是最新的文件")
+    images.add_argument("folder", help="数据集目录")
+    images.add_argument("output", help="输出目录")
+    images.add_argument("-m", "--mode", choices=LINK_MODES, default="copy", help="复制、克隆、硬链接或符号链接")
+    images.add_argument("--full", action="store_true", help="不做增量判断，全部重新导出")
+    images.add_argument("--suffix", default=DEFAULT_TAG_SUFFIX, help="标签文件后缀")
+    images.add_argument("-r", "--recursive", action="store_true", help="包含子目录（分片数据集）")
+    images.add_argument("--workers", type=int, default=DISCOVERY_WORKERS, help="并行线程数")
+    images.set_defaults(handler=_export_images)
+
+    imports = commands.add_parser("import", help="把 JSON / JSONL / Parquet 中的标签写回标签文件，只写入有变化的文件")
+    imports.add_argument("folder", help="数据集目录")
+    imports.add_argument("source", help="导入文件（name + tags/text，或 {记录名: 标签} 映射）")
+    imports.add_argument("--suffix", default=DEFAULT_TAG_SUFFIX, help="标签文件后缀")
+    imports.add_argument("-r", "--recursive", action="store_true", help="包含子目录（分片数据集）")
+    imports.add_argument("--include-locked", action="store_true", help="同时写入已锁定的文件")
+    imports.add_argument("--report", help="保存变更报告")
+    imports.set_defaults(handler=_import)
+
+    restore = commands.add_parser("restore", help="从备份库批量恢复标签文件")
+    restore.add_argument("folder", help="数据集目录")
+    restore.add_argument("--before", type=_timestamp, help="恢复到该时间之前的版本（ISO 格式，如 2026-10-17T12:00），默认恢复最早的版本")
+    restore.add_argument("--suffix", default=DEFAULT_TAG_SUFFIX, help="标签文件后缀")
+    restore.add_argument("-r", "--recursive", action="store_true", help="包含子目录（分片数据集）")
+    restore.add_argument("--include-locked", action="store_true", help="同时恢复已锁定的文件")
+    restore.add_argument("--migrate-bak", action="store_true", help="先把旧的 .bak 文件导入备份库")
+    restore.set_defaults(handler=_restore)
+
+    changes = commands.add_parser("changes", help="导出指定序号之后的变更日志（JSONL），用于下游增量同步")
+    changes.add_argument("folder", help="数据集目录")
+    changes.add_argument("output", help="输出的 JSONL 文件")
+    changes.add_argument("--since", type=int, default=0, help="上次同步得到的最新序号，默认导出全部")
+    changes.add_argument("--all", action="store_true", help="保留被后续变更覆盖的记录，不做合并")
+    changes.add_argument("--suffix", default=DEFAULT_TAG_SUFFIX, help="标签文件后缀，用于生成记录名")
+    changes.set_defaults(handler=_changes)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        return args.handler(args)
+    except (OSError, QueryError, RuleError, TagImportError, CanonicalError) as exc:
+        print(f"操作失败：{exc}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import json
+import os
 from pathlib import Path
 from typing import Dict
 
@@ -8,8 +9,35 @@ IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".bmp"}
 DEFAULT_TAG_SUFFIX = ".final.txt"
 DEFAULT_DIRECTORY = Path("data/poren")
 DICTIONARY_PATH = Path("data/local_dictionary.json")
+TRANSLATION_CACHE_PATH = Path("data/translation_cache.sqlite3")
+# 新译文累计到该数量时写回翻译缓存
+TRANSLATION_CACHE_FLUSH = 64
+# 存在时自动加载的别名 / 蕴含表与规范词表
+CANONICAL_TABLES = (
+    Path("data/tag_aliases.csv"),
+    Path("data/tag_implications.csv"),
+    Path("data/tag_map.csv"),
+)
 LIBRE_TRANSLATE_ENDPOINT = "https://libretranslate.de/translate"
+GOOGLE_TRANSLATE_ENDPOINT = "https://translate.googleapis.com/translate_a/single"
+# 单个请求的 (连接, 读取) 超时；一次批量翻译的总时限，超时未返回的文本交给下一个翻译器
+TRANSLATION_TIMEOUT = (3.05, 8)
+TRANSLATION_DEADLINE = 10.0
+# Google 打包请求中 q 参数经 URL 编码后的长度上限，保持在常见的 URL 长度限制以内
+GOOGLE_PACK_BYTES = 4000
 LOCK_SUFFIX = ".lock"
+LOCK_MANIFEST_NAME = ".locks"
+INDEX_DIRNAME = ".tagger"
+INDEX_FILENAME = "index.sqlite3"
+BACKUP_FILENAME = "backups.sqlite3"
+CHANGES_FILENAME = "changes.sqlite3"
+DISCOVERY_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+WRITE_GROUP_SIZE = 128
+BULK_WORKERS = min(16, (os.cpu_count() or 1) * 2)
+TAG_CACHE_BYTES = 64 * 1024 * 1024
+NORMALIZER_CACHE_SIZE = 1 << 18
+ARCHIVE_SUFFIX = ".tagpack"
+RENUMBER_JOURNAL_NAME = ".renumber.journal"
 
 
 def ensure_dictionary_file(path: Path = DICTIONARY_PATH) -> Dict[str, str]:
@@ -18,3 +18,30 @@ class TagEntry:
     entry_id: int
     english: str
     chinese: str
+
+
+@dataclass
+class DiscoveryStats:
+    folders: int = 0
+    entries: int = 0
+    images: int = 0
+    tag_files: int = 0
+    lock_files: int = 0
+    records: int = 0
+    scan_seconds: float = 0.0
+    pair_seconds: float = 0.0
+    errors: int = 0
+    from_index: bool = False
+
+    @property
+    def total_seconds(self) -> float:
+        return self.scan_seconds + self.pair_seconds
+
+
+@dataclass
+class PackStats:
+    records: int = 0
+    images: int = 0
+    locked: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
@@ -0,0 +1,451 @@
+from __future__ import annotations
+
+import errno
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path, PurePosixPath
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .bulk import CHUNK_SIZE, ProgressCallback, Reader
+from .config import BULK_WORKERS, DISCOVERY_WORKERS
+from .dto import FileRecord
+from .fileops import read_tags
+
+FORMATS = ("json", "jsonl", "parquet", "txt")
+LINK_MODES = ("copy", "reflink", "hardlink", "symlink")
+PARQUET_ROW_GROUP = 8192
+
+_SUFFIX_FORMATS = {".json": "json", ".jsonl": "jsonl", ".parquet": "parquet"}
+
+
+class ExportError(OSError):
+    """导出格式无效或所需依赖不可用"""
+
+
+@dataclass
+class ExportResult:
+    total: int = 0
+    exported: int = 0
+    failures: List[str] = field(default_factory=list)
+    bytes: int = 0
+    cancelled: bool = False
+    seconds: float = 0.0
+
+    @property
+    def records_per_second(self) -> float:
+        return self.exported / self.seconds if self.seconds else 0.0
+
+
+@dataclass
+class ImageExportResult:
+    total: int = 0
+    exported: int = 0
+    skipped: int = 0
+    missing: int = 0
+    fallbacks: int = 0
+    bytes_copied: int = 0
+    bytes_linked: int = 0
+    failures: List[str] = field(default_factory=list)
+    cancelled: bool = False
+    seconds: float = 0.0
+
+    @property
+    def megabytes_per_second(self) -> float:
+        return self.bytes_copied / 1_048_576 / self.seconds if self.seconds else 0.0
+
+
+def format_for_path(path: Path) -> str:
+    """按扩展名推断导出格式，没有扩展名的路径视为 TXT 导出目录"""
+    if not path.suffix:
+        return "txt"
+    fmt = _SUFFIX_FORMATS.get(path.suffix.lower())
+    if fmt is None:
+        raise ExportError(f"无法识别的导出格式：{path.suffix}（可用：{', '.join(FORMATS)}）")
+    return fmt
+
+
+def image_ref(record: FileRecord) -> Optional[str]:
+    """图片相对数据集根目录的路径，与 base_name 的目录部分一致"""
+    if record.image_path is None:
+        return None
+    return (PurePosixPath(record.base_name).parent / record.image_path.name).as_posix()
+
+
+def iter_record_tags(
+    records: Sequence[FileRecord],
+    reader: Reader,
+    max_workers: int = BULK_WORKERS,
+    cancel: Optional[threading.Event] = None,
+) -> Iterator[Tuple[FileRecord, Optional[List[str]], Optional[str]]]:
+    """并行读取标签并按 records 的顺序逐条产出 (记录, 标签, 错误)。
+
+    同时在途的分块数量有上限，内存占用与数据集大小无关。
+    """
+    max_workers = max(1, max_workers)
+
+    def load(chunk: Sequence[FileRecord]) -> List[Tuple[FileRecord, Optional[List[str]], Optional[str]]]:
+        loaded = []
+        for record in chunk:
+            try:
+                loaded.append((record, reader(record), None))
+            except OSError as exc:
+                loaded.append((record, None, f"{record.base_name}: 读取失败（{exc}）"))
+        return loaded
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending: deque = deque()
+        for start in range(0, len(records), CHUNK_SIZE):
+            if cancel is not None and cancel.is_set():
+                break
+            pending.append(pool.submit(load, records[start : start + CHUNK_SIZE]))
+            if len(pending) >= max_workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+class _FileWriter:
+    """写入同目录下的临时文件，成功结束后原子替换目标；取消或失败时删除临时文件"""
+
+    per_record = False
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.temp = path.with_name(f".{path.name}.tmp")
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+    def finish(self) -> int:
+        os.replace(self.temp, self.path)
+        return self.path.stat().st_size
+
+    def abort(self) -> None:
+        try:
+            os.unlink(self.temp)
+        except OSError:
+            pass
+
+
+class _JsonWriter(_FileWriter):
+    """{记录名: [标签, ...]} 映射，与旧版导出格式兼容；每条记录一行，不再整体缩进"""
+
+    def __init__(self, path: Path) -> None:
+        super().__init__(path)
+        self._fp = open(self.temp, "w", encoding="utf-8")
+        self._fp.write("{")
+        self._first = True
+
+    def write(self, record: FileRecord, tags: List[str]) -> None:
+        separator = "\n" if self._first else ",\n"
+        self._first = False
+        self._fp.write(f"{separator}{json.dumps(record.base_name, ensure_ascii=False)}: ")
+        self._fp.write(json.dumps(tags, ensure_ascii=False))
+
+    def finish(self) -> int:
+        self._fp.write("\n}\n")
+        self._fp.close()
+        return super().finish()
+
+    def abort(self) -> None:
+        self._fp.close()
+        super().abort()
+
+
+class _JsonlWriter(_FileWriter):
+    def __init__(self, path: Path) -> None:
+        super().__init__(path)
+        self._fp = open(self.temp, "w", encoding="utf-8")
+
+    def write(self, record: FileRecord, tags: List[str]) -> None:
+        row = {"name": record.base_name, "image": image_ref(record), "tags": tags, "locked": record.locked}
+        self._fp.write(json.dumps(row, ensure_ascii=False))
+        self._fp.write("\n")
+
+    def finish(self) -> int:
+        self._fp.close()
+        return super().finish()
+
+    def abort(self) -> None:
+        self._fp.close()
+        super().abort()
+
+
+class _ParquetWriter(_FileWriter):
+    """训练用的 Parquet：file_name 为图片相对路径，text 为逗号分隔的标注，另存标签列表与锁定状态。
+
+    按行组分批写出，内存中最多保留一个行组。
+    """
+
+    def __init__(self, path: Path) -> None:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise ExportError("导出 Parquet 需要安装 pyarrow") from exc
+        super().__init__(path)
+        self._pa = pa
+        self._schema = pa.schema(
+            [
+                ("name", pa.string()),
+                ("file_name", pa.string()),
+                ("text", pa.string()),
+                ("tags", pa.list_(pa.string())),
+                ("locked", pa.bool_()),
+            ]
+        )
+        self._writer = pq.ParquetWriter(str(self.temp), self._schema, compression="zstd")
+        self._columns: Dict[str, list] = {name: [] for name in self._schema.names}
+
+    def write(self, record: FileRecord, tags: List[str]) -> None:
+        columns = self._columns
+        columns["name"].append(record.base_name)
+        columns["file_name"].append(image_ref(record))
+        columns["text"].append(", ".join(tags))
+        columns["tags"].append(tags)
+        columns["locked"].append(record.locked)
+        if len(columns["name"]) >= PARQUET_ROW_GROUP:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._columns["name"]:
+            return
+        self._writer.write_table(self._pa.Table.from_pydict(self._columns, schema=self._schema))
+        self._columns = {name: [] for name in self._schema.names}
+
+    def finish(self) -> int:
+        self._flush()
+        self._writer.close()
+        return super().finish()
+
+    def abort(self) -> None:
+        self._writer.close()
+        super().abort()
+
+
+class _TxtWriter:
+    """每条记录一个 <记录名>.txt，内容为逗号分隔的标签；单个文件写入失败不影响其余记录"""
+
+    per_record = True
+
+    def __init__(self, folder: Path) -> None:
+        self.folder = folder
+        self.bytes = 0
+        folder.mkdir(parents=True, exist_ok=True)
+
+    def write(self, record: FileRecord, tags: List[str]) -> None:
+        target = self.folder / f"{record.base_name}.txt"
+        target.parent.mkdir(parents=True, exist_ok=True)
+        data = ", ".join(tags).encode("utf-8")
+        target.write_bytes(data)
+        self.bytes += len(data)
+
+    def finish(self) -> int:
+        return self.bytes
+
+    def abort(self) -> None:
+        # 已写出的单个文件都是完整的，保留即可
+        pass
+
+
+def _open_writer(target: Path, fmt: str):
+    if fmt == "json":
+        return _JsonWriter(target)
+    if fmt == "jsonl":
+        return _JsonlWriter(target)
+    if fmt == "parquet":
+        return _ParquetWriter(target)
+    if fmt == "txt":
+        return _TxtWriter(target)
+    raise ExportError(f"不支持的导出格式 {fmt!r}（可用：{', '.join(FORMATS)}）")
+
+
+def export_records(
+    records: Sequence[FileRecord],
+    target: Path,
+    fmt: Optional[str] = None,
+    reader: Reader = lambda record: read_tags(record.tag_path),
+    overrides: Optional[Dict[str, List[str]]] = None,
+    progress: Optional[ProgressCallback] = None,
+    cancel: Optional[threading.Event] = None,
+    max_workers: int = BULK_WORKERS,
+) -> ExportResult:
+    """把记录的标签流式导出为 json / jsonl / parquet 文件或 txt 目录。
+
+    读取在线程池中并行进行，写入在调用线程中按记录顺序进行；overrides 中的标签
+    （例如界面上尚未保存的编辑）优先于文件内容。取消时不会留下不完整的导出文件。
+    """
+    started = time.perf_counter()
+    fmt = fmt or format_for_path(target)
+    overrides = overrides or {}
+    cancel = cancel or threading.Event()
+    result = ExportResult(total=len(records))
+    writer = _open_writer(target, fmt)
+
+    def read(record: FileRecord) -> List[str]:
+        tags = overrides.get(record.base_name)
+        return list(tags) if tags is not None else reader(record)
+
+    try:
+        for done, (record, tags, error) in enumerate(iter_record_tags(records, read, max_workers, cancel), 1):
+            if cancel.is_set():
+                break
+            if error is not None:
+                result.failures.append(error)
+            else:
+                try:
+                    writer.write(record, tags)
+                    result.exported += 1
+                except OSError as exc:
+                    if not writer.per_record:
+                        raise
+                    result.failures.append(f"{record.base_name}: 写入失败（{exc}）")
+            if progress is not None:
+                progress(done, result.total)
+    except BaseException:
+        writer.abort()
+        raise
+    result.cancelled = cancel.is_set()
+    if result.cancelled:
+        writer.abort()
+    else:
+        result.bytes = writer.finish()
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+# Linux 的 FICLONE ioctl：在 btrfs / XFS 等文件系统上共享数据块，写时复制
+_FICLONE = 0x40049409
+_LINK_UNSUPPORTED = {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.ENOSYS}
+
+
+def _reflink(source: Path, destination: Path) -> None:
+    if not sys.platform.startswith("linux"):
+        raise OSError(errno.EOPNOTSUPP, "当前系统不支持 reflink")
+    import fcntl
+
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.unlink(destination)
+            raise
+    shutil.copystat(source, destination)
+
+
+def _is_current(source: Path, stat: os.stat_result, destination: Path, mode: str) -> bool:
+    """目标已与源一致时跳过：链接指向同一文件，或大小与修改时间（秒级）相同"""
+    try:
+        target = os.stat(destination, follow_symlinks=False)
+    except OSError:
+        return False
+    if mode == "symlink":
+        return os.path.islink(destination) and os.path.realpath(destination) == os.path.realpath(source)
+    if mode == "hardlink" and (target.st_dev, target.st_ino) == (stat.st_dev, stat.st_ino):
+        return True
+    return (
+        not os.path.islink(destination)
+        and target.st_size == stat.st_size
+        and int(target.st_mtime) == int(stat.st_mtime)
+    )
+
+
+def _place_image(source: Path, destination: Path, mode: str, same_device: bool) -> Tuple[str, int]:
+    """把单个图片放到目标位置，返回 (实际使用的方式, 源文件大小)；先写临时名再原子替换"""
+    size = source.stat().st_size
+    temp = destination.with_name(f".{destination.name}.tmp")
+    used = mode
+    if mode == "symlink":
+        os.symlink(os.path.abspath(source), temp)
+    elif mode == "hardlink" and same_device:
+        os.link(source, temp)
+    elif mode == "reflink" and same_device:
+        try:
+            _reflink(source, temp)
+        except OSError as exc:
+            if exc.errno not in _LINK_UNSUPPORTED:
+                raise
+            used = "copy"
+    else:
+        used = "copy"
+    if used == "copy":
+        shutil.copy2(source, temp)
+    try:
+        os.replace(temp, destination)
+    except OSError:
+        os.unlink(temp)
+        raise
+    return used, size
+
+
+def export_images(
+    records: Sequence[FileRecord],
+    target: Path,
+    mode: str = "copy",
+    incremental: bool = True,
+    progress: Optional[ProgressCallback] = None,
+    cancel: Optional[threading.Event] = None,
+    max_workers: int = DISCOVERY_WORKERS,
+) -> ImageExportResult:
+    """并行导出图片为 <目标>/<记录名><扩展名>。
+
+    mode 为 copy / reflink / hardlink / symlink；reflink 与 hardlink 只在源与目标位于同一文件系统时
+    生效，否则（或文件系统不支持时）退回复制。incremental 时跳过大小与修改时间都已一致的目标。
+    """
+    if mode not in LINK_MODES:
+        raise ExportError(f"不支持的导出方式 {mode!r}（可用：{', '.join(LINK_MODES)}）")
+    started = time.perf_counter()
+    cancel = cancel or threading.Event()
+    images = [record for record in records if record.image_path is not None]
+    result = ImageExportResult(total=len(images))
+    target.mkdir(parents=True, exist_ok=True)
+    target_device = target.stat().st_dev
+    lock = threading.Lock()
+
+    def place(record: FileRecord) -> None:
+        if cancel.is_set():
+            return
+        source = record.image_path
+        destination = target / f"{record.base_name}{source.suffix}"
+        outcome = "missing"
+        size = 0
+        try:
+            stat = source.stat()
+            if incremental and _is_current(source, stat, destination, mode):
+                outcome = "skipped"
+            else:
+                destination.parent.mkdir(parents=True, exist_ok=True)
+                outcome, size = _place_image(source, destination, mode, stat.st_dev == target_device)
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            outcome = f"{source.name}: {exc}"
+        with lock:
+            if outcome == "missing":
+                result.missing += 1
+            elif outcome == "skipped":
+                result.skipped += 1
+            elif outcome in LINK_MODES:
+                result.exported += 1
+                if outcome == "copy":
+                    result.bytes_copied += size
+                    result.fallbacks += int(mode != "copy")
+                else:
+                    result.bytes_linked += size
+            else:
+                result.failures.append(outcome)
+            done = result.exported + result.skipped + result.missing + len(result.failures)
+        if progress is not None:
+            progress(done, result.total)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        list(pool.map(place, images))
+    result.cancelled = cancel.is_set()
+    result.seconds = time.perf_counter() - started
+    return result
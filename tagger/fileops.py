@@ -1,87 +1,447 @@
 from __future__ import annotations
 
+import os
 import shutil
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, Tuple
 
-from .config import IMAGE_EXTENSIONS, DEFAULT_TAG_SUFFIX, LOCK_SUFFIX
-from .dto import FileRecord
+from .archive import ArchiveError, ArchiveWriter, close_archive, find_member, open_archive
+from .changelog import LOCK, log_changes
+from .config import (
+    IMAGE_EXTENSIONS,
+    DEFAULT_TAG_SUFFIX,
+    DISCOVERY_WORKERS,
+    LOCK_MANIFEST_NAME,
+    LOCK_SUFFIX,
+)
+from .dto import DiscoveryStats, FileRecord, PackStats
+from .tagcache import tag_cache
+from .writer import TagWriteBatch
 
+if TYPE_CHECKING:
+    from .index import DirectoryIndex
+
+_MANIFEST_LOCK = threading.Lock()
+_MANIFESTS: Dict[Path, Tuple[Tuple[int, int], Set[str]]] = {}
+
+
+def discover_records(
+    folder: Path,
+    tag_suffix: str = DEFAULT_TAG_SUFFIX,
+    index: Optional["DirectoryIndex"] = None,
+) -> List[FileRecord]:
+    return scan_records(folder, tag_suffix, index)[0]
+
+
+def scan_records(
+    folder: Path,
+    tag_suffix: str = DEFAULT_TAG_SUFFIX,
+    index: Optional["DirectoryIndex"] = None,
+) -> Tuple[List[FileRecord], DiscoveryStats]:
+    records, stats, _ = scan_folder(folder, tag_suffix, index)
+    return records, stats
 
-def discover_records(folder: Path, tag_suffix: str = DEFAULT_TAG_SUFFIX) -> List[FileRecord]:
-    files: Dict[str, FileRecord] = {}
-    for entry in folder.iterdir():
-        if not entry.is_file():
-            continue
-        stem = entry.stem
-        suffix = entry.suffix.lower()
-        if suffix in IMAGE_EXTENSIONS:
-            record = files.get(stem)
-            if record:
-                record.image_path = entry
-            else:
-                lock_path = _lock_path(folder / f"{stem}{tag_suffix}")
-                locked = lock_path.exists()
-                files[stem] = FileRecord(stem, entry, folder / f"{stem}{tag_suffix}", locked)
-        elif entry.name.endswith(tag_suffix):
-            stem = entry.name[: -len(tag_suffix)]
-            record = files.get(stem)
-            image_path = record.image_path if record else _find_image(folder, stem)
-            lock_path = _lock_path(entry)
-            locked = lock_path.exists()
-            files[stem] = FileRecord(stem, image_path, entry, locked)
-    for stem, record in list(files.items()):
-        if not record.tag_path:
-            record.tag_path = folder / f"{stem}{tag_suffix}"
-        record.locked = _lock_path(record.tag_path).exists()
-    return sorted(files.values(), key=lambda rec: rec.base_name)
-
-
-def _find_image(folder: Path, stem: str) -> Optional[Path]:
-    for suffix in IMAGE_EXTENSIONS:
-        candidate = folder / f"{stem}{suffix}"
-        if candidate.exists():
-            return candidate
-    return None
+
+def scan_folder(
+    folder: Path,
+    tag_suffix: str = DEFAULT_TAG_SUFFIX,
+    index: Optional["DirectoryIndex"] = None,
+    root: Optional[Path] = None,
+) -> Tuple[List[FileRecord], DiscoveryStats, List[Path]]:
+    """扫描单个目录，返回记录、计数与子目录；给定 root 时 base_name 为相对 root 的路径"""
+    if index is not None:
+        return index.refresh_folder(folder, tag_suffix)
+    prefix = ""
+    if root is not None and folder != root:
+        prefix = folder.relative_to(root).as_posix() + "/"
+    stats = DiscoveryStats(folders=1)
+    started = time.perf_counter()
+    images: Dict[str, str] = {}
+    tag_stems: Set[str] = set()
+    lock_names: Set[str] = set()
+    has_manifest = False
+    subdirs: List[Path] = []
+    # 单次 scandir 收集名称集合，配对与锁定状态全部在内存中完成
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            stats.entries += 1
+            name = entry.name
+            if name.endswith(LOCK_SUFFIX):
+                lock_names.add(name[: -len(LOCK_SUFFIX)])
+                continue
+            if name == LOCK_MANIFEST_NAME:
+                has_manifest = True
+                continue
+            stem, ext = os.path.splitext(name)
+            if ext.lower() in IMAGE_EXTENSIONS:
+                if not entry.is_file():
+                    continue
+                if stem not in images or name < images[stem]:
+                    images[stem] = name
+            elif name.endswith(tag_suffix):
+                if entry.is_file():
+                    tag_stems.add(name[: -len(tag_suffix)])
+            elif not name.startswith(".") and entry.is_dir():
+                subdirs.append(folder / name)
+    if has_manifest:
+        # 存在锁定清单时以清单为准，忽略残留的 .lock 文件
+        lock_names = read_lock_manifest(folder) or set()
+    scanned = time.perf_counter()
+    stats.images = len(images)
+    stats.tag_files = len(tag_stems)
+    stats.lock_files = len(lock_names)
+    records: List[FileRecord] = []
+    for stem in sorted(tag_stems.union(images)):
+        tag_name = f"{stem}{tag_suffix}"
+        image_name = images.get(stem)
+        records.append(
+            FileRecord(
+                prefix + stem,
+                folder / image_name if image_name else None,
+                folder / tag_name,
+                tag_name in lock_names,
+            )
+        )
+    stats.records = len(records)
+    stats.scan_seconds = scanned - started
+    stats.pair_seconds = time.perf_counter() - scanned
+    return records, stats, sorted(subdirs)
+
+
+def scan_tree(
+    top: Path,
+    tag_suffix: str = DEFAULT_TAG_SUFFIX,
+    index: Optional["DirectoryIndex"] = None,
+    max_workers: int = DISCOVERY_WORKERS,
+    root: Optional[Path] = None,
+) -> Tuple[List[FileRecord], DiscoveryStats]:
+    """递归扫描分片目录树：每个子目录一个线程池任务，结果按相对路径排序合并"""
+    root = root or top
+    total = DiscoveryStats()
+    records: List[FileRecord] = []
+    indexed = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = {pool.submit(scan_folder, top, tag_suffix, index, root)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    folder_records, stats, subdirs = future.result()
+                except OSError:
+                    total.errors += 1
+                    continue
+                records.extend(folder_records)
+                total.folders += stats.folders
+                total.entries += stats.entries
+                total.images += stats.images
+                total.tag_files += stats.tag_files
+                total.lock_files += stats.lock_files
+                indexed += int(stats.from_index)
+                for subdir in subdirs:
+                    pending.add(pool.submit(scan_folder, subdir, tag_suffix, index, root))
+    merged = time.perf_counter()
+    total.from_index = total.folders > 0 and indexed == total.folders
+    records.sort(key=lambda rec: rec.base_name)
+    total.records = len(records)
+    total.scan_seconds = merged - started
+    total.pair_seconds = time.perf_counter() - merged
+    return records, total
 
 
 def read_tags(path: Path) -> List[str]:
-    if not path.exists():
-        return []
+    try:
+        stat = os.stat(path)
+    except OSError:
+        member = find_member(path)
+        if member is None:
+            return []
+        archive, name = member
+        return parse_tags(archive.tag_text(name))
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = tag_cache.get(path, signature)
+    if cached is not None:
+        return list(cached)
     try:
         content = path.read_text(encoding="utf-8")
     except OSError:
         return []
+    tags = parse_tags(content)
+    tag_cache.put(path, signature, tags)
+    return tags
+
+
+def parse_tags(content: str) -> List[str]:
     parts = content.replace("\n", ",").split(",")
     return [piece.strip() for piece in parts if piece.strip()]
 
 
-def write_tags(path: Path, tags: List[str]) -> None:
-    if not path.parent.exists():
-        path.parent.mkdir(parents=True, exist_ok=True)
-    backup = path.with_suffix(path.suffix + ".bak")
-    if path.exists() and not backup.exists():
+def write_tags(path: Path, tags: List[str]) -> List[str]:
+    """写入标签文件并返回实际写入的标签列表（含逗号或换行的标签会被拆开）"""
+    batch = TagWriteBatch(group_size=1)
+    written = batch.write(path, tags)
+    batch.commit()
+    if batch.failures:
+        raise batch.failures[0][1]
+    return written
+
+
+def read_image_bytes(path: Path) -> Optional[bytes]:
+    """读取图片内容；归档内嵌的图片直接从内存映射中切片返回"""
+    member = find_member(path)
+    if member is not None:
+        archive, name = member
+        return archive.image_bytes(name)
+    try:
+        return path.read_bytes()
+    except OSError:
+        return None
+
+
+def scan_archive(path: Path) -> Tuple[List[FileRecord], DiscoveryStats]:
+    """打开打包数据集并生成记录：标签路径为 归档路径/记录名+后缀，
+    内嵌图片同样位于归档路径之下，未嵌入的图片指向相对归档所在目录的原文件。
+    """
+    started = time.perf_counter()
+    archive = open_archive(path)
+    stats = DiscoveryStats(folders=1, entries=len(archive))
+    records: List[FileRecord] = []
+    for entry in archive.entries:
+        image_path: Optional[Path] = None
+        if entry.image_name and entry.embedded:
+            folder = entry.base_name.rpartition("/")[0]
+            image_path = path / folder / entry.image_name if folder else path / entry.image_name
+        elif entry.image_name:
+            image_path = path.parent / entry.image_name
+        stats.images += int(image_path is not None)
+        stats.lock_files += int(entry.locked)
+        records.append(
+            FileRecord(entry.base_name, image_path, path / f"{entry.base_name}{archive.tag_suffix}", entry.locked)
+        )
+    stats.tag_files = stats.records = len(records)
+    stats.scan_seconds = time.perf_counter() - started
+    return records, stats
+
+
+def pack_dataset(
+    folder: Path,
+    target: Path,
+    tag_suffix: str = DEFAULT_TAG_SUFFIX,
+    recursive: bool = False,
+    embed_images: bool = True,
+    index: Optional["DirectoryIndex"] = None,
+) -> PackStats:
+    """把目录（或目录树）打包为单个归档文件；先写临时文件，完成后原子替换目标"""
+    started = time.perf_counter()
+    if recursive:
+        records, _ = scan_tree(folder, tag_suffix, index=index)
+    else:
+        records, _ = scan_records(folder, tag_suffix, index=index)
+    stats = PackStats()
+    temp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    try:
+        with open(temp, "wb") as fp:
+            writer = ArchiveWriter(fp, tag_suffix)
+            for record in records:
+                tags = index.tags_for(record) if index is not None else read_tags(record.tag_path)
+                writer.add_tags(record.base_name, ", ".join(tags), record.locked)
+                stats.locked += int(record.locked)
+                if record.image_path is None:
+                    continue
+                if not embed_images:
+                    writer.add_image(record.base_name, _relative_ref(record.image_path, target.parent), None)
+                    stats.images += 1
+                    continue
+                try:
+                    with open(record.image_path, "rb") as source:
+                        writer.add_image(record.base_name, record.image_path.name, source)
+                except FileNotFoundError:
+                    continue
+                stats.images += 1
+            stats.records = writer.finish()
+            fp.flush()
+            os.fsync(fp.fileno())
+            stats.bytes = writer.bytes
+        # Windows 下已映射的文件无法被替换，先释放旧的映射
+        close_archive(target)
+        os.replace(temp, target)
+    except BaseException:
         try:
-            shutil.copy2(path, backup)
+            temp.unlink()
         except OSError:
             pass
-    content = ", ".join(tag.strip() for tag in tags if tag.strip())
-    path.write_text(content, encoding="utf-8")
+        raise
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+def _relative_ref(path: Path, base: Path) -> str:
+    try:
+        return Path(os.path.relpath(path, base)).as_posix()
+    except ValueError:
+        # 不同盘符之间无法求相对路径，退回绝对路径
+        return path.resolve().as_posix()
+
+
+def unpack_archive(path: Path, target: Path) -> PackStats:
+    """把归档还原为普通目录：标签文件分组原子写入，内嵌图片逐个写出，锁定状态按目录批量恢复"""
+    started = time.perf_counter()
+    archive = open_archive(path)
+    stats = PackStats()
+    locked: List[Path] = []
+    target.mkdir(parents=True, exist_ok=True)
+    with TagWriteBatch(backup=False) as batch:
+        for entry in archive.entries:
+            tag_path = target / f"{entry.base_name}{archive.tag_suffix}"
+            batch.write(tag_path, parse_tags(archive.tag_text(entry.base_name)))
+            stats.records += 1
+            if entry.locked:
+                locked.append(tag_path)
+            if entry.image_name and entry.embedded:
+                image_path = tag_path.parent / entry.image_name
+                with open(image_path, "wb") as fp:
+                    fp.write(archive.image_bytes(entry.base_name))
+                stats.images += 1
+            elif entry.image_name:
+                source = path.parent / entry.image_name
+                if source.is_file():
+                    shutil.copy2(source, tag_path.parent / source.name)
+                    stats.images += 1
+    if batch.failures:
+        raise batch.failures[0][1]
+    failures = set_locked_many(locked, True)
+    if failures:
+        raise failures[0][1]
+    stats.locked = len(locked)
+    stats.bytes = batch.stats.bytes
+    stats.seconds = time.perf_counter() - started
+    return stats
 
 
 def _lock_path(tag_path: Path) -> Path:
     return Path(str(tag_path) + LOCK_SUFFIX)
 
 
+def has_lock_manifest(folder: Path) -> bool:
+    return (folder / LOCK_MANIFEST_NAME).is_file()
+
+
+def read_lock_manifest(folder: Path) -> Optional[Set[str]]:
+    """读取目录的锁定清单（已锁定的标签文件名）；没有清单时返回 None，表示使用 .lock 旁路文件"""
+    path = folder / LOCK_MANIFEST_NAME
+    try:
+        stat = os.stat(path)
+    except OSError:
+        with _MANIFEST_LOCK:
+            _MANIFESTS.pop(folder, None)
+        return None
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _MANIFEST_LOCK:
+        cached = _MANIFESTS.get(folder)
+        if cached and cached[0] == signature:
+            return cached[1]
+    try:
+        content = path.read_text(encoding="utf-8")
+    except OSError:
+        return None
+    names = {line.strip() for line in content.splitlines() if line.strip()}
+    with _MANIFEST_LOCK:
+        _MANIFESTS[folder] = (signature, names)
+    return names
+
+
+def write_lock_manifest(folder: Path, names: Set[str]) -> None:
+    path = folder / LOCK_MANIFEST_NAME
+    temp = path.with_name(path.name + ".tmp")
+    with open(temp, "w", encoding="utf-8", newline="\n") as fp:
+        fp.write("".join(f"{name}\n" for name in sorted(names)))
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(temp, path)
+    stat = os.stat(path)
+    with _MANIFEST_LOCK:
+        _MANIFESTS[folder] = ((stat.st_mtime_ns, stat.st_size), set(names))
+
+
 def is_locked(tag_path: Path) -> bool:
+    member = find_member(tag_path)
+    if member is not None:
+        archive, name = member
+        return archive.entry(name).locked
+    names = read_lock_manifest(tag_path.parent)
+    if names is not None:
+        return tag_path.name in names
     return _lock_path(tag_path).exists()
 
 
 def set_locked(tag_path: Path, locked: bool) -> None:
-    lock_path = _lock_path(tag_path)
-    if locked:
-        if not lock_path.exists():
-            lock_path.touch()
-    else:
-        if lock_path.exists():
-            lock_path.unlink()
+    failures = set_locked_many([tag_path], locked)
+    if failures:
+        raise failures[0][1]
+
+
+def set_locked_many(tag_paths: Iterable[Path], locked: bool) -> List[Tuple[Path, OSError]]:
+    """批量修改锁定状态：清单模式下每个目录只重写一次清单，否则逐个创建/删除 .lock 文件"""
+    failures: List[Tuple[Path, OSError]] = []
+    by_folder: Dict[Path, List[Path]] = {}
+    for tag_path in tag_paths:
+        if find_member(tag_path) is not None:
+            failures.append((tag_path, ArchiveError(f"归档为只读，请先解包：{tag_path.name}")))
+            continue
+        by_folder.setdefault(tag_path.parent, []).append(tag_path)
+    for folder, paths in by_folder.items():
+        names = read_lock_manifest(folder)
+        if names is not None:
+            updated = set(names)
+            if locked:
+                updated.update(path.name for path in paths)
+            else:
+                updated.difference_update(path.name for path in paths)
+            if updated == names:
+                continue
+            try:
+                write_lock_manifest(folder, updated)
+            except OSError as exc:
+                failures.extend((path, exc) for path in paths)
+                continue
+            changed = [path for path in paths if (path.name in names) != locked]
+            log_changes(folder, [(LOCK, path, None, locked, None) for path in changed])
+            continue
+        changed = []
+        for path in paths:
+            lock_path = _lock_path(path)
+            try:
+                if locked:
+                    if not lock_path.exists():
+                        lock_path.touch()
+                        changed.append(path)
+                elif lock_path.exists():
+                    lock_path.unlink()
+                    changed.append(path)
+            except OSError as exc:
+                failures.append((path, exc))
+        log_changes(folder, [(LOCK, path, None, locked, None) for path in changed])
+    return failures
+
+
+def migrate_lock_sidecars(folder: Path) -> int:
+    """把目录中的 .lock 旁路文件合并进锁定清单并删除旁路文件，返回迁移数量"""
+    existing = read_lock_manifest(folder) or set()
+    sidecars: List[Path] = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.name.endswith(LOCK_SUFFIX) and entry.is_file():
+                sidecars.append(folder / entry.name)
+    names = set(existing)
+    names.update(path.name[: -len(LOCK_SUFFIX)] for path in sidecars)
+    if names != existing or not has_lock_manifest(folder):
+        write_lock_manifest(folder, names)
+    for path in sidecars:
+        try:
+            path.unlink()
+        except OSError:
+            pass
+    return len(sidecars)
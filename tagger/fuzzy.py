@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import math
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from .bulk import ProgressCallback, Transform
+from .normalizer import normalize_tag_key
+
+DEFAULT_SIMILARITY = 0.8
+REPORT_EVERY = 1024
+
+
+@dataclass
+class MergeCluster:
+    """一组疑似同一标签的不同写法；target 为出现次数最多的写法，members 含 target 本身"""
+
+    target: str
+    members: List[Tuple[str, int]] = field(default_factory=list)
+
+    @property
+    def total(self) -> int:
+        return sum(count for _, count in self.members)
+
+    def merges(self, target: Optional[str] = None) -> Dict[str, str]:
+        """规范化键 → 目标写法；members 中的写法各自对应不同的键"""
+        target = target or self.target
+        target_key = normalize_tag_key(target)
+        merges: Dict[str, str] = {}
+        for tag, _ in self.members:
+            key = normalize_tag_key(tag)
+            if key != target_key:
+                merges[key] = target
+        return merges
+
+
+def squash(tag: str) -> str:
+    """下划线与连续空格视为同一个分隔符"""
+    return " ".join(tag.replace("_", " ").split())
+
+
+def _compact(tag: str) -> str:
+    # 比较的是未经单复数折叠的小写写法：折叠会把 wolves 变成 wolve，反而拉大与 wolfs 的距离
+    return squash(tag.lower()).replace(" ", "")
+
+
+def _segments(length: int, count: int) -> List[Tuple[int, int]]:
+    """把长度 length 均分为 count 段，返回每段的 (起点, 长度)，较长的段放在后面"""
+    base, extra = divmod(length, count)
+    segments = []
+    start = 0
+    for i in range(count):
+        size = base + (1 if i >= count - extra else 0)
+        segments.append((start, size))
+        start += size
+    return segments
+
+
+def _limit(length: int, similarity: float) -> int:
+    return int((1.0 - similarity) * length + 1e-9)
+
+
+def edit_distance(first: str, second: str, limit: int) -> int:
+    """Levenshtein 距离（Myers 位并行算法，一次处理一整列）；超过 limit 时返回 limit + 1"""
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    if not first or not second:
+        return min(len(first) + len(second), limit + 1)
+    peq: Dict[str, int] = {}
+    for i, char in enumerate(first):
+        peq[char] = peq.get(char, 0) | (1 << i)
+    mask = (1 << len(first)) - 1
+    last = 1 << (len(first) - 1)
+    pv, mv, score = mask, 0, len(first)
+    remaining = len(second)
+    for char in second:
+        eq = peq.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        remaining -= 1
+        # 末行每列最多减 1，剩余列不足以回到 limit 以内时提前结束
+        if score - remaining > limit:
+            return limit + 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+    return min(score, limit + 1)
+
+
+def _alphabet(text: str) -> int:
+    mask = 0
+    for char in text:
+        mask |= 1 << (ord(char) & 63)
+    return mask
+
+
+def find_clusters(
+    counts: Dict[str, int],
+    similarity: float = DEFAULT_SIMILARITY,
+    min_count: int = 1,
+    progress: Optional[ProgressCallback] = None,
+    cancel: Optional[threading.Event] = None,
+) -> List[MergeCluster]:
+    """在整个标签表中查找拼写相近的标签，返回按出现次数排序的合并建议。
+
+    counts 以实际写法为键（每个规范化键一种写法，见 TagIndex.spelling_counts）。
+    两个标签小写并去掉分隔符后的编辑距离不超过 (1 - similarity) × 较长长度时视为相近（见 similar_pairs）。
+    按出现次数从高到低，把尚未归类的相近标签归到最常见的写法下。
+    短标签的不规则复数（wolfs / wolves 距离为 2）在默认 0.8 下不会被提出，需要把 similarity 降到 0.66 左右。
+    """
+    if not 0.0 < similarity <= 1.0:
+        raise ValueError("similarity 必须在 (0, 1] 之间")
+    tags = sorted((tag for tag, count in counts.items() if tag and count >= min_count), key=lambda t: (-counts[t], t))
+    neighbors = similar_pairs([_compact(tag) for tag in tags], similarity, progress, cancel)
+    if neighbors is None:
+        return []
+    clusters: List[MergeCluster] = []
+    assigned: Set[int] = set()
+    # tags 已按出现次数降序排列，先处理到的就是组内最常见的写法
+    for i in range(len(tags)):
+        if i in assigned or not neighbors[i]:
+            continue
+        members = [i] + sorted(j for j in set(neighbors[i]) if j not in assigned and j != i)
+        if len(members) < 2:
+            continue
+        assigned.update(members)
+        clusters.append(MergeCluster(tags[i], [(tags[j], counts[tags[j]]) for j in members]))
+    clusters.sort(key=lambda cluster: (-cluster.total, cluster.target))
+    return clusters
+
+
+def similar_pairs(
+    compacts: Sequence[str],
+    similarity: float,
+    progress: Optional[ProgressCallback] = None,
+    cancel: Optional[threading.Event] = None,
+) -> Optional[List[List[int]]]:
+    """返回每个字符串的相近字符串序号（编辑距离不超过 (1 - similarity) × 较长长度）；取消时返回 None。
+
+    候选由分段子串索引生成：按长度从短到长处理，每个字符串均分为 τ + 1 段登记进索引
+    （τ 为它与可能的最长伙伴之间允许的距离）；距离不超过 τ 的较长字符串必然原样包含其中某一段 k，
+    且 k 左侧的编辑不超过 k 次、右侧不超过 τ - k 次。因此每个字符串只需在少量位置取子串查表，
+    不做两两比较，命中后也只需对段两侧的短子串做带状编辑距离校验。
+    """
+    # (长度, 允许距离, 段序号, 段内容) → 标签序号
+    index: Dict[Tuple[int, int, int, str], List[int]] = {}
+    layouts: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+    neighbors: List[List[int]] = [[] for _ in compacts]
+    # 每次编辑最多让出现过的字符集合相差两个字符，先用位掩码排除明显不同的候选
+    alphabets = [_alphabet(text) for text in compacts]
+    total = len(compacts)
+    order = sorted(range(total), key=lambda i: len(compacts[i]))
+    for done, i in enumerate(order):
+        if cancel is not None and cancel.is_set():
+            return None
+        text = compacts[i]
+        length = len(text)
+        limit = _limit(length, similarity)
+        found: Set[int] = set()
+        for other in range(max(1, math.ceil(length * similarity - 1e-9)), length + 1):
+            layout = layouts.get((other, limit))
+            if layout is None:
+                continue
+            shift = length - other
+            for segment, (start, size) in enumerate(layout):
+                # 第 k 段之前最多发生 k 次编辑、之后最多 τ - k 次，两个约束共同限定它在较长标签中的位置
+                low = max(0, start - segment, start + shift - (limit - segment))
+                high = min(length - size, start + segment, start + shift + (limit - segment))
+                for position in range(low, high + 1):
+                    postings = index.get((other, limit, segment, text[position : position + size]))
+                    if postings is None:
+                        continue
+                    left, right = text[:position], text[position + size :]
+                    for j in postings:
+                        if j in found or bin(alphabets[i] ^ alphabets[j]).count("1") > 2 * limit:
+                            continue
+                        # 段两侧分别校验：左侧最多 k 次编辑、右侧最多 τ - k 次，两者之和不超过 τ
+                        candidate = compacts[j]
+                        if _within(left, candidate[:start], segment) and _within(
+                            right, candidate[start + size :], limit - segment
+                        ):
+                            found.add(j)
+                            neighbors[i].append(j)
+                            neighbors[j].append(i)
+        # 较长的伙伴决定允许距离；对每个可能的距离各登记一种 τ + 1 段的划分
+        for partner in range(length, int(length / similarity + 1e-9) + 1):
+            tau = _limit(partner, similarity)
+            layout = layouts.get((length, tau))
+            if layout is None:
+                layout = layouts[(length, tau)] = _segments(length, tau + 1)
+            for segment, (start, size) in enumerate(layout):
+                postings = index.setdefault((length, tau, segment, text[start : start + size]), [])
+                if not postings or postings[-1] != i:
+                    postings.append(i)
+        if progress is not None and (done % REPORT_EVERY == 0 or done == total - 1):
+            progress(done + 1, total)
+    return neighbors
+
+
+def _within(first: str, second: str, limit: int) -> bool:
+    if first == second:
+        return True
+    return limit > 0 and edit_distance(first, second, limit) <= limit
+
+
+def merge_transform(merges: Dict[str, str]) -> Transform:
+    """批量合并：规范化键在 merges 中的标签改写为目标写法；文件中已有目标时直接移除"""
+
+    def transform(tags: List[str]) -> Tuple[List[str], List[str]]:
+        keys = [normalize_tag_key(tag) for tag in tags]
+        if not any(key in merges for key in keys):
+            return tags, []
+        present = {key for key in keys if key not in merges}
+        result: List[str] = []
+        notes: List[str] = []
+        for tag, key in zip(tags, keys):
+            target = merges.get(key)
+            if target is None:
+                result.append(tag)
+                continue
+            target_key = normalize_tag_key(target)
+            if target_key in present:
+                notes.append(f"合并并去重：{tag} → {target}")
+                continue
+            present.add(target_key)
+            result.append(target)
+            notes.append(f"合并：{tag} → {target}")
+        return result, notes
+
+    return transform
+
+
+def merge_map(clusters: Sequence[MergeCluster]) -> Dict[str, str]:
+    merges: Dict[str, str] = {}
+    for cluster in clusters:
+        merges.update(cluster.merges())
+    return merges
@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+import json
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .bulk import BulkEngine, BulkResult, ProgressCallback, Reader
+from .config import BULK_WORKERS
+from .dto import FileRecord
+from .export import format_for_path
+from .fileops import read_tags
+from .utils import normalize
+
+IMPORT_FORMATS = ("json", "jsonl", "parquet")
+IMPORT_CHUNK = 4096
+READ_SIZE = 1 << 20
+MAX_UNKNOWN_NAMES = 100
+
+
+class TagImportError(ValueError):
+    """导入文件格式无效"""
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    unknown: int = 0
+    unknown_names: List[str] = field(default_factory=list)
+    duplicates: int = 0
+    bulk: BulkResult = field(default_factory=BulkResult)
+
+
+class _JsonStream:
+    """按需从文件读取并用 raw_decode 逐个解析 JSON 值，整个文件不会一次读入内存"""
+
+    def __init__(self, fp: IO[str]) -> None:
+        self.fp = fp
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+
+    def _more(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.fp.read(READ_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position :] + chunk
+        self.position = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position].isspace():
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._more():
+                return ""
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise TagImportError(f"JSON 格式无效：缺少 {char!r}")
+        self.position += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError as exc:
+                if self._more():
+                    continue
+                raise TagImportError(f"JSON 格式无效：{exc}") from exc
+            # 缓冲区末尾的数字可能被截断，补读后重新解析
+            if end == len(self.buffer) and self._more():
+                continue
+            self.position = end
+            return value
+
+
+def _iter_json(fp: IO[str]) -> Iterator[Tuple[str, Any]]:
+    """{记录名: 标签} 映射（本工具的 JSON 导出）或 [{"name": ..., "tags": ...}, ...] 列表"""
+    stream = _JsonStream(fp)
+    opening = stream.peek()
+    if opening not in ("{", "["):
+        raise TagImportError("JSON 顶层需要是对象或数组")
+    closing = "}" if opening == "{" else "]"
+    stream.position += 1
+    if stream.peek() == closing:
+        return
+    while True:
+        if opening == "{":
+            name = stream.value()
+            stream.expect(":")
+            yield name, stream.value()
+        else:
+            yield _row_entry(stream.value())
+        separator = stream.peek()
+        stream.position += 1
+        if separator == closing:
+            return
+        if separator != ",":
+            raise TagImportError(f"JSON 格式无效：意外的 {separator!r}")
+
+
+def _row_entry(row: Any) -> Tuple[str, Any]:
+    if not isinstance(row, dict) or "name" not in row:
+        raise TagImportError("每行需要是包含 name 的对象")
+    return row["name"], row["tags"] if row.get("tags") is not None else row.get("text")
+
+
+def _iter_jsonl(fp: IO[str]) -> Iterator[Tuple[str, Any]]:
+    for number, line in enumerate(fp, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as exc:
+            raise TagImportError(f"第 {number} 行不是有效的 JSON：{exc}") from exc
+        yield _row_entry(row)
+
+
+def _iter_parquet(path: Path) -> Iterator[Tuple[str, Any]]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise TagImportError("导入 Parquet 需要安装 pyarrow") from exc
+    parquet = pq.ParquetFile(str(path))
+    names = set(parquet.schema_arrow.names)
+    column = "tags" if "tags" in names else "text"
+    if "name" not in names or column not in names:
+        raise TagImportError("Parquet 文件需要 name 列以及 tags 或 text 列")
+    for batch in parquet.iter_batches(columns=["name", column]):
+        yield from zip(batch.column(0).to_pylist(), batch.column(1).to_pylist())
+
+
+def iter_import_rows(path: Path, fmt: Optional[str] = None) -> Iterator[Tuple[str, List[str]]]:
+    """流式读取导出文件，逐条产出 (记录名, 规范化后的标签)"""
+    fmt = fmt or format_for_path(path)
+    if fmt not in IMPORT_FORMATS:
+        raise TagImportError(f"不支持导入 {fmt} 格式（可用：{', '.join(IMPORT_FORMATS)}）")
+    if fmt == "parquet":
+        rows = _iter_parquet(path)
+    else:
+        fp = open(path, "r", encoding="utf-8-sig")
+        rows = _iter_json(fp) if fmt == "json" else _iter_jsonl(fp)
+    try:
+        for name, value in rows:
+            yield str(name), _clean_tags(name, value)
+    finally:
+        if fmt != "parquet":
+            fp.close()
+
+
+def _clean_tags(name: Any, value: Any) -> List[str]:
+    if value is None:
+        value = []
+    elif isinstance(value, str):
+        value = value.split(",")
+    elif not isinstance(value, list):
+        raise TagImportError(f"{name} 的标签需要是列表或逗号分隔的字符串")
+    # 保持原样（包括重复标签），导出再导入才不会改写文件；去重交给显式的 compact 规则
+    return [tag for tag in (normalize(str(item)) for item in value) if tag]
+
+
+def _diff(old: List[str], new: List[str]) -> Tuple[List[str], List[str]]:
+    old_set, new_set = set(old), set(new)
+    notes = [f"+{tag}" for tag in new if tag not in old_set]
+    notes.extend(f"-{tag}" for tag in old if tag not in new_set)
+    if not notes and old != new:
+        notes.append("调整顺序")
+    return new, notes
+
+
+def _merge(total: BulkResult, part: BulkResult) -> None:
+    total.total += part.total
+    total.processed += part.processed
+    total.unchanged += part.unchanged
+    total.locked_skipped.extend(part.locked_skipped)
+    total.changes.extend(part.changes)
+    total.failures.extend(part.failures)
+    total.cancelled = total.cancelled or part.cancelled
+    stats = total.write_stats
+    stats.files += part.write_stats.files
+    stats.bytes += part.write_stats.bytes
+    stats.fsyncs += part.write_stats.fsyncs
+    stats.groups += part.write_stats.groups
+    stats.seconds += part.write_stats.seconds
+    total.seconds += part.seconds
+
+
+def import_tags(
+    path: Path,
+    records: Sequence[FileRecord],
+    reader: Reader = lambda record: read_tags(record.tag_path),
+    include_locked: bool = False,
+    fmt: Optional[str] = None,
+    progress: Optional[ProgressCallback] = None,
+    cancel: Optional[threading.Event] = None,
+    max_workers: int = BULK_WORKERS,
+) -> ImportResult:
+    """把导出文件中的标签写回标签文件。
+
+    边读边按块交给 BulkEngine：与当前标签（经 reader 读取，可命中目录索引缓存）相同的文件不写入，
+    已锁定的文件默认跳过；同名记录只采用第一次出现的标签。
+    """
+    by_name = {record.base_name: record for record in records}
+    engine = BulkEngine(reader, max_workers)
+    cancel = cancel or threading.Event()
+    result = ImportResult()
+    seen = set()
+    pending: Dict[str, List[str]] = {}
+    offset = [0]
+
+    def report(done: int, total: int) -> None:
+        if progress is not None:
+            progress(offset[0] + done, len(by_name))
+
+    def flush() -> None:
+        if not pending:
+            return
+        part = engine.run_each(
+            [by_name[name] for name in pending],
+            lambda record, tags: _diff(tags, pending[record.base_name]),
+            include_locked,
+            report,
+            cancel,
+        )
+        _merge(result.bulk, part)
+        offset[0] += part.processed
+        pending.clear()
+
+    for name, tags in iter_import_rows(path, fmt):
+        if cancel.is_set():
+            break
+        result.rows += 1
+        if name not in by_name:
+            result.unknown += 1
+            if len(result.unknown_names) < MAX_UNKNOWN_NAMES:
+                result.unknown_names.append(name)
+            continue
+        if name in seen:
+            result.duplicates += 1
+            continue
+        seen.add(name)
+        pending[name] = tags
+        if len(pending) >= IMPORT_CHUNK:
+            flush()
+    flush()
+    result.bulk.cancelled = cancel.is_set()
+    result.bulk.changes.sort(key=lambda change: change.record.base_name)
+    return result
+
+
+def write_import_report(result: ImportResult, path: Path) -> None:
+    lines = [
+        f"读取 {result.rows} 条，修改 {len(result.bulk.changes)}，无需修改 {result.bulk.unchanged}，"
+        f"锁定跳过 {len(result.bulk.locked_skipped)}，未找到 {result.unknown}，重复 {result.duplicates}，"
+        f"失败 {len(result.bulk.failures)}\n"
+    ]
+    for change in result.bulk.changes:
+        lines.append(f"{change.record.base_name}: {' '.join(change.notes)}\n")
+    lines.extend(f"{record.base_name}: 跳过（已锁定）\n" for record in result.bulk.locked_skipped)
+    lines.extend(f"{name}: 未找到对应文件\n" for name in result.unknown_names)
+    if result.unknown > len(result.unknown_names):
+        lines.append(f"……另有 {result.unknown - len(result.unknown_names)} 条未找到\n")
+    lines.extend(f"{failure}\n" for failure in result.bulk.failures)
+    path.write_text("".join(lines), encoding="utf-8")
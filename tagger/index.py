@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .config import INDEX_DIRNAME, INDEX_FILENAME
+from .dto import DiscoveryStats, FileRecord
+from .fileops import read_tags, scan_folder
+from .tagcache import tag_cache
+
+SCHEMA_VERSION = 2
+FLUSH_THRESHOLD = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    folder TEXT PRIMARY KEY,
+    tag_suffix TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    subdirs TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS records (
+    base_name TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    image_name TEXT,
+    tag_name TEXT NOT NULL,
+    locked INTEGER NOT NULL DEFAULT 0,
+    tag_mtime_ns INTEGER,
+    tag_size INTEGER,
+    tags TEXT
+);
+CREATE INDEX IF NOT EXISTS records_folder ON records(folder);
+"""
+
+_UPSERT = """
+INSERT INTO records (base_name, folder, image_name, tag_name, locked)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(base_name) DO UPDATE SET
+    folder = excluded.folder,
+    image_name = excluded.image_name,
+    locked = excluded.locked,
+    tags = CASE WHEN records.tag_name = excluded.tag_name THEN records.tags ELSE NULL END,
+    tag_mtime_ns = CASE WHEN records.tag_name = excluded.tag_name THEN records.tag_mtime_ns ELSE NULL END,
+    tag_size = CASE WHEN records.tag_name = excluded.tag_name THEN records.tag_size ELSE NULL END,
+    tag_name = excluded.tag_name
+"""
+
+RowKey = Tuple[Optional[str], str, bool]
+
+
+class DirectoryIndex:
+    """数据集根目录下的持久化索引：文件清单、锁定状态以及按 (mtime, size) 校验的已解析标签。
+
+    目录 mtime 未变化时直接复用清单；标签只在文件签名变化后重新解析。
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.path = root / INDEX_DIRNAME / INDEX_FILENAME
+        self.disabled = False
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pending: Dict[str, Tuple[int, int, str]] = {}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+            except OSError as exc:
+                raise sqlite3.OperationalError(str(exc)) from exc
+            conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != SCHEMA_VERSION:
+                conn.executescript("DROP TABLE IF EXISTS dirs; DROP TABLE IF EXISTS records;")
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.executescript(_SCHEMA)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _folder_key(self, folder: Path) -> str:
+        try:
+            relative = folder.relative_to(self.root).as_posix()
+        except ValueError:
+            relative = folder.as_posix()
+        return "" if relative == "." else relative
+
+    def refresh(self, folder: Path, tag_suffix: str) -> Tuple[List[FileRecord], DiscoveryStats]:
+        records, stats, _ = self.refresh_folder(folder, tag_suffix)
+        return records, stats
+
+    def refresh_folder(
+        self, folder: Path, tag_suffix: str
+    ) -> Tuple[List[FileRecord], DiscoveryStats, List[Path]]:
+        if self.disabled:
+            return scan_folder(folder, tag_suffix, root=self.root)
+        try:
+            return self._refresh(folder, tag_suffix)
+        except sqlite3.Error:
+            self.disabled = True
+            return scan_folder(folder, tag_suffix, root=self.root)
+
+    def _refresh(
+        self, folder: Path, tag_suffix: str
+    ) -> Tuple[List[FileRecord], DiscoveryStats, List[Path]]:
+        key = self._folder_key(folder)
+        with self._lock:
+            conn = self._connect()
+            # 先建立索引目录再读取 mtime，避免首次创建 .tagger 导致下次误判为已变化
+            mtime_ns = folder.stat().st_mtime_ns
+            row = conn.execute(
+                "SELECT tag_suffix, mtime_ns, subdirs FROM dirs WHERE folder = ?", (key,)
+            ).fetchone()
+            if row and row[0] == tag_suffix and row[1] == mtime_ns:
+                started = time.perf_counter()
+                cached = self._load_records(folder, key)
+                stats = DiscoveryStats(
+                    folders=1,
+                    records=len(cached),
+                    scan_seconds=time.perf_counter() - started,
+                    from_index=True,
+                )
+                return cached, stats, [folder / name for name in _split_tags(row[2])]
+
+        # 目录列举放在锁外，递归模式下多个分片可以并行扫描
+        records, stats, subdirs = scan_folder(folder, tag_suffix, root=self.root)
+        with self._lock:
+            conn = self._connect()
+            existing: Dict[str, RowKey] = {
+                base: (image, tag, bool(locked))
+                for base, image, tag, locked in conn.execute(
+                    "SELECT base_name, image_name, tag_name, locked FROM records WHERE folder = ?",
+                    (key,),
+                )
+            }
+            changed = []
+            for record in records:
+                image_name = record.image_path.name if record.image_path else None
+                current: RowKey = (image_name, record.tag_path.name, record.locked)
+                if existing.pop(record.base_name, None) != current:
+                    changed.append(
+                        (record.base_name, key, image_name, record.tag_path.name, int(record.locked))
+                    )
+            conn.executemany(_UPSERT, changed)
+            conn.executemany("DELETE FROM records WHERE base_name = ?", [(base,) for base in existing])
+            conn.execute(
+                "INSERT OR REPLACE INTO dirs (folder, tag_suffix, mtime_ns, subdirs) VALUES (?, ?, ?, ?)",
+                (key, tag_suffix, mtime_ns, "\n".join(path.name for path in subdirs)),
+            )
+            conn.commit()
+        return records, stats, subdirs
+
+    def _load_records(self, folder: Path, key: str) -> List[FileRecord]:
+        rows = self._connect().execute(
+            "SELECT base_name, image_name, tag_name, locked FROM records "
+            "WHERE folder = ? ORDER BY base_name",
+            (key,),
+        )
+        return [
+            FileRecord(base, folder / image if image else None, folder / tag, bool(locked))
+            for base, image, tag, locked in rows
+        ]
+
+    def rename_records(self, folder: Path, removed: Iterable[str], records: Dict[str, FileRecord]) -> None:
+        """删除并重排后调用：records 为 旧 base_name → 改名后的记录，已解析的标签随记录保留"""
+        if self.disabled:
+            return
+        key = self._folder_key(folder)
+        try:
+            with self._lock:
+                for base, record in records.items():
+                    pending = self._pending.pop(base, None)
+                    if pending is not None:
+                        self._pending[record.base_name] = pending
+                conn = self._connect()
+                conn.executemany("DELETE FROM records WHERE base_name = ?", [(base,) for base in removed])
+                # 新旧名称相互重叠，先整体改为临时名称（"//" 开头，不会是合法的相对路径）再改为新名称
+                conn.executemany(
+                    "UPDATE records SET base_name = ? WHERE base_name = ?",
+                    [("//" + base, base) for base in records],
+                )
+                conn.executemany(
+                    "UPDATE records SET base_name = ?, image_name = ?, tag_name = ? WHERE base_name = ?",
+                    [
+                        (
+                            record.base_name,
+                            record.image_path.name if record.image_path else None,
+                            record.tag_path.name,
+                            "//" + base,
+                        )
+                        for base, record in records.items()
+                    ],
+                )
+                conn.execute(
+                    "UPDATE dirs SET mtime_ns = ? WHERE folder = ?", (folder.stat().st_mtime_ns, key)
+                )
+                conn.commit()
+        except (sqlite3.Error, OSError):
+            self.disabled = True
+
+    def tags_for(self, record: FileRecord) -> List[str]:
+        if self.disabled:
+            return read_tags(record.tag_path)
+        try:
+            stat = os.stat(record.tag_path)
+        except OSError:
+            return []
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = tag_cache.get(record.tag_path, signature)
+        if cached is not None:
+            return list(cached)
+        try:
+            with self._lock:
+                pending = self._pending.get(record.base_name)
+                if pending and pending[:2] == signature:
+                    return _split_tags(pending[2])
+                row = self._connect().execute(
+                    "SELECT tag_mtime_ns, tag_size, tags FROM records WHERE base_name = ?",
+                    (record.base_name,),
+                ).fetchone()
+        except sqlite3.Error:
+            self.disabled = True
+            return read_tags(record.tag_path)
+        if row and row[2] is not None and (row[0], row[1]) == signature:
+            tags = _split_tags(row[2])
+            tag_cache.put(record.tag_path, signature, tags)
+            return tags
+        tags = read_tags(record.tag_path)
+        self._queue(record, signature, tags)
+        return tags
+
+    def store_tags(self, record: FileRecord, tags: List[str]) -> None:
+        """写入标签文件后调用，记录新的文件签名，避免下次重复解析"""
+        if self.disabled:
+            return
+        try:
+            stat = os.stat(record.tag_path)
+        except OSError:
+            return
+        cleaned = [tag.strip() for tag in tags if tag.strip()]
+        self._queue(record, (stat.st_mtime_ns, stat.st_size), cleaned)
+
+    def _queue(self, record: FileRecord, signature: Tuple[int, int], tags: List[str]) -> None:
+        with self._lock:
+            self._pending[record.base_name] = (signature[0], signature[1], "\n".join(tags))
+            if len(self._pending) >= FLUSH_THRESHOLD:
+                self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._pending or self.disabled:
+                self._pending.clear()
+                return
+            rows = [(mtime, size, text, base) for base, (mtime, size, text) in self._pending.items()]
+            self._pending.clear()
+            try:
+                conn = self._connect()
+                conn.executemany(
+                    "UPDATE records SET tag_mtime_ns = ?, tag_size = ?, tags = ? WHERE base_name = ?",
+                    rows,
+                )
+                conn.commit()
+            except sqlite3.Error:
+                self.disabled = True
+
+    def close(self) -> None:
+        with self._lock:
+            self.flush()
+            if self._conn is not None:
+                try:
+                    self._conn.close()
+                except sqlite3.Error:
+                    pass
+                self._conn = None
+
+
+def _split_tags(text: str) -> List[str]:
+    return text.split("\n") if text else []
@@ -1,14 +1,17 @@
 ﻿from __future__ import annotations
 
+import heapq
 import itertools
-import shutil
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, TypeVar, Union
 
-import json
 import re
 
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtGui import QKeySequence
 from PyQt5.QtWidgets import (
     QAction,
@@ -26,6 +29,7 @@ from PyQt5.QtWidgets import (
     QMainWindow,
     QMenu,
     QMessageBox,
+    QProgressDialog,
     QPushButton,
     QScrollArea,
     QShortcut,
@@ -39,18 +43,70 @@ from PyQt5.QtWidgets import (
     QWidget,
 )
 
+from .bulk import (
+    BulkEngine,
+    BulkResult,
+    ProgressCallback,
+    RecordTransform,
+    Transform,
+    add_tags,
+    compact_tags,
+    delete_tag,
+    replace_tag,
+)
 from .commands import (
     AddTagCommand,
     ModifyTagCommand,
     RemoveTagCommand,
     ReplaceAllTagsCommand,
 )
-from .config import DEFAULT_DIRECTORY, DEFAULT_TAG_SUFFIX
-from .dto import FileRecord, TagEntry
-from .fileops import discover_records, read_tags, write_tags, set_locked, is_locked
+from .archive import is_archive
+from .backup import close_stores, migrate_bak_files, store_for, store_for_folder
+from .canonical import CanonicalError, active_map, canonical_reader, load_tables, set_active_map
+from .changelog import close_journals, export_changes, journal_for_folder
+from .config import ARCHIVE_SUFFIX, DEFAULT_DIRECTORY, DEFAULT_TAG_SUFFIX
+from .dto import DiscoveryStats, FileRecord, PackStats, TagEntry
+from .export import export_images, export_records
+from .fileops import (
+    is_locked,
+    migrate_lock_sidecars,
+    pack_dataset,
+    read_image_bytes,
+    read_tags,
+    scan_archive,
+    scan_folder,
+    scan_records,
+    scan_tree,
+    set_locked,
+    set_locked_many,
+    unpack_archive,
+    write_tags,
+)
+from .fuzzy import DEFAULT_SIMILARITY, MergeCluster, find_clusters, merge_transform
+from .importer import TagImportError, import_tags, write_import_report
+from .index import DirectoryIndex
+from .normalizer import TagKeySet, deduplicate_tag_pairs, normalize_tag_key
+from .query import QueryError, QueryResult, run_query
+from .renumber import (
+    RenamePlan,
+    execute_plan,
+    find_journals,
+    plan_delete_and_shift,
+    resume_journal,
+    rollback_journal,
+)
+from .rules import RuleError, load_rules
+from .stats import collect_stats, write_stats_csv
+from .tagcache import tag_cache
+from .tagindex import TagIndex
 from .translation import TranslationManager
 from .utils import normalize
-from .widgets import ImageViewer, TagRowWidget
+from .watcher import CREATED, DELETED, DirectoryWatcher, RecordChange, diff_records, record_position
+from .widgets import FuzzyMergeDialog, ImageViewer, StatsPanel, TagRowWidget
+
+T = TypeVar("T")
+# 外部变更超过该数量时一次归并重建记录列表，而不是逐条插入删除（每次都要移动列表元素）
+RECORD_EDIT_LIMIT = 64
 
 
 class TagEditorMainWindow(QMainWindow):
@@ -61,8 +117,21 @@ class TagEditorMainWindow(QMainWindow):
         self.translator = TranslationManager()
         self.undo_stack = QUndoStack(self)
         self.tag_suffix = DEFAULT_TAG_SUFFIX
+        self.recursive = False
         self.root_dir: Optional[Path] = None
+        self.archive_path: Optional[Path] = None
+        self.dir_index: Optional[DirectoryIndex] = None
+        self.tag_index: Optional[TagIndex] = None
+        self.query: Optional[QueryResult] = None
+        self._query_names: Set[str] = set()
+        self.stats_panel: Optional[StatsPanel] = None
+        self._stats_timer = QTimer(self)
+        self._stats_timer.setSingleShot(True)
+        self._stats_timer.setInterval(300)
+        self._stats_timer.timeout.connect(self._refresh_stats_panel)
+        self._background = ThreadPoolExecutor(max_workers=1)
         self.records: List[FileRecord] = []
+        self.discovery_stats: Optional[DiscoveryStats] = None
         self.current_index: Optional[int] = None
         self.current_record: Optional[FileRecord] = None
         self.current_tags: List[TagEntry] = []
@@ -70,6 +139,8 @@ class TagEditorMainWindow(QMainWindow):
         self._id_counter = itertools.count(1)
         self.current_locked: bool = False
         self.copied_pairs: List[Tuple[str, str]] = []
+        self.watcher = DirectoryWatcher(self)
+        self.watcher.changed.connect(self._on_filesystem_changed)
         self._build_layout()
         self._build_toolbar()
         self._bind_signals()
@@ -174,6 +245,14 @@ class TagEditorMainWindow(QMainWindow):
         compact_all_action.triggered.connect(self._compact_all_tags)
         toolbar.addAction(compact_all_action)
 
+        rules_action = QAction("规则批处理", self)
+        rules_action.triggered.connect(self._apply_rule_file)
+        toolbar.addAction(rules_action)
+
+        fuzzy_action = QAction("近似重复标签", self)
+        fuzzy_action.triggered.connect(self._merge_similar_tags)
+        toolbar.addAction(fuzzy_action)
+
         lock_all_action = QAction("锁定全部", self)
         lock_all_action.triggered.connect(lambda: self._lock_or_unlock_all(True))
         toolbar.addAction(lock_all_action)
@@ -194,6 +273,51 @@ class TagEditorMainWindow(QMainWindow):
         stats_action.triggered.connect(self._show_lock_stats)
         toolbar.addAction(stats_action)
 
+        tag_count_action = QAction("标签计数", self)
+        tag_count_action.triggered.connect(self._show_tag_count)
+        toolbar.addAction(tag_count_action)
+
+        dataset_stats_action = QAction("数据集统计", self)
+        dataset_stats_action.triggered.connect(self._show_stats_panel)
+        toolbar.addAction(dataset_stats_action)
+
+        query_action = QAction("筛选", self)
+        query_action.setShortcut(QKeySequence("Ctrl+F"))
+        query_action.triggered.connect(self._prompt_query)
+        toolbar.addAction(query_action)
+
+        manifest_action = QAction("迁移锁定清单", self)
+        manifest_action.triggered.connect(self._migrate_lock_manifest)
+        toolbar.addAction(manifest_action)
+
+        archive_menu = QMenu("归档", self)
+        open_archive_action = archive_menu.addAction("打开归档（只读）")
+        open_archive_action.triggered.connect(self.open_archive_file)
+        pack_action = archive_menu.addAction("打包当前目录")
+        pack_action.triggered.connect(self._pack_current_directory)
+        unpack_action = archive_menu.addAction("解包归档到目录")
+        unpack_action.triggered.connect(self._unpack_archive)
+
+        archive_button = QToolButton(self)
+        archive_button.setText("归档")
+        archive_button.setPopupMode(QToolButton.InstantPopup)
+        archive_button.setMenu(archive_menu)
+        toolbar.addWidget(archive_button)
+
+        backup_menu = QMenu("备份", self)
+        history_action = backup_menu.addAction("当前文件的历史版本")
+        history_action.triggered.connect(self._show_tag_history)
+        restore_all_action = backup_menu.addAction("批量恢复到初始版本")
+        restore_all_action.triggered.connect(self._restore_all_initial)
+        migrate_bak_action = backup_menu.addAction("迁移旧 .bak 备份")
+        migrate_bak_action.triggered.connect(self._migrate_bak_files)
+
+        backup_button = QToolButton(self)
+        backup_button.setText("备份")
+        backup_button.setPopupMode(QToolButton.InstantPopup)
+        backup_button.setMenu(backup_menu)
+        toolbar.addWidget(backup_button)
+
         export_menu = QMenu("导出", self)
         export_all_json_action = export_menu.addAction("导出全部标签（JSON）")
         export_all_json_action.triggered.connect(self._export_all_tags)
@@ -203,6 +327,16 @@ class TagEditorMainWindow(QMainWindow):
         export_all_txt_action.triggered.connect(self._export_all_tags_txt)
         export_images_action = export_menu.addAction("导出全部图片")
         export_images_action.triggered.connect(self._export_all_images)
+        export_changes_action = export_menu.addAction("导出变更日志（增量同步）")
+        export_changes_action.triggered.connect(self._export_changes)
+        export_menu.addSeparator()
+        import_tags_action = export_menu.addAction("从文件导入标签（JSON/JSONL/Parquet）")
+        import_tags_action.triggered.connect(self._import_tags)
+        export_menu.addSeparator()
+        load_canonical_action = export_menu.addAction("加载别名 / 蕴含表…")
+        load_canonical_action.triggered.connect(self._load_canonical_tables)
+        self.canonical_export_action = export_menu.addAction("导出时按别名表规范化")
+        self.canonical_export_action.setCheckable(True)
 
         export_button = QToolButton(self)
         export_button.setText("导出")
@@ -224,6 +358,11 @@ class TagEditorMainWindow(QMainWindow):
         suffix_action.triggered.connect(self.set_tag_suffix)
         toolbar.addAction(suffix_action)
 
+        recursive_action = QAction("递归子目录", self)
+        recursive_action.setCheckable(True)
+        recursive_action.toggled.connect(self.set_recursive)
+        toolbar.addAction(recursive_action)
+
         self.setStatusBar(QStatusBar(self))
     
     def _bind_signals(self) -> None:
@@ -260,11 +399,30 @@ class TagEditorMainWindow(QMainWindow):
         if not self.ensure_saved():
             return
         self.root_dir = folder
-        self.records = discover_records(folder, self.tag_suffix)
+        self.archive_path = None
+        if self.dir_index is None or self.dir_index.root != folder:
+            if self.dir_index is not None:
+                self.dir_index.close()
+            self.dir_index = DirectoryIndex(folder)
+        if self.recursive:
+            self.records, self.discovery_stats = scan_tree(
+                folder, self.tag_suffix, index=self.dir_index
+            )
+        else:
+            self.records, self.discovery_stats = scan_records(
+                folder, self.tag_suffix, index=self.dir_index
+            )
+        pending = find_journals({folder, *(record.tag_path.parent for record in self.records)})
+        if pending and self._recover_renumber(pending):
+            self.load_directory(folder, select_tag)
+            return
+        self._watch_dataset()
+        self._start_tag_index()
         if not self.records:
             self.current_index = None
             self.current_record = None
-            self.current_tags.clear()
+            self.watcher.watch_file(None)
+            self.current_tags = []
             self.initial_tags.clear()
             self._clear_tag_widgets()
             self.viewer.load_image(None)
@@ -278,6 +436,378 @@ class TagEditorMainWindow(QMainWindow):
                 if record.tag_path.resolve() == target_path:
                     target = idx; break
         self.open_index(target)
+        self._show_discovery_stats()
+
+    def load_archive(self, path: Path) -> None:
+        if not self.ensure_saved():
+            return
+        try:
+            records, stats = scan_archive(path)
+        except OSError as exc:
+            QMessageBox.warning(self, "打开归档", f"无法打开归档：{exc}")
+            return
+        if self.dir_index is not None:
+            self.dir_index.close()
+            self.dir_index = None
+        self.watcher.clear()
+        self.root_dir = path.parent
+        self.archive_path = path
+        self.records, self.discovery_stats = records, stats
+        self._start_tag_index()
+        self.current_index = None
+        self.current_record = None
+        if not self.records:
+            self.current_tags = []
+            self.initial_tags.clear()
+            self._clear_tag_widgets()
+            self.viewer.load_image(None)
+            self.current_locked = False
+            self._apply_lock_state()
+            self.statusBar().showMessage("归档中没有记录。"); return
+        self.open_index(0)
+        self.statusBar().showMessage(
+            f"已打开归档 {path.name}：{stats.records} 条记录（只读），用时 {stats.total_seconds * 1000:.0f} ms",
+            5000,
+        )
+
+    def open_archive_file(self) -> None:
+        start = str(self.root_dir or DEFAULT_DIRECTORY)
+        path, _ = QFileDialog.getOpenFileName(
+            self, "选择归档文件", start, f"标签归档 (*{ARCHIVE_SUFFIX});;所有文件 (*)"
+        )
+        if not path:
+            return
+        if not is_archive(Path(path)):
+            QMessageBox.warning(self, "打开归档", "所选文件不是标签归档。")
+            return
+        self.load_archive(Path(path))
+
+    @staticmethod
+    def _pack_summary(stats: PackStats) -> str:
+        return (
+            f"记录 {stats.records} 条（图片 {stats.images}，锁定 {stats.locked}），"
+            f"{stats.bytes / 1_048_576:.1f} MB，用时 {stats.seconds:.2f} s"
+        )
+
+    def _pack_current_directory(self) -> None:
+        if self.root_dir is None or self.archive_path is not None:
+            QMessageBox.information(self, "打包数据集", "请先打开一个数据集目录。")
+            return
+        if not self.ensure_saved():
+            return
+        default = str(self.root_dir.with_name(self.root_dir.name + ARCHIVE_SUFFIX))
+        path, _ = QFileDialog.getSaveFileName(
+            self, "选择归档文件", default, f"标签归档 (*{ARCHIVE_SUFFIX})"
+        )
+        if not path:
+            return
+        embed = QMessageBox.question(
+            self, "打包数据集", "是否把图片一并嵌入归档？\n选择“否”时只记录图片的相对路径。"
+        ) == QMessageBox.Yes
+        if self.dir_index is not None:
+            self.dir_index.flush()
+        try:
+            stats = pack_dataset(
+                self.root_dir,
+                Path(path),
+                self.tag_suffix,
+                recursive=self.recursive,
+                embed_images=embed,
+                index=self.dir_index,
+            )
+        except OSError as exc:
+            QMessageBox.warning(self, "打包数据集", f"打包失败：{exc}")
+            return
+        QMessageBox.information(self, "打包数据集", f"已打包到：\n{path}\n{self._pack_summary(stats)}")
+
+    def _unpack_archive(self) -> None:
+        source = self.archive_path
+        if source is None:
+            start = str(self.root_dir or DEFAULT_DIRECTORY)
+            path, _ = QFileDialog.getOpenFileName(
+                self, "选择归档文件", start, f"标签归档 (*{ARCHIVE_SUFFIX});;所有文件 (*)"
+            )
+            if not path:
+                return
+            source = Path(path)
+        target_dir = QFileDialog.getExistingDirectory(self, "选择解包目录", str(source.parent))
+        if not target_dir:
+            return
+        try:
+            stats = unpack_archive(source, Path(target_dir))
+        except OSError as exc:
+            QMessageBox.warning(self, "解包归档", f"解包失败：{exc}")
+            return
+        QMessageBox.information(self, "解包归档", f"已解包到：\n{target_dir}\n{self._pack_summary(stats)}")
+        self.load_directory(Path(target_dir))
+
+    def _start_tag_index(self) -> None:
+        """在后台线程中为当前记录建立倒排索引；建好之前批量操作退回全量遍历"""
+        if self.tag_index is not None:
+            self.tag_index.cancel()
+        self.query = None
+        self._query_names = set()
+        if self.stats_panel is not None:
+            self.stats_panel.close()
+        self.tag_index = TagIndex()
+        self._background.submit(self.tag_index.build, list(self.records), self._read_record_tags)
+
+    def _indexed_records(self, tags: List[str]) -> List[FileRecord]:
+        if self.tag_index is None or not self.tag_index.ready:
+            return self._scoped_records()
+        return self._scoped_records(self.tag_index.select(self.records, tags))
+
+    def _scoped_records(self, records: Optional[List[FileRecord]] = None) -> List[FileRecord]:
+        """筛选生效时只保留筛选结果中的记录"""
+        records = self.records if records is None else records
+        if self.query is None:
+            return records
+        return [record for record in records if record.base_name in self._query_names]
+
+    def _on_lock_changed(self, records: Iterable[FileRecord]) -> None:
+        if self.tag_index is not None:
+            self.tag_index.set_locked(records)
+        self._stats_timer.start()
+
+    def _show_stats_panel(self) -> None:
+        if self.tag_index is None or not self.records:
+            QMessageBox.information(self, "数据集统计", "当前没有可统计的文件。")
+            return
+        if not self.tag_index.ready:
+            QMessageBox.information(self, "数据集统计", "标签索引仍在后台建立，请稍后再试。")
+            return
+        if self.stats_panel is None:
+            self.stats_panel = StatsPanel(self)
+            self.stats_panel.exportRequested.connect(self._export_stats_csv)
+        self.stats_panel.show()
+        self.stats_panel.raise_()
+        self._refresh_stats_panel()
+
+    def _refresh_stats_panel(self) -> None:
+        """统计数据来自倒排索引中增量维护的计数，刷新时不扫描文件"""
+        panel = self.stats_panel
+        if panel is None or not panel.isVisible():
+            return
+        if self.tag_index is not None and self.tag_index.ready:
+            panel.show_stats(collect_stats(self.tag_index))
+
+    def _export_stats_csv(self) -> None:
+        if self.tag_index is None or not self.tag_index.ready:
+            return
+        default_dir = str(self.root_dir or Path.cwd())
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "导出统计", str(Path(default_dir) / "tag_stats.csv"), "CSV 文件 (*.csv)"
+        )
+        if not file_path:
+            return
+        try:
+            write_stats_csv(collect_stats(self.tag_index), Path(file_path))
+        except OSError as exc:
+            QMessageBox.warning(self, "导出统计", f"导出失败：{exc}")
+            return
+        self.statusBar().showMessage(f"统计已导出到 {file_path}", 3000)
+
+    def _watch_dataset(self) -> None:
+        if self.root_dir is None or self.archive_path is not None:
+            return
+        watched = {self.root_dir}
+        watched.update(record.tag_path.parent for record in self.records)
+        self.watcher.watch_directories(sorted(watched))
+        if self.current_record is not None:
+            self.watcher.watch_file(self.current_record.tag_path)
+
+    def _show_discovery_stats(self) -> None:
+        stats = self.discovery_stats
+        if stats is None:
+            return
+        if stats.from_index:
+            message = f"已从索引载入 {stats.records} 个文件，用时 {stats.total_seconds * 1000:.0f} ms"
+        else:
+            message = (
+                f"扫描 {stats.folders} 个目录 {stats.entries} 项（图片 {stats.images} / 标签 {stats.tag_files} / "
+                f"锁定 {stats.lock_files}），目录读取 {stats.scan_seconds * 1000:.0f} ms，"
+                f"配对 {stats.pair_seconds * 1000:.0f} ms"
+            )
+        self.statusBar().showMessage(message, 5000)
+
+    def _on_filesystem_changed(self, folders: set, files: set) -> None:
+        """只处理发生变化的目录与文件。
+
+        QFileSystemWatcher 的目录事件不带文件名，变化的目录仍需重新扫描一次（单次 scandir，
+        配对结果由目录索引缓存）；其余工作只涉及这些目录中的记录，与数据集总量无关。
+        只有文件事件（当前打开的标签文件被外部修改）时不扫描目录。
+        """
+        if self.root_dir is None or self.archive_path is not None:
+            return
+        by_folder = self._records_by_folder()
+        changes: List[RecordChange] = []
+        for folder in sorted(folders):
+            if not self.recursive and folder != self.root_dir:
+                continue
+            try:
+                scanned, _, subdirs = scan_folder(folder, self.tag_suffix, index=self.dir_index)
+            except OSError:
+                # 目录被删除时其中的记录全部视为已删除
+                scanned, subdirs = [], []
+            changes.extend(diff_records(by_folder.get(folder, {}).values(), scanned))
+            if self.recursive:
+                for subdir in subdirs:
+                    if subdir in by_folder:
+                        continue
+                    added, _ = scan_tree(
+                        subdir, self.tag_suffix, index=self.dir_index, root=self.root_dir
+                    )
+                    changes.extend(RecordChange(CREATED, record) for record in added)
+                    self.watcher.add_directories({subdir, *(r.tag_path.parent for r in added)})
+        self._apply_record_changes(changes)
+        if self.tag_index is not None:
+            for change in changes:
+                if change.kind == DELETED:
+                    self.tag_index.remove(change.record.base_name)
+            by_folder = self._records_by_folder()
+            touched = [record for folder in folders for record in by_folder.get(folder, {}).values()]
+            for path in files:
+                record = by_folder.get(path.parent, {}).get(path.name)
+                if record is not None and path.parent not in folders:
+                    touched.append(record)
+            touched.extend(
+                change.record
+                for change in changes
+                if change.kind == CREATED and change.record.tag_path.parent not in folders
+            )
+            self.tag_index.refresh(touched, self._read_record_tags)
+            self._stats_timer.start()
+        record = self.current_record
+        if record and (record.tag_path in files or record.tag_path.parent in folders):
+            self.watcher.watch_file(record.tag_path)
+            self._reload_current_from_disk()
+
+    def _apply_record_changes(self, changes: List[RecordChange]) -> None:
+        if not changes:
+            return
+        current = self.current_record
+        old_image = current.image_path if current else None
+        removed_at: Optional[int] = None
+        counts = {CREATED: 0, DELETED: 0}
+        by_folder = self._records_by_folder()
+        created: List[FileRecord] = []
+        deleted: Set[str] = set()
+        for change in changes:
+            pos = record_position(self.records, change.record.base_name)
+            existing = None
+            if pos < len(self.records) and self.records[pos].base_name == change.record.base_name:
+                existing = self.records[pos]
+            if change.kind == CREATED:
+                if existing is None:
+                    created.append(change.record)
+                    by_folder.setdefault(change.record.tag_path.parent, {})[change.record.tag_path.name] = change.record
+                    counts[CREATED] += 1
+            elif change.kind == DELETED:
+                if existing is None:
+                    continue
+                if existing is current and not self.undo_stack.isClean():
+                    # 保留未保存的编辑，保存时会重新生成标签文件
+                    continue
+                deleted.add(existing.base_name)
+                by_folder.get(existing.tag_path.parent, {}).pop(existing.tag_path.name, None)
+                counts[DELETED] += 1
+                if existing is current:
+                    removed_at = pos
+            elif existing is not None:
+                by_folder.get(existing.tag_path.parent, {}).pop(existing.tag_path.name, None)
+                existing.image_path = change.record.image_path
+                existing.tag_path = change.record.tag_path
+                existing.locked = change.record.locked
+                by_folder.setdefault(existing.tag_path.parent, {})[existing.tag_path.name] = existing
+                self._on_lock_changed([existing])
+        if created or deleted:
+            self._merge_records(created, deleted)
+        if removed_at is not None:
+            self.current_index = None
+            self.current_record = None
+            if self.records:
+                self.open_index(min(removed_at, len(self.records) - 1))
+            else:
+                self.current_tags = []
+                self.initial_tags.clear()
+                self._clear_tag_widgets()
+                self.viewer.load_image(None)
+                self.current_locked = False
+                self.watcher.watch_file(None)
+                self._apply_lock_state()
+        elif current is not None:
+            self.current_index = record_position(self.records, current.base_name)
+            if current.image_path != old_image:
+                self._load_record_image(current)
+            if current.locked != self.current_locked:
+                self.current_locked = current.locked
+                if current.locked and self.undo_stack.isClean():
+                    self.undo_stack.clear()
+            self._apply_lock_state()
+        self._update_status()
+        updated = len(changes) - counts[CREATED] - counts[DELETED]
+        self.statusBar().showMessage(
+            f"检测到外部变更：新增 {counts[CREATED]}，删除 {counts[DELETED]}，更新 {max(updated, 0)}",
+            3000,
+        )
+
+    def _merge_records(self, created: List[FileRecord], deleted: Set[str]) -> None:
+        """把新增与删除合并进有序的记录列表：少量变化逐条插入删除，大量变化时一次归并重建"""
+        records = self._records
+        if len(created) + len(deleted) <= RECORD_EDIT_LIMIT:
+            for base_name in deleted:
+                del records[record_position(records, base_name)]
+            for record in created:
+                records.insert(record_position(records, record.base_name), record)
+            return
+        kept = (record for record in records if record.base_name not in deleted)
+        created.sort(key=lambda record: record.base_name)
+        # 直接替换列表内容，保留按目录分组的映射
+        records[:] = heapq.merge(kept, created, key=lambda record: record.base_name)
+
+    def _reload_current_from_disk(self) -> None:
+        record = self.current_record
+        if record is None:
+            return
+        tags = self._read_record_tags(record)
+        if self.tag_index is not None:
+            self.tag_index.refresh([record], self._read_record_tags)
+        shown = [entry.english for entry in self.current_tags if entry.english.strip()]
+        if tags == shown:
+            return
+        if not self.undo_stack.isClean():
+            self.statusBar().showMessage("当前文件已被外部程序修改，保存将覆盖外部修改。", 5000)
+            return
+        self._reload_current_tags(tags)
+        self.statusBar().showMessage("当前文件已被外部程序修改，已重新载入。", 3000)
+
+    def _load_record_image(self, record: FileRecord) -> None:
+        if record.image_path is None:
+            self.viewer.load_image(None)
+        elif self.archive_path is not None:
+            self.viewer.load_image(str(record.image_path), read_image_bytes(record.image_path))
+        else:
+            self.viewer.load_image(str(record.image_path))
+
+    def _read_record_tags(self, record: FileRecord) -> List[str]:
+        if self.dir_index is not None:
+            return self.dir_index.tags_for(record)
+        return read_tags(record.tag_path)
+
+    def _write_record_tags(self, record: FileRecord, tags: List[str]) -> None:
+        self._on_tags_written(record, write_tags(record.tag_path, tags))
+
+    @staticmethod
+    def _tag_cache_summary() -> str:
+        stats = tag_cache.stats
+        return f"- 标签缓存：命中 {stats.hits} / 未命中 {stats.misses}（命中率 {stats.hit_rate:.0%}）"
+
+    def _on_tags_written(self, record: FileRecord, tags: List[str]) -> None:
+        if self.dir_index is not None:
+            self.dir_index.store_tags(record, tags)
+        if self.tag_index is not None:
+            self.tag_index.update(record, tags)
+        self._stats_timer.start()
 
     def _clear_tag_widgets(self) -> None:
         while self.tag_layout.count():
@@ -407,68 +937,45 @@ class TagEditorMainWindow(QMainWindow):
         return [normalize(part) for part in parts if normalize(part)]
 
 
-    @staticmethod
-    def _normalize_tag_key(tag: str) -> str:
-        value = tag.strip().lower()
-        if len(value) > 3 and value.endswith('ies'):
-            return value[:-3] + 'y'
-        if len(value) > 3 and value.endswith(('ses', 'xes', 'zes', 'ches', 'shes')):
-            return value[:-2]
-        if len(value) > 3 and value.endswith('s') and not value.endswith('ss'):
-            return value[:-1]
-        return value
+    @property
+    def records(self) -> List[FileRecord]:
+        return self._records
 
-    @staticmethod
-    def _is_plural_tag(tag: str) -> bool:
-        value = tag.strip().lower()
-        if len(value) > 3 and value.endswith('ies'):
-            return True
-        if len(value) > 3 and value.endswith(('ses', 'xes', 'zes', 'ches', 'shes')):
-            return True
-        if len(value) > 3 and value.endswith('s') and not value.endswith('ss'):
-            return True
-        return False
+    @records.setter
+    def records(self, records: List[FileRecord]) -> None:
+        # 整体替换时丢弃按目录分组的映射，下次外部变更时重建；外部变更本身由 _apply_record_changes 增量维护
+        self._records = records
+        self._folder_records: Optional[Dict[Path, Dict[str, FileRecord]]] = None
+
+    def _records_by_folder(self) -> Dict[Path, Dict[str, FileRecord]]:
+        """目录 → {标签文件名: 记录}，外部变更只需查看发生变化的目录，不再遍历全部记录"""
+        if self._folder_records is None:
+            folders: Dict[Path, Dict[str, FileRecord]] = {}
+            for record in self._records:
+                folders.setdefault(record.tag_path.parent, {})[record.tag_path.name] = record
+            self._folder_records = folders
+        return self._folder_records
+
+    @property
+    def current_tags(self) -> List[TagEntry]:
+        return self._current_tags
+
+    @current_tags.setter
+    def current_tags(self, entries: List[TagEntry]) -> None:
+        # 整体替换时重建比较键集合；单个增删改由 insert_entry / remove_entry / apply_entry 增量维护
+        self._current_tags = entries
+        self._tag_keys = TagKeySet(entry.english for entry in entries)
 
     def _tags_equivalent(self, first: str, second: str) -> bool:
-        return self._normalize_tag_key(first) == self._normalize_tag_key(second)
+        return normalize_tag_key(first) == normalize_tag_key(second)
 
     def _can_accept_new_tag(self, english: str, exclude_entry_id: Optional[int] = None) -> bool:
-        key = self._normalize_tag_key(english)
-        for entry in self.current_tags:
-            if exclude_entry_id and entry.entry_id == exclude_entry_id:
-                continue
-            if self._normalize_tag_key(entry.english) == key:
-                return False
-        return True
-
-    def _deduplicate_tag_pairs(
-        self, pairs: List[Tuple[str, str]]
-    ) -> Tuple[List[Tuple[str, str]], bool, List[str]]:
-        result: List[Tuple[str, str]] = []
-        seen: dict[str, int] = {}
-        changed = False
-        operations: List[str] = []
-        for english, chinese in pairs:
-            clean_en = english.strip()
-            clean_zh = chinese.strip()
-            if not clean_en:
-                changed = True
-                operations.append("移除空标签")
-                continue
-            key = self._normalize_tag_key(clean_en)
-            index = seen.get(key)
-            if index is None:
-                result.append((clean_en, clean_zh))
-                seen[key] = len(result) - 1
-                continue
-            existing_en, existing_zh = result[index]
-            if not self._is_plural_tag(existing_en) and self._is_plural_tag(clean_en):
-                result[index] = (clean_en, clean_zh)
-                operations.append(f"使用复数形式：{existing_en} → {clean_en}")
-            else:
-                operations.append(f"移除重复标签：{clean_en}")
-            changed = True
-        return result, changed, operations
+        count = self._tag_keys.count(english)
+        if count and exclude_entry_id:
+            entry = next((item for item in self._current_tags if item.entry_id == exclude_entry_id), None)
+            if entry is not None and self._tags_equivalent(entry.english, english):
+                count -= 1
+        return count == 0
 
     def _compact_current_tags(self) -> None:
         if self.current_locked:
@@ -478,7 +985,7 @@ class TagEditorMainWindow(QMainWindow):
             QMessageBox.information(self, "精简标签", "当前没有可精简的标签。")
             return
         pairs = [(entry.english, entry.chinese) for entry in self.current_tags]
-        deduped, changed, operations = self._deduplicate_tag_pairs(pairs)
+        deduped, changed, operations = deduplicate_tag_pairs(pairs)
         if not changed:
             self.statusBar().showMessage("标签已处于精简状态。", 3000)
             return
@@ -553,6 +1060,7 @@ class TagEditorMainWindow(QMainWindow):
             return
         self.current_locked = new_state
         self.records[self.current_index].locked = new_state
+        self._on_lock_changed([self.current_record])
         if new_state:
             self.undo_stack.clear()
             self.undo_stack.setClean()
@@ -600,23 +1108,10 @@ class TagEditorMainWindow(QMainWindow):
         ):
             return
 
-        success = 0
-        failures: List[str] = []
-        for idx in range(start - 1, end):
-            record = self.records[idx]
-            try:
-                set_locked(record.tag_path, True)
-                record.locked = True
-                success += 1
-            except OSError as exc:
-                failures.append(f"{record.base_name}: {exc}")
-
-        if self.current_record and start - 1 <= self.current_index <= end - 1:
-            self.current_locked = True
-            self.records[self.current_index].locked = True
-        elif self.current_record:
-            self.current_locked = is_locked(self.current_record.tag_path)
-            self.records[self.current_index].locked = self.current_locked
+        failures = self._set_records_locked(self.records[start - 1:end], True)
+        success = end - start + 1 - len(failures)
+        if self.current_record:
+            self.current_locked = self.current_record.locked
 
         self._apply_lock_state()
         self._update_status()
@@ -661,82 +1156,313 @@ class TagEditorMainWindow(QMainWindow):
         )
         if confirm != QMessageBox.Yes:
             return
-        folder = self.root_dir
-        if folder is None:
+        if self.root_dir is None:
             QMessageBox.warning(self, "删除并重排", "当前目录无效。")
             return
-        deletion_errors: List[str] = []
-        for path in folder.iterdir():
-            if not path.is_file():
-                continue
-            name = path.name
-            if name == base or name.startswith(f"{base}."):
-                try:
-                    path.unlink()
-                except OSError as exc:
-                    deletion_errors.append(f"{name}: {exc}")
-        if deletion_errors:
-            QMessageBox.warning(
-                self,
-                "删除并重排",
-                "删除文件时出现错误：\n" + "\n".join(deletion_errors[:10]),
+        # 递归模式下只在目标所在的分片目录内删除并重排
+        target_record = self.records[target_idx]
+        folder = target_record.tag_path.parent
+        following = [record for record in self.records[target_idx + 1:] if record.tag_path.parent == folder]
+        try:
+            plan = plan_delete_and_shift(
+                folder, self._record_stem(target_record), [self._record_stem(record) for record in following]
             )
+        except OSError as exc:
+            QMessageBox.warning(self, "删除并重排", f"无法规划重排：{exc}")
             return
-        rename_errors: List[str] = []
-        suffix_pattern = re.compile(r"^(.*?)(\d+)$")
-        for record in self.records[target_idx + 1:]:
-            old_base = record.base_name
-            if old_base.isdigit():
-                new_base = str(int(old_base) - 1).zfill(len(old_base))
-            else:
-                match = suffix_pattern.match(old_base)
-                if not match:
-                    rename_errors.append(f"{old_base}: 不支持的命名格式")
-                    continue
-                prefix, number = match.groups()
-                new_base = prefix + str(int(number) - 1).zfill(len(number))
-            for path in sorted(folder.iterdir()):
-                if not path.is_file():
-                    continue
-                if path.name == old_base or path.name.startswith(f"{old_base}."):
-                    new_name = new_base + path.name[len(old_base):]
-                    new_path = path.with_name(new_name)
-                    if new_path.exists():
-                        rename_errors.append(f"{path.name}: 目标 {new_name} 已存在")
-                        continue
-                    try:
-                        path.rename(new_path)
-                    except OSError as exc:
-                        rename_errors.append(f"{path.name}: {exc}")
-        self.load_directory(self.root_dir)
+        # 重命名期间暂停目录监听，完成后直接就地更新记录与索引
+        self.watcher.clear()
+        try:
+            execute_plan(plan)
+        except OSError as exc:
+            self._watch_dataset()
+            QMessageBox.warning(self, "删除并重排", str(exc))
+            return
+        self._apply_renumber(plan, target_record, following)
+        self._watch_dataset()
         if self.records:
-            new_index = min(target_idx, len(self.records) - 1)
-            self.open_index(new_index)
-        if rename_errors:
+            self.open_index(min(target_idx, len(self.records) - 1))
+        else:
+            self.current_index = None
+            self.current_record = None
+            self.current_tags = []
+            self.initial_tags.clear()
+            self._clear_tag_widgets()
+            self.viewer.load_image(None)
+            self.watcher.watch_file(None)
+            self._apply_lock_state()
+        if plan.skipped:
             QMessageBox.warning(
                 self,
                 "删除并重排",
-                "序号重排已完成，但部分文件未能重命名：\n" + "\n".join(rename_errors[:10]),
+                "序号重排已完成，以下文件命名不含序号，保持原名：\n" + "\n".join(plan.skipped[:10]),
             )
 
+    def _apply_renumber(self, plan: RenamePlan, deleted: FileRecord, following: List[FileRecord]) -> None:
+        """按重排计划就地更新记录列表、倒排索引、目录索引与标签缓存，无需重新扫描目录"""
+        folder = plan.folder
+        prefix = deleted.base_name[: len(deleted.base_name) - len(self._record_stem(deleted))]
+        for name in plan.deleted:
+            tag_cache.discard(folder / name)
+        self.records.remove(deleted)
+        if self.current_record is deleted:
+            self.current_record = None
+            self.current_index = None
+        if self.tag_index is not None:
+            self.tag_index.remove(deleted.base_name)
+        renamed = {}
+        moved_tags = {}
+        for record in following:
+            new_stem = plan.stems.get(self._record_stem(record))
+            if new_stem is None:
+                continue
+            renamed[record.base_name] = record
+            tag_cache.discard(record.tag_path)
+            record.base_name = prefix + new_stem
+            new_tag_path = folder / plan.renamed(record.tag_path.name)
+            moved_tags[record.tag_path] = new_tag_path
+            record.tag_path = new_tag_path
+            if record.image_path is not None:
+                record.image_path = folder / plan.renamed(record.image_path.name)
+        self.records.sort(key=lambda record: record.base_name)
+        self._folder_records = None
+        try:
+            store_for(deleted.tag_path).rename(moved_tags, [folder / name for name in plan.deleted])
+        except sqlite3.Error:
+            pass
+        if self.tag_index is not None:
+            self.tag_index.rename({old: record.base_name for old, record in renamed.items()})
+        if self.dir_index is not None:
+            self.dir_index.rename_records(folder, [deleted.base_name], renamed)
+        if self.query is not None:
+            self.query.records = [record for record in self.query.records if record is not deleted]
+            self.query.count = len(self.query.records)
+            self._query_names = {record.base_name for record in self.query.records}
+        self._stats_timer.start()
+
+    def _recover_renumber(self, folders: List[Path]) -> bool:
+        """处理上次中断的删除并重排；返回是否改动了文件"""
+        names = "\n".join(str(folder) for folder in folders[:10])
+        box = QMessageBox(self)
+        box.setIcon(QMessageBox.Warning)
+        box.setWindowTitle("删除并重排")
+        box.setText(f"以下目录存在未完成的删除并重排：\n{names}\n\n请选择继续完成或回滚到重排之前。")
+        resume_button = box.addButton("继续完成", QMessageBox.AcceptRole)
+        rollback_button = box.addButton("回滚", QMessageBox.DestructiveRole)
+        box.addButton("暂不处理", QMessageBox.RejectRole)
+        box.exec_()
+        clicked = box.clickedButton()
+        if clicked not in (resume_button, rollback_button):
+            return False
+        errors: List[str] = []
+        for folder in folders:
+            try:
+                if clicked is resume_button:
+                    resume_journal(folder)
+                else:
+                    rollback_journal(folder)
+            except OSError as exc:
+                errors.append(f"{folder}: {exc}")
+        if errors:
+            QMessageBox.warning(self, "删除并重排", "部分目录未能处理：\n" + "\n".join(errors[:10]))
+        return len(errors) < len(folders)
+
+    def _apply_history_tags(self, tags: List[str]) -> None:
+        translations = self.translator.translate_many(tags, "en", "zh")
+        self.undo_stack.push(ReplaceAllTagsCommand(self, list(zip(tags, translations))))
+
+    def _show_tag_history(self) -> None:
+        record = self.current_record
+        if record is None or self.archive_path is not None:
+            QMessageBox.information(self, "历史版本", "请先打开目录中的标签文件。")
+            return
+        try:
+            versions = store_for(record.tag_path).versions(record.tag_path)
+        except (OSError, sqlite3.Error) as exc:
+            QMessageBox.warning(self, "历史版本", f"无法读取备份库：{exc}")
+            return
+        if not versions:
+            QMessageBox.information(self, "历史版本", "当前文件还没有备份的历史版本。")
+            return
+        labels = []
+        for version in reversed(versions):
+            created = datetime.fromtimestamp(version.created).strftime("%Y-%m-%d %H:%M:%S")
+            preview = ", ".join(version.tags[:6]) + ("…" if len(version.tags) > 6 else "")
+            labels.append(f"{created}（{len(version.tags)} 个标签）{preview}")
+        label, ok = QInputDialog.getItem(
+            self, "历史版本", "选择要恢复的版本（覆盖前的内容，从新到旧）：", labels, 0, False
+        )
+        if not ok:
+            return
+        if self.current_locked:
+            self._editing_locked_warning()
+            return
+        version = versions[len(versions) - 1 - labels.index(label)]
+        self._apply_history_tags(version.tags)
+        self.statusBar().showMessage("已载入历史版本，保存后生效，可撤销。", 3000)
+
+    def _restore_all_initial(self) -> None:
+        if not self.records or self.root_dir is None or self.archive_path is not None:
+            QMessageBox.information(self, "批量恢复", "当前没有可恢复的文件。")
+            return
+        include_locked = (
+            QMessageBox.question(
+                self,
+                "批量恢复",
+                "将把{}恢复为备份库中最早的版本，恢复前的内容同样会被备份。\n是否同时恢复已锁定的文件？".format(
+                    "筛选结果" if self.query is not None else "全部文件"
+                ),
+                QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel,
+                QMessageBox.No,
+            )
+        )
+        if include_locked == QMessageBox.Cancel or not self.ensure_saved():
+            return
+
+        def restore(record: FileRecord, tags: List[str]) -> Tuple[List[str], List[str]]:
+            original = store_for(record.tag_path).initial(record.tag_path)
+            return (tags, []) if original is None else (original, [])
+
+        result = self._run_bulk("批量恢复", restore, include_locked == QMessageBox.Yes, per_record=True)
+        if result is None:
+            return
+        summary = ["批量恢复完成："]
+        summary.extend(self._bulk_summary(result, include_locked == QMessageBox.Yes, "无需恢复或没有备份"))
+        QMessageBox.information(self, "批量恢复", "\n".join(summary))
+
+    def _migrate_bak_files(self) -> None:
+        if self.root_dir is None or self.archive_path is not None:
+            QMessageBox.information(self, "迁移备份", "请先打开数据集目录。")
+            return
+        try:
+            migrated = migrate_bak_files(self.root_dir, self.tag_suffix, self.recursive)
+        except (OSError, sqlite3.Error) as exc:
+            QMessageBox.warning(self, "迁移备份", f"迁移失败：{exc}")
+            return
+        versions, blobs = store_for_folder(self.root_dir).counts()
+        QMessageBox.information(
+            self,
+            "迁移备份",
+            f"已把 {migrated} 个 .bak 文件导入备份库并删除。\n备份库共 {versions} 个版本，去重后 {blobs} 份内容。",
+        )
+
+    def _record_stem(self, record: FileRecord) -> str:
+        name = record.tag_path.name
+        return name[: -len(self.tag_suffix)] if name.endswith(self.tag_suffix) else record.base_name
+
+    def _set_records_locked(self, records: List[FileRecord], locked: bool) -> List[str]:
+        failed = {
+            path: exc for path, exc in set_locked_many((record.tag_path for record in records), locked)
+        }
+        failures: List[str] = []
+        for record in records:
+            exc = failed.get(record.tag_path)
+            if exc is None:
+                record.locked = locked
+            else:
+                failures.append(f"{record.base_name}: {exc}")
+        self._on_lock_changed(records)
+        return failures
+
+    def _prompt_query(self) -> None:
+        if self.tag_index is None or not self.records:
+            QMessageBox.information(self, "筛选", "当前没有可筛选的文件。")
+            return
+        if not self.tag_index.ready:
+            QMessageBox.information(self, "筛选", "标签索引仍在后台建立，请稍后再试。")
+            return
+        text, ok = QInputDialog.getText(
+            self,
+            "筛选",
+            "查询表达式（留空清除筛选）：\n"
+            "wings horns -solo is:unlocked　|　(wings OR horns) tags>20　|　\"long hair\"　|　wing*",
+            text=self.query.query if self.query else "",
+        )
+        if not ok:
+            return
+        if not text.strip():
+            self.query = None
+            self._query_names = set()
+            self._update_status()
+            self.statusBar().showMessage("已清除筛选。", 3000)
+            return
+        try:
+            result = run_query(text, self.tag_index, self.records)
+        except QueryError as exc:
+            QMessageBox.warning(self, "筛选", f"查询语法错误：{exc}")
+            return
+        if not result.records:
+            QMessageBox.information(self, "筛选", f"没有符合“{text}”的文件。")
+            return
+        self.query = result
+        self._query_names = {record.base_name for record in result.records}
+        current = self.current_record
+        if current is None or current.base_name not in self._query_names:
+            self.open_index(record_position(self.records, result.records[0].base_name))
+        self._update_status()
+        self.statusBar().showMessage(
+            f"筛选“{text}”：{result.count} 个文件，用时 {result.seconds * 1000:.1f} ms；"
+            "导航与批量操作仅作用于筛选结果",
+            5000,
+        )
+
+    def _show_tag_count(self) -> None:
+        if self.tag_index is None or not self.records:
+            QMessageBox.information(self, "标签计数", "当前没有可统计的文件。")
+            return
+        if not self.tag_index.ready:
+            QMessageBox.information(self, "标签计数", "标签索引仍在后台建立，请稍后再试。")
+            return
+        tag, ok = QInputDialog.getText(self, "标签计数", "请输入标签：")
+        tag = normalize(tag)
+        if not ok or not tag:
+            return
+        names = self.tag_index.names_with([tag])
+        locked = sum(1 for record in self.records if record.base_name in names and record.locked)
+        QMessageBox.information(
+            self,
+            "标签计数",
+            f"包含“{tag}”的文件：{len(names)} 个（其中已锁定 {locked} 个）\n"
+            "按规范化键匹配，大小写与单复数视为同一标签。",
+        )
+
+    def _migrate_lock_manifest(self) -> None:
+        if self.root_dir is None:
+            QMessageBox.information(self, "迁移锁定清单", "请先选择目录。")
+            return
+        confirm = QMessageBox.question(
+            self,
+            "迁移锁定清单",
+            "将把 .lock 文件合并为每个目录一个锁定清单（.locks）并删除原 .lock 文件，是否继续？",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No,
+        )
+        if confirm != QMessageBox.Yes:
+            return
+        folders = {self.root_dir}
+        folders.update(record.tag_path.parent for record in self.records)
+        migrated = 0
+        failures: List[str] = []
+        for folder in sorted(folders):
+            try:
+                migrated += migrate_lock_sidecars(folder)
+            except OSError as exc:
+                failures.append(f"{folder}: {exc}")
+        message = f"已迁移 {migrated} 个 .lock 文件，涉及 {len(folders)} 个目录。"
+        if failures:
+            message += "\n\n失败目录（最多显示 10 条）：\n" + "\n".join(failures[:10])
+        QMessageBox.information(self, "迁移锁定清单", message)
+
     def _lock_or_unlock_all(self, locked: bool) -> None:
         if not self.records:
             QMessageBox.information(self, "批量锁定", "当前没有可操作的文件。")
             return
         if locked and not self.save_current_file(auto=True):
             return
-        success = 0
-        failures = []
-        for record in self.records:
-            try:
-                set_locked(record.tag_path, locked)
-                record.locked = is_locked(record.tag_path)
-                success += 1
-            except OSError as exc:
-                failures.append(f"{record.base_name}: {exc}")
+        failures = self._set_records_locked(self.records, locked)
+        success = len(self.records) - len(failures)
         if self.current_record:
-            self.current_locked = is_locked(self.current_record.tag_path)
-            self.records[self.current_index].locked = self.current_locked
+            self.current_locked = self.current_record.locked
         self._apply_lock_state()
         self._update_status()
         action = "锁定" if locked else "解锁"
@@ -754,7 +1480,6 @@ class TagEditorMainWindow(QMainWindow):
         locked_files = []
         unlocked_files = []
         for record in self.records:
-            record.locked = is_locked(record.tag_path)
             if record.locked:
                 locked_files.append(record.base_name)
             else:
@@ -783,33 +1508,59 @@ class TagEditorMainWindow(QMainWindow):
         if not self.records:
             QMessageBox.information(self, "导出标签", "当前没有可导出的文件。")
             return
+        self._export_tags("导出标签", self.records)
+
+    def _export_tags(self, title: str, records: List[FileRecord]) -> None:
         default_dir = str(self.root_dir or Path.cwd())
         file_path, _ = QFileDialog.getSaveFileName(
-            self, "选择导出文件", default_dir, "JSON 文件 (*.json)"
+            self,
+            "选择导出文件",
+            default_dir,
+            "JSON 文件 (*.json);;JSON Lines 文件 (*.jsonl);;Parquet 文件（训练用） (*.parquet)",
         )
         if not file_path:
             return
-        export_data = {}
-        for record in self.records:
-            if (
-                self.current_record
-                and record.tag_path.resolve() == self.current_record.tag_path.resolve()
-            ):
-                tags = [entry.english for entry in self.current_tags if entry.english.strip()]
-            else:
-                tags = read_tags(record.tag_path)
-            export_data[record.base_name] = tags
+        target = Path(file_path)
+        if not target.suffix:
+            target = target.with_suffix(".json")
+        self._run_export(title, records, target)
+
+    def _run_export(self, title: str, records: List[FileRecord], target: Path, fmt: Optional[str] = None) -> None:
+        """在后台流式导出，显示可取消的进度；当前文件未保存的编辑一并导出"""
+        overrides = {}
+        if self.current_record is not None:
+            overrides[self.current_record.base_name] = [
+                entry.english for entry in self.current_tags if entry.english.strip()
+            ]
+        reader = self._read_record_tags
+        if self.canonical_export_action.isChecked():
+            # 只规范化导出的视图，标签文件保持不变
+            cmap = active_map()
+            reader = canonical_reader(reader, cmap)
+            overrides = {name: cmap.apply(tags)[0] for name, tags in overrides.items()}
         try:
-            with open(file_path, "w", encoding="utf-8") as fp:
-                json.dump(export_data, fp, ensure_ascii=False, indent=2)
-            QMessageBox.information(
-                self,
-                "导出标签",
-                f"已导出 {len(export_data)} 个文件的标签到：\n{file_path}",
+            result = self._run_with_progress(
+                title,
+                len(records),
+                lambda report, cancel: export_records(
+                    records, target, fmt, reader, overrides, report, cancel
+                ),
             )
         except OSError as exc:
-            QMessageBox.warning(self, "导出标签", f"导出失败：{exc}")
-
+            QMessageBox.warning(self, title, f"导出失败：{exc}")
+            return
+        if result.cancelled:
+            QMessageBox.information(self, title, "导出已取消，未生成导出文件。")
+            return
+        message = (
+            f"已导出 {result.exported} 个文件的标签到：\n{target}\n\n"
+            f"大小 {result.bytes / 1024:.0f} KB，用时 {result.seconds:.2f} s"
+            f"（{result.records_per_second:.0f} 个文件/秒）"
+        )
+        if result.failures:
+            failure_list = "\n".join(result.failures[:10])
+            message += f"\n\n以下文件导出失败（最多显示 10 条）：\n{failure_list}"
+        QMessageBox.information(self, title, message)
 
     def _compact_all_tags(self) -> None:
         if not self.records:
@@ -823,37 +1574,117 @@ class TagEditorMainWindow(QMainWindow):
         )
         if not report_path:
             return
-        report_lines: List[str] = []
-        changed_files = 0
-        skipped_locked = 0
-        for record in self.records:
-            if record.locked and is_locked(record.tag_path):
-                skipped_locked += 1
-                report_lines.append(f'{record.base_name}: 跳过（已锁定）\n')
-                continue
-            tags = read_tags(record.tag_path)
-            pairs = [(tag, '') for tag in tags]
-            deduped, changed, operations = self._deduplicate_tag_pairs(pairs)
-            if not changed:
-                # report_lines.append(f'{record.base_name}: 无变化（{len(tags)} 项）')
-                continue
-            write_tags(record.tag_path, [en for en, _ in deduped])
-            changed_files += 1
-            report_lines.append(f'{record.base_name}: 精简完成 {len(tags)} → {len(deduped)}\n')
-            if operations:
-                report_lines.extend(['  - ' + op for op in operations])
-            if (
-                self.current_record
-                and record.tag_path.resolve() == self.current_record.tag_path.resolve()
-            ):
-                self._reload_current_tags([en for en, _ in deduped])
+        result = self._run_bulk('批量精简标签', compact_tags, include_locked=False)
+        if result is None:
+            return
+        report_lines: List[str] = [
+            f'{record.base_name}: 跳过（已锁定）\n' for record in result.locked_skipped
+        ]
+        for change in result.changes:
+            report_lines.append(f'{change.record.base_name}: 精简完成 {change.old_count} → {len(change.tags)}\n')
+            if change.notes:
+                report_lines.extend(['  - ' + op for op in change.notes])
+        report_lines.extend(f'{failure}\n' for failure in result.failures)
         Path(report_path).write_text(''.join(report_lines), encoding='utf-8')
-        message = f'批量精简完成，修改 {changed_files} 个文件\n'
-        if skipped_locked:
-            message += f'，跳过锁定文件 {skipped_locked} 个\n'
+        message = f'批量精简完成，修改 {len(result.changes)} 个文件\n'
+        if result.locked_skipped:
+            message += f'，跳过锁定文件 {len(result.locked_skipped)} 个\n'
+        if result.cancelled:
+            message += f'（已取消，处理 {result.processed}/{result.total}）\n'
         QMessageBox.information(self, '批量精简标签', f"{message}报告已保存至：{report_path}\n")
         self.statusBar().showMessage(message, 5000)
 
+    def _merge_similar_tags(self) -> None:
+        """在整个标签表中查找拼写相近的标签，确认后一次批量合并到目标写法"""
+        if self.tag_index is None or not self.records:
+            QMessageBox.information(self, "近似重复标签", "当前没有可处理的文件。")
+            return
+        if not self.tag_index.ready:
+            QMessageBox.information(self, "近似重复标签", "标签索引仍在后台建立，请稍后再试。")
+            return
+        similarity, ok = QInputDialog.getDouble(
+            self,
+            "近似重复标签",
+            "相似度下限（编辑距离不超过 (1 - 相似度) × 较长标签长度）：",
+            DEFAULT_SIMILARITY,
+            0.5,
+            1.0,
+            2,
+        )
+        if not ok:
+            return
+        index = self.tag_index
+        counts = index.spelling_counts()
+
+        def search(report: ProgressCallback, cancel: threading.Event) -> List[MergeCluster]:
+            return find_clusters(counts, similarity, progress=report, cancel=cancel)
+
+        clusters = self._run_with_progress("查找近似标签", len(counts), search)
+        if not clusters:
+            QMessageBox.information(self, "近似重复标签", "没有找到拼写相近的标签。")
+            return
+        dialog = FuzzyMergeDialog(clusters, self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        merges = dialog.accepted_merges()
+        if not merges:
+            return
+        include_locked = QMessageBox.question(
+            self,
+            "近似重复标签",
+            f"将合并 {len(merges)} 种写法。\n是否同时修改已锁定的文件？",
+            QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel,
+            QMessageBox.No,
+        )
+        if include_locked == QMessageBox.Cancel or not self.ensure_saved():
+            return
+        result = self._run_bulk(
+            "合并近似标签",
+            merge_transform(merges),
+            include_locked == QMessageBox.Yes,
+            self._scoped_records(index.select_keys(self.records, merges)),
+        )
+        if result is None:
+            return
+        summary = [f"合并近似标签完成：{len(merges)} 种写法"]
+        summary.extend(self._bulk_summary(result, include_locked == QMessageBox.Yes, "不含这些写法"))
+        QMessageBox.information(self, "近似重复标签", "\n".join(summary))
+
+    def _apply_rule_file(self) -> None:
+        if not self.records:
+            QMessageBox.information(self, "规则批处理", "当前没有可处理的文件。")
+            return
+        default_dir = str(self.root_dir or Path.cwd())
+        rule_path, _ = QFileDialog.getOpenFileName(
+            self, "选择规则文件", default_dir, "规则文件 (*.json);;所有文件 (*)"
+        )
+        if not rule_path:
+            return
+        try:
+            ruleset = load_rules(Path(rule_path))
+        except (OSError, RuleError) as exc:
+            QMessageBox.warning(self, "规则批处理", f"无法载入规则：{exc}")
+            return
+        if not ruleset.rules:
+            QMessageBox.information(self, "规则批处理", "规则文件中没有规则。")
+            return
+        scope = "包含已锁定文件" if ruleset.include_locked else "跳过已锁定文件"
+        confirm = QMessageBox.question(
+            self,
+            "规则批处理",
+            "将按顺序对全部文件执行以下规则（{}）：\n{}".format(scope, "\n".join(ruleset.describe())),
+        )
+        if confirm != QMessageBox.Yes:
+            return
+        if not self.ensure_saved():
+            return
+        result = self._run_bulk("规则批处理", ruleset.compile(), ruleset.include_locked)
+        if result is None:
+            return
+        summary_lines = [f"规则“{ruleset.name}”执行完成（{len(ruleset.rules)} 条规则，单次遍历）。"]
+        summary_lines.extend(self._bulk_summary(result, ruleset.include_locked, "无需修改"))
+        QMessageBox.information(self, "规则批处理", "\n".join(summary_lines))
+
     def _export_all_tags_txt(self) -> None:
         if not self.records:
             QMessageBox.information(self, '导出标签（TXT）', '当前没有可导出的文件。')
@@ -862,28 +1693,7 @@ class TagEditorMainWindow(QMainWindow):
         target_dir = QFileDialog.getExistingDirectory(self, '选择导出文件夹', default_dir)
         if not target_dir:
             return
-        target_path = Path(target_dir)
-        success = 0
-        failures: List[str] = []
-        for record in self.records:
-            if (
-                self.current_record
-                and record.tag_path.resolve() == self.current_record.tag_path.resolve()
-            ):
-                tags = [entry.english for entry in self.current_tags if entry.english.strip()]
-            else:
-                tags = read_tags(record.tag_path)
-            export_file = target_path / f"{record.base_name}.txt"
-            try:
-                export_file.write_text(', '.join(tags), encoding='utf-8')
-                success += 1
-            except OSError as exc:
-                failures.append(f"{record.base_name}: {exc}")
-        message = f'已导出 {success} 个文件到：\n{target_path}'
-        if failures:
-            failure_list = '\n'.join(failures[:10])
-            message += f'\n\n以下文件导出失败（最多显示 10 条）：\n{failure_list}'
-        QMessageBox.information(self, '导出标签（TXT）', message)
+        self._run_export('导出标签（TXT）', self.records, Path(target_dir), "txt")
 
     def _export_all_images(self) -> None:
         if not self.records:
@@ -893,66 +1703,271 @@ class TagEditorMainWindow(QMainWindow):
         if not image_records:
             QMessageBox.information(self, '导出图片', '未找到任何图片文件。')
             return
+        if self.archive_path is not None:
+            QMessageBox.information(self, '导出图片', '归档中的图片请先解包后再导出。')
+            return
         default_dir = str(self.root_dir or Path.cwd())
         target_dir = QFileDialog.getExistingDirectory(self, '选择导出文件夹', default_dir)
         if not target_dir:
             return
+        modes = {
+            '复制': 'copy',
+            '克隆（reflink，同一文件系统且支持时，否则复制）': 'reflink',
+            '硬链接（同一文件系统时，否则复制）': 'hardlink',
+            '符号链接': 'symlink',
+        }
+        label, ok = QInputDialog.getItem(
+            self, '导出图片', '导出方式（已存在且大小、修改时间一致的图片会跳过）：', list(modes), 0, False
+        )
+        if not ok:
+            return
         target_path = Path(target_dir)
-        success = 0
-        failures: List[str] = []
-        missing = 0
-        for record in image_records:
-            image_path = record.image_path
-            if not image_path or not image_path.exists():
-                missing += 1
-                continue
-            destination = target_path / image_path.name
-            try:
-                shutil.copy2(image_path, destination)
-                success += 1
-            except OSError as exc:
-                failures.append(f"{image_path.name}: {exc}")
-        message_lines = [f'已导出 {success} 个图片文件到：', str(target_path)]
-        if missing:
-            message_lines.append(f'\n缺失图片：{missing} 个（已跳过）')
-        if failures:
-            failure_list = '\n'.join(failures[:10])
-            message_lines.append(f'\n以下图片导出失败（最多显示 10 条）：\n{failure_list}')
+        try:
+            result = self._run_with_progress(
+                '导出图片',
+                len(image_records),
+                lambda report, cancel: export_images(
+                    image_records, target_path, modes[label], progress=report, cancel=cancel
+                ),
+            )
+        except OSError as exc:
+            QMessageBox.warning(self, '导出图片', f'导出失败：{exc}')
+            return
+        message_lines = [
+            f'已导出 {result.exported} 个图片文件到：\n{target_path}\n',
+            f'\n- 已是最新（跳过）：{result.skipped} 个',
+            f'\n- 复制 {result.bytes_copied / 1_048_576:.1f} MB，链接 {result.bytes_linked / 1_048_576:.1f} MB'
+            f'（用时 {result.seconds:.2f} s）',
+        ]
+        if result.fallbacks:
+            message_lines.append(f'\n- 无法链接而改为复制：{result.fallbacks} 个')
+        if result.missing:
+            message_lines.append(f'\n- 缺失图片：{result.missing} 个（已跳过）')
+        if result.cancelled:
+            message_lines.append('\n- 已取消，已导出的图片保留')
+        if result.failures:
+            failure_list = '\n'.join(result.failures[:10])
+            message_lines.append(f'\n\n以下图片导出失败（最多显示 10 条）：\n{failure_list}')
         QMessageBox.information(self, '导出图片', ''.join(message_lines))
 
+    def _load_canonical_tables(self) -> None:
+        default_dir = str(Path("data").resolve())
+        paths, _ = QFileDialog.getOpenFileNames(
+            self,
+            "选择别名 / 蕴含表",
+            default_dir,
+            "CSV 文件 (*.csv);;所有文件 (*)",
+        )
+        if not paths:
+            return
+        try:
+            cmap = self._run_with_progress(
+                "加载别名表", 0, lambda report, cancel: load_tables(Path(path) for path in paths)
+            )
+        except (OSError, CanonicalError) as exc:
+            QMessageBox.warning(self, "加载别名表", f"加载失败：{exc}")
+            return
+        set_active_map(cmap)
+        aliases, implications, vocabulary = cmap.counts()
+        QMessageBox.information(
+            self,
+            "加载别名表",
+            f"已加载别名 {aliases} 条、蕴含 {implications} 条、规范词 {vocabulary} 个。\n"
+            "精简标签与规则中的 canonicalize 将使用这些表。",
+        )
+
+    def _export_changes(self) -> None:
+        if self.root_dir is None or self.archive_path is not None:
+            QMessageBox.information(self, '导出变更日志', '请先打开数据集目录。')
+            return
+        if not self.ensure_saved():
+            return
+        try:
+            head = journal_for_folder(self.root_dir).head()
+        except sqlite3.Error as exc:
+            QMessageBox.warning(self, '导出变更日志', f'无法读取变更日志：{exc}')
+            return
+        since, ok = QInputDialog.getInt(
+            self,
+            '导出变更日志',
+            f'当前最新序号为 {head}。\n导出该序号之后的变更（填上次同步得到的序号，0 表示全部）：',
+            0,
+            0,
+            max(head, 0),
+        )
+        if not ok:
+            return
+        default_path = str(self.root_dir / f'changes_{since}_{head}.jsonl')
+        target, _ = QFileDialog.getSaveFileName(self, '保存变更日志', default_path, 'JSON Lines (*.jsonl)')
+        if not target:
+            return
+        try:
+            result = export_changes(self.root_dir, Path(target), since, self.tag_suffix)
+        except OSError as exc:
+            QMessageBox.warning(self, '导出变更日志', f'导出失败：{exc}')
+            return
+        QMessageBox.information(
+            self,
+            '导出变更日志',
+            f'已导出序号 {result.since} 之后的 {result.exported} 条变更到：\n{target}\n\n'
+            f'下次同步请从序号 {result.head} 开始。',
+        )
+
     def _export_locked_tags(self) -> None:
         locked_records = [
-            record for record in self.records if is_locked(record.tag_path)
+            record for record in self.records if record.locked
         ]
         if not locked_records:
             QMessageBox.information(self, "导出已锁定标签", "当前没有已锁定的文件。")
             return
+        self._export_tags("导出已锁定标签", locked_records)
+
+    def _import_tags(self) -> None:
+        if not self.records:
+            QMessageBox.information(self, "导入标签", "当前没有可写入的文件。")
+            return
+        if self.archive_path is not None:
+            QMessageBox.information(self, "导入标签", "归档为只读，请先解包后再导入。")
+            return
         default_dir = str(self.root_dir or Path.cwd())
-        file_path, _ = QFileDialog.getSaveFileName(
-            self, "选择导出文件", default_dir, "JSON 文件 (*.json)"
+        source, _ = QFileDialog.getOpenFileName(
+            self, "选择导入文件", default_dir, "导出文件 (*.json *.jsonl *.parquet);;所有文件 (*)"
         )
-        if not file_path:
+        if not source:
             return
-        export_data = {}
-        for record in locked_records:
-            if (
-                self.current_record
-                and record.tag_path.resolve() == self.current_record.tag_path.resolve()
-            ):
-                tags = [entry.english for entry in self.current_tags if entry.english.strip()]
-            else:
-                tags = read_tags(record.tag_path)
-            export_data[record.base_name] = tags
-        try:
-            with open(file_path, "w", encoding="utf-8") as fp:
-                json.dump(export_data, fp, ensure_ascii=False, indent=2)
-            QMessageBox.information(
+        include_locked = (
+            QMessageBox.question(
                 self,
-                "导出已锁定标签",
-                f"已导出 {len(export_data)} 个锁定文件的标签到：\n{file_path}",
+                "导入标签",
+                "是否同时写入已锁定的文件？\n选择“否”将跳过已锁定文件。",
+                QMessageBox.Yes | QMessageBox.No,
+                QMessageBox.No,
+            )
+            == QMessageBox.Yes
+        )
+        if not self.ensure_saved():
+            return
+        records = list(self.records)
+        self.watcher.clear()
+        try:
+            result = self._run_with_progress(
+                "导入标签",
+                len(records),
+                lambda report, cancel: import_tags(
+                    Path(source), records, self._read_record_tags, include_locked, progress=report, cancel=cancel
+                ),
+            )
+        except (OSError, TagImportError) as exc:
+            QMessageBox.warning(self, "导入标签", f"导入失败：{exc}")
+            return
+        finally:
+            self._watch_dataset()
+        for change in result.bulk.changes:
+            self._on_tags_written(change.record, change.tags)
+            if change.record is self.current_record:
+                self._reload_current_tags(change.tags)
+        summary_lines = [f"读取 {result.rows} 条记录：{Path(source).name}"]
+        summary_lines.extend(self._bulk_summary(result.bulk, include_locked, "与导入内容一致"))
+        if result.unknown:
+            summary_lines.append(f"- 未找到对应文件：{result.unknown} 条")
+        if result.duplicates:
+            summary_lines.append(f"- 重复的记录名（只采用第一条）：{result.duplicates} 条")
+        summary_lines.append("\n是否保存变更报告？")
+        save = QMessageBox.question(self, "导入标签", "\n".join(summary_lines))
+        if save != QMessageBox.Yes:
+            return
+        report_path, _ = QFileDialog.getSaveFileName(
+            self, "选择报告文件", default_dir, "文本文件 (*.txt);;所有文件 (*)"
+        )
+        if not report_path:
+            return
+        try:
+            write_import_report(result, Path(report_path))
+        except OSError as exc:
+            QMessageBox.warning(self, "导入标签", f"报告保存失败：{exc}")
+            return
+        self.statusBar().showMessage(f"变更报告已保存到 {report_path}", 3000)
+
+    def _run_with_progress(self, title: str, total: int, task: Callable[[ProgressCallback, threading.Event], T]) -> T:
+        """在后台线程执行 task(report, cancel)，主线程显示可取消的进度对话框并保持界面响应"""
+        cancel = threading.Event()
+        progress = [0]
+        dialog = QProgressDialog(f"{title}：正在处理…", "取消", 0, total, self)
+        dialog.setWindowTitle(title)
+        dialog.setWindowModality(Qt.WindowModal)
+        dialog.setMinimumDuration(300)
+        dialog.canceled.connect(cancel.set)
+
+        def report(done: int, total: int) -> None:
+            progress[0] = done
+
+        with ThreadPoolExecutor(max_workers=1) as runner:
+            future = runner.submit(task, report, cancel)
+            while not future.done():
+                wait([future], timeout=0.05)
+                dialog.setValue(progress[0])
+                QApplication.processEvents()
+        dialog.reset()
+        return future.result()
+
+    def _run_bulk(
+        self,
+        title: str,
+        transform: Union[Transform, RecordTransform],
+        include_locked: bool,
+        records: Optional[List[FileRecord]] = None,
+        per_record: bool = False,
+    ) -> Optional[BulkResult]:
+        """在后台线程池中执行批量操作，显示可取消的进度对话框；完成后在主线程同步内存状态。
+
+        筛选生效时只处理筛选结果；records 为倒排索引筛出的候选记录时，其余记录计入“无需修改”。
+        """
+        scope = self._scoped_records()
+        targets = scope if records is None else records
+        engine = BulkEngine(self._read_record_tags)
+        # 批量写入期间暂停目录监听，避免自身写入触发大量重新扫描
+        self.watcher.clear()
+        try:
+            result = self._run_with_progress(
+                title,
+                len(targets),
+                lambda report, cancel: (engine.run_each if per_record else engine.run)(
+                    list(targets), transform, include_locked, report, cancel
+                ),
             )
         except OSError as exc:
-            QMessageBox.warning(self, "导出已锁定标签", f"导出失败：{exc}")
+            QMessageBox.warning(self, title, f"批量操作失败：{exc}")
+            return None
+        finally:
+            self._watch_dataset()
+        result.unchanged += len(scope) - len(targets)
+        for change in result.changes:
+            self._on_tags_written(change.record, change.tags)
+            if change.record is self.current_record:
+                self._reload_current_tags(change.tags)
+        return result
+
+    def _bulk_summary(self, result: BulkResult, include_locked: bool, unchanged_label: str) -> List[str]:
+        lines = [
+            f"- 成功更新：{len(result.changes)} 个文件",
+            f"- {unchanged_label}：{result.unchanged} 个文件",
+        ]
+        if include_locked:
+            lines.append(f"- 涉及已锁定文件修改：{result.locked_modified} 个文件")
+        else:
+            lines.append(f"- 被锁定跳过：{len(result.locked_skipped)} 个文件")
+        lines.append(f"- 写入失败：{len(result.failures)} 个文件")
+        lines.append(
+            f"- 写入速度：{result.write_stats.files_per_second:.0f} 个文件/秒"
+            f"（总耗时 {result.seconds:.2f} s）"
+        )
+        lines.append(self._tag_cache_summary())
+        if result.cancelled:
+            lines.append(f"- 已取消：处理了 {result.processed}/{result.total} 个文件，已写入的修改保留")
+        if result.failures:
+            details = "\n".join(result.failures[:10])
+            lines.append(f"\n失败详情（最多显示 10 条）：\n{details}")
+        return lines
 
     def bulk_add_tags(self) -> None:
         if not self.records:
@@ -962,55 +1977,11 @@ class TagEditorMainWindow(QMainWindow):
         if not params:
             return
         tags_to_add, include_locked = params
-
-        success = 0
-        already_present = 0
-        locked_skipped = 0
-        locked_modified = 0
-        failures: List[str] = []
-
-        for record in self.records:
-            locked = is_locked(record.tag_path)
-            if locked and not include_locked:
-                locked_skipped += 1
-                continue
-            try:
-                tags = read_tags(record.tag_path)
-            except OSError as exc:
-                failures.append(f"{record.base_name}: 读取失败（{exc}）")
-                continue
-            additions = [tag for tag in tags_to_add if tag not in tags]
-            if not additions:
-                already_present += 1
-                continue
-            new_tags = tags + additions
-            try:
-                write_tags(record.tag_path, new_tags)
-                record.locked = is_locked(record.tag_path)
-                success += 1
-                if locked:
-                    locked_modified += 1
-                if (
-                    self.current_record
-                    and record.tag_path.resolve() == self.current_record.tag_path.resolve()
-                ):
-                    self._reload_current_tags(new_tags)
-            except OSError as exc:
-                failures.append(f"{record.base_name}: 写入失败（{exc}）")
-
-        summary_lines = [
-            "批量添加标签完成。",
-            f"- 成功更新：{success} 个文件",
-            f"- 已包含全部标签：{already_present} 个文件",
-        ]
-        if include_locked:
-            summary_lines.append(f"- 涉及已锁定文件修改：{locked_modified} 个文件")
-        else:
-            summary_lines.append(f"- 被锁定跳过：{locked_skipped} 个文件")
-        summary_lines.append(f"- 写入失败：{len(failures)} 个文件")
-        if failures:
-            details = "\n".join(failures[:10])
-            summary_lines.append(f"\n失败详情（最多显示 10 条）：\n{details}")
+        result = self._run_bulk("批量添加标签", add_tags(tags_to_add), include_locked)
+        if result is None:
+            return
+        summary_lines = ["批量添加标签完成。"]
+        summary_lines.extend(self._bulk_summary(result, include_locked, "已包含全部标签"))
         QMessageBox.information(self, "批量添加标签", "\n".join(summary_lines))
 
     def bulk_replace_tag(self) -> None:
@@ -1021,54 +1992,16 @@ class TagEditorMainWindow(QMainWindow):
         if not params:
             return
         source_tag, target_tag, include_locked = params
-
-        success = 0
-        not_found = 0
-        locked_skipped = 0
-        locked_modified = 0
-        failures: List[str] = []
-
-        for record in self.records:
-            locked = is_locked(record.tag_path)
-            if locked and not include_locked:
-                locked_skipped += 1
-                continue
-            try:
-                tags = read_tags(record.tag_path)
-            except OSError as exc:
-                failures.append(f"{record.base_name}: 读取失败（{exc}）")
-                continue
-            if source_tag not in tags:
-                not_found += 1
-                continue
-            new_tags = [target_tag if tag == source_tag else tag for tag in tags]
-            try:
-                write_tags(record.tag_path, new_tags)
-                record.locked = is_locked(record.tag_path)
-                success += 1
-                if locked:
-                    locked_modified += 1
-                if (
-                    self.current_record
-                    and record.tag_path.resolve() == self.current_record.tag_path.resolve()
-                ):
-                    self._reload_current_tags(new_tags)
-            except OSError as exc:
-                failures.append(f"{record.base_name}: 写入失败（{exc}）")
-
-        summary_lines = [
-            f"批量替换标签完成：{source_tag} → {target_tag}",
-            f"- 成功更新：{success} 个文件",
-            f"- 未找到目标标签：{not_found} 个文件",
-        ]
-        if include_locked:
-            summary_lines.append(f"- 涉及已锁定文件修改：{locked_modified} 个文件")
-        else:
-            summary_lines.append(f"- 被锁定跳过：{locked_skipped} 个文件")
-        summary_lines.append(f"- 写入失败：{len(failures)} 个文件")
-        if failures:
-            details = "\n".join(failures[:10])
-            summary_lines.append(f"\n失败详情（最多显示 10 条）：\n{details}")
+        result = self._run_bulk(
+            "批量替换标签",
+            replace_tag(source_tag, target_tag),
+            include_locked,
+            self._indexed_records([source_tag]),
+        )
+        if result is None:
+            return
+        summary_lines = [f"批量替换标签完成：{source_tag} → {target_tag}"]
+        summary_lines.extend(self._bulk_summary(result, include_locked, "未找到目标标签"))
         QMessageBox.information(self, "批量替换标签", "\n".join(summary_lines))
 
     def bulk_delete_tag(self) -> None:
@@ -1079,54 +2012,13 @@ class TagEditorMainWindow(QMainWindow):
         if not params:
             return
         target, include_locked = params
-
-        success = 0
-        skipped = 0
-        locked_skipped = 0
-        locked_modified = 0
-        failures: List[str] = []
-
-        for record in self.records:
-            locked = is_locked(record.tag_path)
-            if locked and not include_locked:
-                locked_skipped += 1
-                continue
-            try:
-                tags = read_tags(record.tag_path)
-            except OSError as exc:
-                failures.append(f"{record.base_name}: 读取失败（{exc}）")
-                continue
-            if target not in tags:
-                skipped += 1
-                continue
-            new_tags = [tag for tag in tags if tag != target]
-            try:
-                write_tags(record.tag_path, new_tags)
-                record.locked = is_locked(record.tag_path)
-                success += 1
-                if locked:
-                    locked_modified += 1
-                if (
-                    self.current_record
-                    and record.tag_path.resolve() == self.current_record.tag_path.resolve()
-                ):
-                    self._reload_current_tags(new_tags)
-            except OSError as exc:
-                failures.append(f"{record.base_name}: 写入失败（{exc}）")
-
-        summary_lines = [
-            f"删除标签“{target}”完成。",
-            f"- 成功更新：{success} 个文件",
-            f"- 未找到该标签：{skipped} 个文件",
-        ]
-        if include_locked:
-            summary_lines.append(f"- 涉及已锁定文件修改：{locked_modified} 个文件")
-        else:
-            summary_lines.append(f"- 被锁定跳过：{locked_skipped} 个文件")
-        summary_lines.append(f"- 写入失败：{len(failures)} 个文件")
-        if failures:
-            details = "\n".join(failures[:10])
-            summary_lines.append(f"\n失败详情（最多显示 10 条）：\n{details}")
+        result = self._run_bulk(
+            "批量删除标签", delete_tag(target), include_locked, self._indexed_records([target])
+        )
+        if result is None:
+            return
+        summary_lines = [f"删除标签“{target}”完成。"]
+        summary_lines.extend(self._bulk_summary(result, include_locked, "未找到该标签"))
         QMessageBox.information(self, "批量删除标签", "\n".join(summary_lines))
 
     def open_index(self, index: int) -> None:
@@ -1137,9 +2029,11 @@ class TagEditorMainWindow(QMainWindow):
         self.current_index = index
         self.current_record = self.records[index]
         record = self.current_record
-        self.current_locked = record.locked or is_locked(record.tag_path)
-        self.viewer.load_image(str(record.image_path) if record.image_path else None)
-        english = read_tags(record.tag_path)
+        # 归档以只读方式打开，沿用锁定状态禁止编辑
+        self.current_locked = record.locked or self.archive_path is not None or is_locked(record.tag_path)
+        self.watcher.watch_file(record.tag_path)
+        self._load_record_image(record)
+        english = self._read_record_tags(record)
         self.initial_tags = english[:]
         translations = self.translator.translate_many(english, "en", "zh")
         self.current_tags = [TagEntry(i + 1, en, zh) for i, (en, zh) in enumerate(zip(english, translations))]
@@ -1154,8 +2048,7 @@ class TagEditorMainWindow(QMainWindow):
         start = 0 if self.current_index is None else self.current_index + 1
         for idx in range(start, len(self.records)):
             record = self.records[idx]
-            record.locked = is_locked(record.tag_path)
-            if not record.locked:
+            if not record.locked and (self.query is None or record.base_name in self._query_names):
                 self.open_index(idx)
                 return
         QMessageBox.information(self, "下一个未锁定", "后续没有未锁定的文件。")
@@ -1166,6 +2059,8 @@ class TagEditorMainWindow(QMainWindow):
     def apply_entry(self, entry_id: int, english: str, chinese: str) -> None:
         for entry in self.current_tags:
             if entry.entry_id == entry_id:
+                self._tag_keys.discard(entry.english)
+                self._tag_keys.add(english)
                 entry.english = english; entry.chinese = chinese; break
         self.refresh_lists()
 
@@ -1176,10 +2071,17 @@ class TagEditorMainWindow(QMainWindow):
             self.current_tags.append(entry)
         else:
             self.current_tags.insert(index, entry)
+        self._tag_keys.add(entry.english)
         self.refresh_lists()
 
     def remove_entry(self, entry_id: int) -> None:
-        self.current_tags = [item for item in self.current_tags if item.entry_id != entry_id]
+        kept: List[TagEntry] = []
+        for item in self.current_tags:
+            if item.entry_id == entry_id:
+                self._tag_keys.discard(item.english)
+            else:
+                kept.append(item)
+        self._current_tags = kept
         self.refresh_lists()
 
     def _handle_edit(self, entry_id: int, field: str, old: str, new: str) -> None:
@@ -1243,6 +2145,19 @@ class TagEditorMainWindow(QMainWindow):
         if self.current_locked:
             self._editing_locked_warning()
             return
+        if self.undo_stack.isClean() and self.current_record is not None and self.archive_path is None:
+            # 没有未保存的编辑时恢复到备份库中最早的版本（本工具第一次修改之前的内容）
+            try:
+                original = store_for(self.current_record.tag_path).initial(self.current_record.tag_path)
+            except (OSError, sqlite3.Error) as exc:
+                QMessageBox.warning(self, "恢复初始", f"无法读取备份库：{exc}")
+                return
+            if original is None or original == self.initial_tags:
+                self.statusBar().showMessage("当前文件已是初始状态。", 3000)
+                return
+            self._apply_history_tags(original)
+            self.statusBar().showMessage("已载入最早的备份版本，保存后生效。", 3000)
+            return
         if not self.initial_tags:
             return
         translations = self.translator.translate_many(self.initial_tags, "en", "zh")
@@ -1268,8 +2183,11 @@ class TagEditorMainWindow(QMainWindow):
         tag_name = record.tag_path.name if record.tag_path else "无标签文件"
         state_text = "🔒 已锁定" if self.current_locked else "可编辑"
         self.file_label.setText(f"当前文件：{tag_name}（{state_text}）")
+        view = ""
+        if self.query is not None:
+            view = f" | 筛选 {len(self._query_names)} 个：{self.query.query}"
         message = (
-            f"{prefix}{record.base_name} ({self.current_index + 1}/{len(self.records)}) | "
+            f"{prefix}{record.base_name} ({self.current_index + 1}/{len(self.records)}){view} | "
             f"标签 {len(self.current_tags)} | 缩放 {self.viewer.zoom_percent()}% | "
             f"翻译链 {self.translator.describe_pipeline('en', 'zh')} | "
             f"后缀 {self.tag_suffix} | 状态 {state_text}"
@@ -1284,7 +2202,7 @@ class TagEditorMainWindow(QMainWindow):
             return True
         tags = [entry.english for entry in self.current_tags if entry.english.strip()]
         try:
-            write_tags(self.current_record.tag_path, tags)
+            self._write_record_tags(self.current_record, tags)
             self.undo_stack.setClean()
             self.statusBar().showMessage("保存成功。", 3000)
             return True
@@ -1293,6 +2211,18 @@ class TagEditorMainWindow(QMainWindow):
                 QMessageBox.warning(self, "保存失败", str(exc))
             return False
 
+    def closeEvent(self, event) -> None:
+        self.watcher.clear()
+        if self.tag_index is not None:
+            self.tag_index.cancel()
+        self._background.shutdown(wait=False)
+        if self.dir_index is not None:
+            self.dir_index.close()
+        close_stores()
+        close_journals()
+        self.translator.close()
+        super().closeEvent(event)
+
     def _on_clean_changed(self, clean: bool) -> None:
         title = "标签校准工具"
         if self.current_record:
@@ -1302,27 +2232,36 @@ class TagEditorMainWindow(QMainWindow):
         self.setWindowTitle(title)
         self._update_status()
 
+    def _step_index(self, start: int, step: int) -> Optional[int]:
+        """从 start 开始按 step 方向查找下一个在当前视图（筛选结果）中的记录"""
+        index = start
+        while 0 <= index < len(self.records):
+            if self.query is None or self.records[index].base_name in self._query_names:
+                return index
+            index += step
+        return None
+
     def open_next(self) -> None:
         if not self.records:
             return
-        if self.current_index is None:
-            self.open_index(0)
-            return
-        if self.current_index >= len(self.records) - 1:
+        start = 0 if self.current_index is None else self.current_index + 1
+        target = self._step_index(start, 1)
+        if target is None:
             QMessageBox.information(self, "提示", "已经是最后一个文件。")
             return
-        self.open_index(self.current_index + 1)
+        self.open_index(target)
 
     def open_previous(self) -> None:
         if not self.records:
             return
         if self.current_index is None:
-            self.open_index(0)
-            return
-        if self.current_index <= 0:
+            target = self._step_index(0, 1)
+        else:
+            target = self._step_index(self.current_index - 1, -1)
+        if target is None:
             QMessageBox.information(self, "提示", "已经是第一个文件。")
             return
-        self.open_index(self.current_index - 1)
+        self.open_index(target)
 
     def keyPressEvent(self, event) -> None:
         if event.key() == Qt.Key_Right and not event.modifiers():
@@ -1345,6 +2284,13 @@ class TagEditorMainWindow(QMainWindow):
                 suffix = "." + suffix
             if suffix:
                 self.tag_suffix = suffix
-                if self.root_dir:
+                if self.root_dir and self.archive_path is None:
                     self.load_directory(self.root_dir)
 
+    def set_recursive(self, enabled: bool) -> None:
+        if enabled == self.recursive:
+            return
+        self.recursive = enabled
+        if self.root_dir and self.archive_path is None:
+            self.load_directory(self.root_dir)
+
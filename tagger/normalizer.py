@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import sys
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+
+from .canonical import active_map
+from .config import NORMALIZER_CACHE_SIZE
+
+_ES_PLURALS = ("ses", "xes", "zes", "ches", "shes")
+
+
+@lru_cache(maxsize=NORMALIZER_CACHE_SIZE)
+def tag_info(tag: str) -> Tuple[str, bool]:
+    """一次判断得到 (比较键, 是否复数)：小写并把常见复数形式还原为单数。
+
+    结果按原始字符串缓存（有上限的 LRU），比较键经 sys.intern 驻留，
+    整个数据集中相同的键只保存一份，字典查找可以直接比较指针。
+    """
+    value = tag.strip().lower()
+    plural = False
+    if len(value) > 3 and value[-1] == "s":
+        if value.endswith("ies"):
+            value, plural = value[:-3] + "y", True
+        elif value.endswith(_ES_PLURALS):
+            value, plural = value[:-2], True
+        elif value[-2] != "s":
+            value, plural = value[:-1], True
+    return sys.intern(value), plural
+
+
+def normalize_tag_key(tag: str) -> str:
+    """去重用的比较键：小写并把常见复数形式还原为单数"""
+    return tag_info(tag)[0]
+
+
+def is_plural_tag(tag: str) -> bool:
+    return tag_info(tag)[1]
+
+
+def deduplicate_tag_pairs(
+    pairs: List[Tuple[str, str]]
+) -> Tuple[List[Tuple[str, str]], bool, List[str]]:
+    """移除空标签与重复标签（单复数视为重复，保留复数形式），返回结果、是否变化与操作说明。
+
+    加载了别名表时先把别名替换为规范名称，同义写法因此也会被合并。
+    """
+    result: List[Tuple[str, str]] = []
+    seen: Dict[str, int] = {}
+    changed = False
+    operations: List[str] = []
+    cmap = active_map()
+    for english, chinese in pairs:
+        clean_en = english.strip()
+        clean_zh = chinese.strip()
+        if not clean_en:
+            changed = True
+            operations.append("移除空标签")
+            continue
+        if cmap:
+            canonical = cmap.canonical(clean_en)
+            if canonical != clean_en:
+                operations.append(f"别名：{clean_en} → {canonical}")
+                clean_en = canonical
+                changed = True
+        key, plural = tag_info(clean_en)
+        index = seen.get(key)
+        if index is None:
+            result.append((clean_en, clean_zh))
+            seen[key] = len(result) - 1
+            continue
+        existing_en, existing_zh = result[index]
+        if plural and not is_plural_tag(existing_en):
+            result[index] = (clean_en, clean_zh)
+            operations.append(f"使用复数形式：{existing_en} → {clean_en}")
+        else:
+            operations.append(f"移除重复标签：{clean_en}")
+        changed = True
+    return result, changed, operations
+
+
+def deduplicate_tags(tags: List[str]) -> Tuple[List[str], bool, List[str]]:
+    """只有英文标签时的去重，规则与 deduplicate_tag_pairs 相同；输入为 read_tags 解析出的已去除空白的标签。
+
+    批量精简的绝大多数文件没有重复，先用一次集合比较确认后直接返回原列表，不构造任何中间结果。
+    """
+    keys = [tag_info(tag)[0] for tag in tags]
+    if "" not in keys and len(set(keys)) == len(keys):
+        cmap = active_map()
+        if not cmap or not any(map(cmap.has_alias, tags)):
+            return tags, False, []
+    deduped, changed, operations = deduplicate_tag_pairs([(tag, "") for tag in tags])
+    return [english for english, _ in deduped], changed, operations
+
+
+class TagKeySet:
+    """一组标签的比较键多重集合，增删改时增量维护，查重不需要遍历标签列表"""
+
+    def __init__(self, tags: Iterable[str] = ()) -> None:
+        self._counts = Counter(normalize_tag_key(tag) for tag in tags)
+
+    def add(self, tag: str) -> None:
+        self._counts[normalize_tag_key(tag)] += 1
+
+    def discard(self, tag: str) -> None:
+        key = normalize_tag_key(tag)
+        count = self._counts.get(key, 0)
+        if count <= 1:
+            self._counts.pop(key, None)
+        else:
+            self._counts[key] = count - 1
+
+    def count(self, tag: str) -> int:
+        return self._counts.get(normalize_tag_key(tag), 0)
+
+    def __contains__(self, tag: str) -> bool:
+        return normalize_tag_key(tag) in self._counts
+
+    def __len__(self) -> int:
+        return sum(self._counts.values())
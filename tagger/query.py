@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import operator
+import re
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Sequence, Tuple, Union
+
+from .dto import FileRecord
+from .normalizer import normalize_tag_key
+from .tagindex import TagIndex, bit_count
+
+# 紧跟引号或括号的 - 单独成为一个记号，-"blue fur" 与 -(a | b) 才能解析为 NOT
+_TOKEN = re.compile(r'\s*(\(|\)|&|\||!|-(?=["(])|"[^"]*"|[^\s()&|!"]+)')
+_COUNT = re.compile(r"^tags(<=|>=|<|>|=)(\d+)$", re.IGNORECASE)
+_COMPARE = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "=": operator.eq,
+}
+
+# 语法树节点：("tag", key) / ("prefix", text) / ("locked", bool) / ("count", op, n)
+# / ("not", node) / ("and", [nodes]) / ("or", [nodes])
+Node = Tuple[Union[str, bool, int, list, tuple], ...]
+
+
+class QueryError(ValueError):
+    """查询表达式语法错误"""
+
+
+@dataclass
+class QueryResult:
+    query: str
+    records: List[FileRecord]
+    count: int
+    seconds: float
+
+
+def tokenize(text: str) -> List[str]:
+    tokens: List[str] = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None:
+            raise QueryError(f"无法解析：{text[position:]}")
+        tokens.append(match.group(1))
+        position = match.end()
+    return tokens
+
+
+def parse_query(text: str) -> Node:
+    """解析查询表达式。
+
+    语法：相邻条件默认 AND；支持 AND / OR / NOT（也可写作 & | ! 或前缀 -）、括号、
+    "带空格的标签"、前缀匹配 wing*、锁定状态 is:locked / is:unlocked、标签数量 tags>20。
+    """
+    parser = _Parser(tokenize(text))
+    if not parser.tokens:
+        raise QueryError("查询为空")
+    node = parser.parse_or()
+    if parser.position < len(parser.tokens):
+        raise QueryError(f"多余的内容：{' '.join(parser.tokens[parser.position:])}")
+    return node
+
+
+class _Parser:
+    def __init__(self, tokens: List[str]) -> None:
+        self.tokens = tokens
+        self.position = 0
+
+    def _peek(self) -> str:
+        return self.tokens[self.position] if self.position < len(self.tokens) else ""
+
+    def _next(self) -> str:
+        token = self._peek()
+        self.position += 1
+        return token
+
+    def parse_or(self) -> Node:
+        nodes = [self.parse_and()]
+        while self._peek().upper() in ("OR", "|"):
+            self._next()
+            nodes.append(self.parse_and())
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def parse_and(self) -> Node:
+        nodes = [self.parse_not()]
+        while self._peek() and self._peek() != ")" and self._peek().upper() not in ("OR", "|"):
+            if self._peek().upper() in ("AND", "&"):
+                self._next()
+            nodes.append(self.parse_not())
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def parse_not(self) -> Node:
+        token = self._peek()
+        if token.upper() in ("NOT", "!", "-"):
+            self._next()
+            return ("not", self.parse_not())
+        if len(token) > 1 and token.startswith("-"):
+            self.tokens[self.position] = token[1:]
+            return ("not", self.parse_not())
+        return self.parse_atom()
+
+    def parse_atom(self) -> Node:
+        token = self._next()
+        if not token:
+            raise QueryError("表达式不完整")
+        if token == "(":
+            node = self.parse_or()
+            if self._next() != ")":
+                raise QueryError("缺少右括号")
+            return node
+        if token == ")" or token.upper() in ("AND", "OR", "&", "|"):
+            raise QueryError(f"意外的 {token}")
+        if token.startswith('"'):
+            return ("tag", normalize_tag_key(token[1:-1]))
+        lowered = token.lower()
+        if lowered in ("is:locked", "is:unlocked"):
+            return ("locked", lowered == "is:locked")
+        count = _COUNT.match(token)
+        if count:
+            return ("count", count.group(1), int(count.group(2)))
+        if token.endswith("*") and len(token) > 1:
+            return ("prefix", token[:-1])
+        return ("tag", normalize_tag_key(token))
+
+
+def evaluate(node: Node, index: TagIndex) -> int:
+    """在倒排位图上求值，返回命中记录的位图"""
+    kind = node[0]
+    if kind == "tag":
+        return index.key_bitmap(node[1])
+    if kind == "prefix":
+        return index.prefix_bitmap(node[1])
+    if kind == "locked":
+        locked = index.locked_bitmap()
+        return locked if node[1] else index.universe() & ~locked
+    if kind == "count":
+        compare: Callable[[int, int], bool] = _COMPARE[node[1]]
+        limit = node[2]
+        return index.size_bitmap(lambda size: compare(size, limit))
+    if kind == "not":
+        return index.universe() & ~evaluate(node[1], index)
+    if kind == "and":
+        bits = -1
+        for child in node[1]:
+            bits &= evaluate(child, index)
+            if not bits:
+                break
+        return bits
+    if kind == "or":
+        bits = 0
+        for child in node[1]:
+            bits |= evaluate(child, index)
+        return bits
+    raise QueryError(f"未知的节点类型 {kind}")
+
+
+def run_query(text: str, index: TagIndex, records: Sequence[FileRecord]) -> QueryResult:
+    """求值并按 records 的顺序返回命中的记录"""
+    started = time.perf_counter()
+    bits = evaluate(parse_query(text), index) & index.universe()
+    names = index.names_of(bits)
+    matched = [record for record in records if record.base_name in names]
+    return QueryResult(text, matched, bit_count(bits), time.perf_counter() - started)
@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import re
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .changelog import DELETE, RENAME, log_changes
+from .config import RENUMBER_JOURNAL_NAME
+from .fileops import read_lock_manifest, write_lock_manifest
+
+JOURNAL_VERSION = 1
+
+# 日志阶段：staging 把源文件移到临时名；placing 把临时名移到目标名；committing 之后只能继续
+STAGING = "staging"
+PLACING = "placing"
+COMMITTING = "committing"
+
+_NUMBERED = re.compile(r"^(.*?)(\d+)$")
+
+
+class RenumberError(OSError):
+    """重排无法规划或执行失败"""
+
+
+@dataclass
+class RenamePlan:
+    """删除并重排的完整计划：一次目录扫描得到所有同名文件（标签、图片、.bak、.lock、.e621.txt 等）的新旧名称"""
+
+    folder: Path
+    deleted: List[str] = field(default_factory=list)
+    moves: List[Tuple[str, str]] = field(default_factory=list)
+    stems: Dict[str, str] = field(default_factory=dict)
+    skipped: List[str] = field(default_factory=list)
+    manifest: Optional[List[str]] = None
+
+    def renamed(self, name: str) -> str:
+        stem = _match_stem(name, self.stems)
+        return name if stem is None else self.stems[stem] + name[len(stem):]
+
+
+def shift_stem(stem: str, delta: int = -1) -> Optional[str]:
+    """按末尾数字平移序号并保持位数，例如 img_010 → img_009；无法平移时返回 None"""
+    match = _NUMBERED.match(stem)
+    if not match:
+        return None
+    prefix, number = match.groups()
+    value = int(number) + delta
+    if value < 0:
+        return None
+    return prefix + str(value).zfill(len(number))
+
+
+def _match_stem(name: str, stems: Dict[str, str]) -> Optional[str]:
+    """返回与文件名匹配的最长序号前缀：名称本身或“前缀.其余部分”"""
+    if name in stems:
+        return name
+    position = name.rfind(".")
+    while position > 0:
+        if name[:position] in stems:
+            return name[:position]
+        position = name.rfind(".", 0, position)
+    return None
+
+
+def plan_delete_and_shift(folder: Path, stem: str, following: Sequence[str]) -> RenamePlan:
+    """规划删除 stem 的全部同名文件，并把 following 中的序号依次前移一位。
+
+    只读取一次目录；目标名称被计划外的文件占用时在改动任何文件之前报错。
+    """
+    plan = RenamePlan(folder)
+    for old in following:
+        new = shift_stem(old)
+        if new is None:
+            plan.skipped.append(old)
+        else:
+            plan.stems[old] = new
+    owners = dict(plan.stems)
+    owners[stem] = stem
+    names: List[str] = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            # 隐藏文件（锁定清单、重排日志与临时文件）不参与重命名
+            if not entry.name.startswith(".") and entry.is_file():
+                names.append(entry.name)
+    for name in sorted(names):
+        owner = _match_stem(name, owners)
+        if owner == stem:
+            plan.deleted.append(name)
+        elif owner is not None:
+            plan.moves.append((name, plan.renamed(name)))
+    if not plan.deleted:
+        raise RenumberError(f"目录中没有 {stem} 的文件")
+    sources = {source for source, _ in plan.moves}
+    sources.update(plan.deleted)
+    occupied = set(names) - sources
+    targets: Dict[str, str] = {}
+    conflicts: List[str] = []
+    for source, target in plan.moves:
+        if target in occupied or target in targets:
+            conflicts.append(f"{source} → {target}")
+        targets[target] = source
+    if conflicts:
+        raise RenumberError("目标文件名已被占用：\n" + "\n".join(conflicts[:10]))
+    locked = read_lock_manifest(folder)
+    if locked is not None:
+        deleted = set(plan.deleted)
+        plan.manifest = sorted(plan.renamed(name) for name in locked if name not in deleted)
+    return plan
+
+
+def journal_path(folder: Path) -> Path:
+    return folder / RENUMBER_JOURNAL_NAME
+
+
+def has_journal(folder: Path) -> bool:
+    return journal_path(folder).is_file()
+
+
+def find_journals(folders: Iterable[Path]) -> List[Path]:
+    """返回存在未完成重排日志的目录"""
+    return sorted(folder for folder in set(folders) if has_journal(folder))
+
+
+def _write_journal(folder: Path, data: Dict) -> None:
+    path = journal_path(folder)
+    temp = path.with_name(path.name + ".tmp")
+    with open(temp, "w", encoding="utf-8") as fp:
+        json.dump(data, fp, ensure_ascii=False)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(temp, path)
+
+
+def _read_journal(folder: Path) -> Dict:
+    try:
+        data = json.loads(journal_path(folder).read_text(encoding="utf-8"))
+    except (OSError, ValueError) as exc:
+        raise RenumberError(f"无法读取重排日志：{exc}") from exc
+    if not isinstance(data, dict) or data.get("version") != JOURNAL_VERSION:
+        raise RenumberError("重排日志版本不受支持")
+    return data
+
+
+def _set_phase(folder: Path, data: Dict, phase: str) -> None:
+    data["phase"] = phase
+    _write_journal(folder, data)
+
+
+def _move(folder: Path, source: str, target: str) -> None:
+    # POSIX 的 rename 会静默覆盖目标，先确认目标不存在
+    destination = folder / target
+    if destination.exists():
+        raise FileExistsError(f"目标 {target} 已存在")
+    os.rename(folder / source, destination)
+
+
+def execute_plan(plan: RenamePlan) -> None:
+    """两阶段执行：先把所有相关文件移到临时名，再移到目标名，最后删除并更新锁定清单。
+
+    每个阶段开始前写入日志；中途失败会自动回滚，回滚也失败时保留日志，
+    可用 resume_journal / rollback_journal 继续处理。
+    """
+    folder = plan.folder
+    if has_journal(folder):
+        raise RenumberError("目录中存在未完成的重排，请先继续或回滚")
+    token = uuid.uuid4().hex[:8]
+    temps = (f".renumber-{token}-{index}" for index in itertools.count())
+    data = {
+        "version": JOURNAL_VERSION,
+        "phase": STAGING,
+        "deleted": [[name, next(temps)] for name in plan.deleted],
+        "moves": [[source, next(temps), target] for source, target in plan.moves],
+        "manifest": plan.manifest,
+    }
+    _write_journal(folder, data)
+    try:
+        _roll_forward(folder, data, commit=False)
+    except OSError as exc:
+        try:
+            rollback_journal(folder)
+        except OSError as rollback_exc:
+            raise RenumberError(
+                f"重排失败（{exc}），回滚也未完成（{rollback_exc}）；日志已保留，可稍后继续或回滚"
+            ) from exc
+        raise RenumberError(f"重排失败，已回滚：{exc}") from exc
+    try:
+        _commit(folder, data)
+    except OSError as exc:
+        raise RenumberError(f"重命名已完成，但清理未完成（{exc}）；日志已保留，可稍后继续") from exc
+
+
+def _roll_forward(folder: Path, data: Dict, commit: bool = True) -> None:
+    if data["phase"] == STAGING:
+        for source, temp, *_ in data["deleted"] + data["moves"]:
+            # staging 阶段尚未放置任何文件，源文件存在即说明还没有移动
+            if not (folder / temp).exists():
+                _move(folder, source, temp)
+        _set_phase(folder, data, PLACING)
+    if data["phase"] == PLACING:
+        for _, temp, target in data["moves"]:
+            if (folder / temp).exists():
+                _move(folder, temp, target)
+        _set_phase(folder, data, COMMITTING)
+    if commit:
+        _commit(folder, data)
+
+
+def _commit(folder: Path, data: Dict) -> None:
+    for _, temp in data["deleted"]:
+        try:
+            os.unlink(folder / temp)
+        except FileNotFoundError:
+            pass
+    if data.get("manifest") is not None:
+        write_lock_manifest(folder, set(data["manifest"]))
+    # 先写变更日志再删除重排日志：中途崩溃时继续执行会重复记录，但不会漏记
+    changes = [(DELETE, folder / name, None, None, None) for name, _ in data["deleted"]]
+    changes.extend((RENAME, folder / source, None, None, folder / target) for source, _, target in data["moves"])
+    log_changes(folder, changes)
+    os.unlink(journal_path(folder))
+
+
+def resume_journal(folder: Path) -> None:
+    """按日志把中断的重排执行完毕"""
+    _roll_forward(folder, _read_journal(folder))
+
+
+def rollback_journal(folder: Path) -> None:
+    """按日志把中断的重排恢复原状；进入提交阶段后文件已删除，只能继续"""
+    data = _read_journal(folder)
+    if data["phase"] == COMMITTING:
+        raise RenumberError("重排已进入提交阶段，只能继续完成")
+    if data["phase"] == PLACING:
+        for _, temp, target in data["moves"]:
+            if not (folder / temp).exists() and (folder / target).exists():
+                _move(folder, target, temp)
+    for source, temp, *_ in data["deleted"] + data["moves"]:
+        if (folder / temp).exists():
+            _move(folder, temp, source)
+    os.unlink(journal_path(folder))
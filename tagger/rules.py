@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+from .canonical import CanonicalError, active_map, load_tables
+from .normalizer import deduplicate_tags
+from .utils import normalize
+
+Step = Callable[[List[str], List[str]], List[str]]
+
+OPERATIONS = ("add", "replace", "delete", "regex", "compact", "canonicalize", "cap")
+
+
+class RuleError(ValueError):
+    """规则文件或规则参数无效"""
+
+
+@dataclass
+class RuleSet:
+    """按顺序执行的一组规则；compile() 后得到可交给 BulkEngine 的单次变换"""
+
+    rules: List[Dict[str, Any]] = field(default_factory=list)
+    include_locked: bool = False
+    name: str = ""
+
+    def compile(self) -> Callable[[List[str]], Tuple[List[str], List[str]]]:
+        steps = [_compile_rule(index, rule) for index, rule in enumerate(self.rules, start=1)]
+
+        def transform(tags: List[str]) -> Tuple[List[str], List[str]]:
+            notes: List[str] = []
+            current = list(tags)
+            for step in steps:
+                current = step(current, notes)
+            return current, notes
+
+        return transform
+
+    def describe(self) -> List[str]:
+        return [f"{index}. {_describe_rule(rule)}" for index, rule in enumerate(self.rules, start=1)]
+
+
+def load_rules(path: Path) -> RuleSet:
+    """读取 JSON 规则文件：可以是规则列表，也可以是 {"include_locked": ..., "rules": [...]}"""
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except json.JSONDecodeError as exc:
+        raise RuleError(f"规则文件不是有效的 JSON：{exc}") from exc
+    if isinstance(data, list):
+        data = {"rules": data}
+    if not isinstance(data, dict) or not isinstance(data.get("rules"), list):
+        raise RuleError("规则文件需要包含规则列表 rules")
+    ruleset = RuleSet(data["rules"], bool(data.get("include_locked", False)), path.stem)
+    # 提前编译一次，让错误在开始处理之前就暴露出来
+    ruleset.compile()
+    return ruleset
+
+
+def _tag_list(rule: Dict[str, Any], key: str) -> List[str]:
+    value = rule.get(key)
+    if isinstance(value, str):
+        value = re.split(r"[,\n]+", value)
+    if not isinstance(value, list):
+        raise RuleError(f"规则 {rule.get('op')} 缺少 {key}")
+    tags = [normalize(str(item)) for item in value]
+    return [tag for tag in tags if tag]
+
+
+def _tag(rule: Dict[str, Any], key: str) -> str:
+    value = normalize(str(rule.get(key) or ""))
+    if not value:
+        raise RuleError(f"规则 {rule.get('op')} 缺少 {key}")
+    return value
+
+
+def _compile_rule(index: int, rule: Any) -> Step:
+    if not isinstance(rule, dict):
+        raise RuleError(f"第 {index} 条规则格式无效")
+    op = rule.get("op")
+    if op == "add":
+        additions = _tag_list(rule, "tags")
+
+        def add(tags: List[str], notes: List[str]) -> List[str]:
+            return tags + [tag for tag in additions if tag not in tags]
+
+        return add
+    if op == "replace":
+        source, target = _tag(rule, "from"), _tag(rule, "to")
+
+        def replace(tags: List[str], notes: List[str]) -> List[str]:
+            return [target if tag == source else tag for tag in tags]
+
+        return replace
+    if op == "delete":
+        targets = set(_tag_list(rule, "tags")) if "tags" in rule else {_tag(rule, "tag")}
+
+        def delete(tags: List[str], notes: List[str]) -> List[str]:
+            return [tag for tag in tags if tag not in targets]
+
+        return delete
+    if op == "regex":
+        try:
+            pattern = re.compile(str(rule.get("pattern") or ""))
+        except re.error as exc:
+            raise RuleError(f"第 {index} 条规则的正则表达式无效：{exc}") from exc
+        if not pattern.pattern:
+            raise RuleError(f"第 {index} 条规则缺少 pattern")
+        replacement = str(rule.get("replacement", ""))
+
+        def rewrite(tags: List[str], notes: List[str]) -> List[str]:
+            result = []
+            for tag in tags:
+                new = normalize(pattern.sub(replacement, tag))
+                # 改写为空的标签直接移除
+                if new:
+                    result.append(new)
+            return result
+
+        return rewrite
+    if op == "compact":
+
+        def compact(tags: List[str], notes: List[str]) -> List[str]:
+            deduped, changed, operations = deduplicate_tags(tags)
+            notes.extend(operations)
+            return deduped if changed else tags
+
+        return compact
+    if op == "canonicalize":
+        tables = rule.get("tables")
+        if tables is not None and (not isinstance(tables, list) or not tables):
+            raise RuleError(f"第 {index} 条规则的 tables 需要是非空的文件列表")
+        try:
+            cmap = load_tables(Path(str(item)) for item in tables) if tables else None
+        except (OSError, CanonicalError) as exc:
+            raise RuleError(f"第 {index} 条规则无法加载别名表：{exc}") from exc
+        implications = bool(rule.get("implications", False))
+
+        def canonicalize(tags: List[str], notes: List[str]) -> List[str]:
+            table = cmap if cmap is not None else active_map()
+            if not table:
+                return tags
+            result, operations = table.apply(tags, implications)
+            notes.extend(operations)
+            return result if operations else tags
+
+        return canonicalize
+    if op == "cap":
+        max_tags = rule.get("max_tags")
+        max_chars = rule.get("max_chars")
+        if max_tags is None and max_chars is None:
+            raise RuleError(f"第 {index} 条规则需要 max_tags 或 max_chars")
+        if any(value is not None and (not isinstance(value, int) or value < 0) for value in (max_tags, max_chars)):
+            raise RuleError(f"第 {index} 条规则的上限必须是非负整数")
+
+        def cap(tags: List[str], notes: List[str]) -> List[str]:
+            result = tags[:max_tags] if max_tags is not None else list(tags)
+            if max_chars is not None:
+                # 按写入格式（", " 分隔）计算总长度，从末尾截断整条标签
+                length = sum(len(tag) for tag in result) + 2 * max(len(result) - 1, 0)
+                while result and length > max_chars:
+                    removed = result.pop()
+                    length -= len(removed) + (2 if result else 0)
+            if len(result) < len(tags):
+                notes.append(f"截断 {len(tags) - len(result)} 个标签")
+            return result
+
+        return cap
+    raise RuleError(f"第 {index} 条规则的操作 {op!r} 不受支持（可用：{', '.join(OPERATIONS)}）")
+
+
+def _describe_rule(rule: Dict[str, Any]) -> str:
+    op = rule.get("op")
+    if op == "add":
+        return f"添加 {', '.join(_tag_list(rule, 'tags'))}"
+    if op == "replace":
+        return f"替换 {rule.get('from')} → {rule.get('to')}"
+    if op == "delete":
+        return f"删除 {', '.join(_tag_list(rule, 'tags')) if 'tags' in rule else rule.get('tag')}"
+    if op == "regex":
+        return f"正则改写 {rule.get('pattern')} → {rule.get('replacement', '')}"
+    if op == "compact":
+        return "精简（去重、合并单复数）"
+    if op == "canonicalize":
+        source = "、".join(str(item) for item in rule.get("tables") or []) or "默认别名表"
+        return f"别名规范化（{source}）" + ("并补充蕴含标签" if rule.get("implications") else "")
+    limits = []
+    if rule.get("max_tags") is not None:
+        limits.append(f"最多 {rule['max_tags']} 个")
+    if rule.get("max_chars") is not None:
+        limits.append(f"最多 {rule['max_chars']} 字符")
+    return f"截断：{'，'.join(limits)}"
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import csv
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Tuple
+
+from .tagindex import TagIndex
+
+
+@dataclass
+class DatasetStats:
+    records: int = 0
+    locked: int = 0
+    tag_occurrences: int = 0
+    doc_freq: List[Tuple[str, int]] = field(default_factory=list)
+    histogram: List[Tuple[int, int]] = field(default_factory=list)
+
+    @property
+    def unlocked(self) -> int:
+        return self.records - self.locked
+
+    @property
+    def unique_tags(self) -> int:
+        return len(self.doc_freq)
+
+    @property
+    def mean_tags(self) -> float:
+        return self.tag_occurrences / self.records if self.records else 0.0
+
+
+def collect_stats(index: TagIndex) -> DatasetStats:
+    """从倒排索引中读取增量维护的计数生成快照，不读取任何标签文件；
+    标签频次按规范化键合并，显示为数据集中最常用的实际写法"""
+    sizes = index.size_counts()
+    doc_freq = sorted(index.spelling_counts().items(), key=lambda item: (-item[1], item[0]))
+    return DatasetStats(
+        records=index.record_count(),
+        locked=index.locked_count(),
+        tag_occurrences=sum(size * count for size, count in sizes.items()),
+        doc_freq=doc_freq,
+        histogram=sorted(sizes.items()),
+    )
+
+
+def write_stats_csv(stats: DatasetStats, path: Path) -> None:
+    """导出为单个 CSV：section 列区分汇总、标签频次与每文件标签数分布"""
+    with open(path, "w", encoding="utf-8-sig", newline="") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(["section", "key", "value"])
+        writer.writerow(["summary", "records", stats.records])
+        writer.writerow(["summary", "locked", stats.locked])
+        writer.writerow(["summary", "unlocked", stats.unlocked])
+        writer.writerow(["summary", "unique_tags", stats.unique_tags])
+        writer.writerow(["summary", "mean_tags_per_file", f"{stats.mean_tags:.2f}"])
+        writer.writerows(["tag_frequency", tag, count] for tag, count in stats.doc_freq)
+        writer.writerows(["tags_per_file", size, count] for size, count in stats.histogram)
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+from .config import TAG_CACHE_BYTES
+
+Signature = Tuple[int, int]
+
+_ENTRY_OVERHEAD = 240
+_TAG_OVERHEAD = 56
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class TagCache:
+    """进程级已解析标签缓存：键为路径，以 (mtime_ns, size) 校验，按估算内存大小做 LRU 淘汰"""
+
+    def __init__(self, max_bytes: int = TAG_CACHE_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[Path, Tuple[Signature, Tuple[str, ...], int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: Path, signature: Signature) -> Optional[Tuple[str, ...]]:
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != signature:
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.stats.hits += 1
+            return entry[1]
+
+    def put(self, path: Path, signature: Signature, tags: Iterable[str]) -> None:
+        values = tuple(tags)
+        size = _ENTRY_OVERHEAD + sum(_TAG_OVERHEAD + len(tag) for tag in values)
+        with self._lock:
+            previous = self._entries.pop(path, None)
+            if previous is not None:
+                self.stats.bytes -= previous[2]
+            if size > self.max_bytes:
+                self.stats.entries = len(self._entries)
+                return
+            self._entries[path] = (signature, values, size)
+            self.stats.bytes += size
+            while self.stats.bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.stats.bytes -= evicted
+                self.stats.evictions += 1
+            self.stats.entries = len(self._entries)
+
+    def discard(self, path: Path) -> None:
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry is not None:
+                self.stats.bytes -= entry[2]
+                self.stats.entries = len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.stats.bytes = 0
+            self.stats.entries = 0
+
+
+tag_cache = TagCache()
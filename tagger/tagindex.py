@@ -0,0 +1,466 @@
+from __future__ import annotations
+
+import bisect
+import os
+import sys
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from .config import BULK_WORKERS
+from .dto import FileRecord
+from .normalizer import normalize_tag_key
+
+Reader = Callable[[FileRecord], List[str]]
+Signature = Optional[Tuple[int, int]]
+
+_BIT_POSITIONS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+def _signature(record: FileRecord) -> Signature:
+    try:
+        stat = os.stat(record.tag_path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _forms_of(tags: Iterable[str]) -> FrozenSet[str]:
+    # 同一写法在大量文件中重复出现，驻留后只保存一份
+    return frozenset(sys.intern(tag.strip()) for tag in tags if tag.strip())
+
+
+def bitmap_of(ids: Iterable[int]) -> int:
+    """把记录编号集合转换为位图（Python 大整数，第 i 位表示编号 i）"""
+    ids = list(ids)
+    if not ids:
+        return 0
+    buffer = bytearray(max(ids) // 8 + 1)
+    for record_id in ids:
+        buffer[record_id >> 3] |= 1 << (record_id & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def iter_bits(bits: int) -> Iterator[int]:
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+    for offset, byte in enumerate(data):
+        if byte:
+            base = offset << 3
+            for bit in _BIT_POSITIONS[byte]:
+                yield base + bit
+
+
+def bit_count(bits: int) -> int:
+    return bin(bits).count("1")
+
+
+class _Bitmap:
+    """位图及其待合并的增删：写入只记录编号，查询时一次性用掩码合并"""
+
+    __slots__ = ("bits", "added", "removed")
+
+    def __init__(self, bits: int = 0) -> None:
+        self.bits = bits
+        self.added: Set[int] = set()
+        self.removed: Set[int] = set()
+
+    def add(self, record_id: int) -> None:
+        self.removed.discard(record_id)
+        self.added.add(record_id)
+
+    def discard(self, record_id: int) -> None:
+        self.added.discard(record_id)
+        self.removed.add(record_id)
+
+    def value(self) -> int:
+        if self.removed:
+            self.bits &= ~bitmap_of(self.removed)
+            self.removed.clear()
+        if self.added:
+            self.bits |= bitmap_of(self.added)
+            self.added.clear()
+        return self.bits
+
+
+class TagIndex:
+    """倒排索引：规范化标签键 → 记录编号的有序数组，另有按需生成的位图供布尔查询使用。
+
+    记录编号按 base_name 分配且不复用；写入时只登记增删，查询某个键时才把增量合并进有序数组
+    与位图，批量写入因此是 O(变化的标签数)，而不是每次都移动整条倒排表。
+    """
+
+    def __init__(self) -> None:
+        self.ready = False
+        self.build_seconds = 0.0
+        self._lock = threading.RLock()
+        self._ids: Dict[str, int] = {}
+        self._names: List[Optional[str]] = []
+        self._keys: Dict[int, FrozenSet[str]] = {}
+        # 每个记录实际使用的写法，以及 规范化键 → {写法: 文件数}，用于把键显示为数据集中的真实写法
+        self._forms: Dict[int, FrozenSet[str]] = {}
+        self._spellings: Dict[str, Dict[str, int]] = {}
+        self._sizes: Dict[int, int] = {}
+        self._signatures: Dict[int, Signature] = {}
+        self._postings: Dict[str, array] = {}
+        self._added: Dict[str, Set[int]] = {}
+        self._removed: Dict[str, Set[int]] = {}
+        self._bitmaps: Dict[str, _Bitmap] = {}
+        self._alive = _Bitmap()
+        self._locked = _Bitmap()
+        self._locked_ids: Set[int] = set()
+        self._doc_freq: Dict[str, int] = {}
+        self._size_counts: Dict[int, int] = {}
+        self._size_bitmaps: Optional[Dict[int, _Bitmap]] = None
+        self._sorted_keys: Optional[List[str]] = None
+        self._touched: Set[str] = set()
+        self._cancel = threading.Event()
+
+    # ---- 构建 ----
+
+    def build(self, records: Sequence[FileRecord], reader: Reader, max_workers: int = BULK_WORKERS) -> None:
+        """并行读取全部标签并建立索引；构建期间发生的写入优先于构建结果"""
+        started = time.perf_counter()
+        with self._lock:
+            self._touched.clear()
+
+        def load(record: FileRecord) -> Tuple[FileRecord, Signature, List[str]]:
+            if self._cancel.is_set():
+                return record, None, []
+            signature = _signature(record)
+            return record, signature, reader(record)
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            loaded = list(pool.map(load, records, chunksize=64))
+        if self._cancel.is_set():
+            return
+        with self._lock:
+            for record, signature, tags in loaded:
+                record_id = self._id_for(record.base_name)
+                if record.base_name in self._touched:
+                    continue
+                forms = _forms_of(tags)
+                self._forms[record_id] = forms
+                self._keys[record_id] = frozenset(normalize_tag_key(form) for form in forms)
+                self._sizes[record_id] = len(tags)
+                self._signatures[record_id] = signature
+                if record.locked:
+                    self._locked_ids.add(record_id)
+            self._rebuild_postings()
+            self._touched.clear()
+            self.ready = True
+        self.build_seconds = time.perf_counter() - started
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def _rebuild_postings(self) -> None:
+        grouped: Dict[str, List[int]] = {}
+        for record_id, keys in self._keys.items():
+            for key in keys:
+                grouped.setdefault(key, []).append(record_id)
+        self._postings = {key: array("I", sorted(ids)) for key, ids in grouped.items()}
+        self._doc_freq = {key: len(ids) for key, ids in grouped.items()}
+        self._spellings = {}
+        for forms in self._forms.values():
+            self._count_forms(forms, 1)
+        self._size_counts = {}
+        for size in self._sizes.values():
+            self._size_counts[size] = self._size_counts.get(size, 0) + 1
+        self._added.clear()
+        self._removed.clear()
+        self._bitmaps.clear()
+        self._size_bitmaps = None
+        self._sorted_keys = None
+        self._alive = _Bitmap(bitmap_of(self._keys))
+        self._locked = _Bitmap(bitmap_of(self._locked_ids))
+
+    def _id_for(self, base_name: str) -> int:
+        record_id = self._ids.get(base_name)
+        if record_id is None:
+            record_id = len(self._names)
+            self._ids[base_name] = record_id
+            self._names.append(base_name)
+        return record_id
+
+    # ---- 维护 ----
+
+    def update(self, record: FileRecord, tags: Iterable[str]) -> None:
+        """写入路径调用：只登记新旧标签键的差异"""
+        tags = [tag for tag in tags if tag.strip()]
+        forms = _forms_of(tags)
+        keys = frozenset(normalize_tag_key(form) for form in forms)
+        signature = _signature(record)
+        with self._lock:
+            self._touched.add(record.base_name)
+            record_id = self._id_for(record.base_name)
+            old = self._keys.get(record_id)
+            if old is None:
+                self._alive.add(record_id)
+                old = frozenset()
+            self._keys[record_id] = keys
+            old_forms = self._forms.get(record_id, frozenset())
+            self._forms[record_id] = forms
+            self._count_forms(old_forms - forms, -1)
+            self._count_forms(forms - old_forms, 1)
+            self._signatures[record_id] = signature
+            self._set_size(record_id, len(tags))
+            self._set_locked(record_id, record.locked)
+            for key in old - keys:
+                self._stage(key, record_id, added=False)
+            for key in keys - old:
+                self._stage(key, record_id, added=True)
+
+    def remove(self, base_name: str) -> None:
+        with self._lock:
+            self._touched.add(base_name)
+            record_id = self._ids.get(base_name)
+            if record_id is None or record_id not in self._keys:
+                return
+            for key in self._keys.pop(record_id):
+                self._stage(key, record_id, added=False)
+            self._count_forms(self._forms.pop(record_id, frozenset()), -1)
+            self._signatures.pop(record_id, None)
+            self._set_size(record_id, None)
+            self._set_locked(record_id, False)
+            self._alive.discard(record_id)
+
+    def rename(self, renames: Dict[str, str]) -> None:
+        """记录改名后调用（例如删除并重排）：编号与倒排表不变，只改写编号对应的名称"""
+        with self._lock:
+            moved = [(self._ids.pop(old), new) for old, new in renames.items() if old in self._ids]
+            for record_id, new in moved:
+                self._ids[new] = record_id
+                self._names[record_id] = new
+                self._touched.add(new)
+
+    def set_locked(self, records: Iterable[FileRecord]) -> None:
+        """锁定状态变化后调用，同步锁定位图"""
+        with self._lock:
+            for record in records:
+                record_id = self._ids.get(record.base_name)
+                if record_id is not None:
+                    self._set_locked(record_id, record.locked)
+
+    def refresh(self, records: Iterable[FileRecord], reader: Reader) -> int:
+        """外部修改后调用：只重新读取文件签名变化的记录，返回更新数量"""
+        updated = 0
+        for record in records:
+            with self._lock:
+                record_id = self._ids.get(record.base_name)
+                known = self._signatures.get(record_id) if record_id is not None else None
+                indexed = record_id is not None and record_id in self._keys
+            signature = _signature(record)
+            if indexed and signature == known:
+                continue
+            self.update(record, reader(record))
+            updated += 1
+        return updated
+
+    def _set_locked(self, record_id: int, locked: bool) -> None:
+        if locked == (record_id in self._locked_ids):
+            return
+        if locked:
+            self._locked_ids.add(record_id)
+            self._locked.add(record_id)
+        else:
+            self._locked_ids.discard(record_id)
+            self._locked.discard(record_id)
+
+    def _set_size(self, record_id: int, size: Optional[int]) -> None:
+        old = self._sizes.pop(record_id, None)
+        if size is not None:
+            self._sizes[record_id] = size
+        if old == size:
+            return
+        if old is not None:
+            remaining = self._size_counts.get(old, 0) - 1
+            if remaining > 0:
+                self._size_counts[old] = remaining
+            else:
+                self._size_counts.pop(old, None)
+        if size is not None:
+            self._size_counts[size] = self._size_counts.get(size, 0) + 1
+        if self._size_bitmaps is None:
+            return
+        if old is not None:
+            self._size_bitmaps[old].discard(record_id)
+        if size is not None:
+            self._size_bitmaps.setdefault(size, _Bitmap()).add(record_id)
+
+    def _count_forms(self, forms: Iterable[str], delta: int) -> None:
+        for form in forms:
+            key = normalize_tag_key(form)
+            counts = self._spellings.setdefault(key, {})
+            count = counts.get(form, 0) + delta
+            if count > 0:
+                counts[form] = count
+            else:
+                counts.pop(form, None)
+                if not counts:
+                    del self._spellings[key]
+
+    def _stage(self, key: str, record_id: int, added: bool) -> None:
+        frequency = self._doc_freq.get(key, 0) + (1 if added else -1)
+        if frequency > 0:
+            self._doc_freq[key] = frequency
+        else:
+            self._doc_freq.pop(key, None)
+        target, other = (self._added, self._removed) if added else (self._removed, self._added)
+        pending = other.get(key)
+        if pending is not None and record_id in pending:
+            pending.discard(record_id)
+        target.setdefault(key, set()).add(record_id)
+        if added and key not in self._postings:
+            self._sorted_keys = None
+        bitmap = self._bitmaps.get(key)
+        if bitmap is not None:
+            if added:
+                bitmap.add(record_id)
+            else:
+                bitmap.discard(record_id)
+
+    def _merged(self, key: str) -> array:
+        added = self._added.pop(key, None)
+        removed = self._removed.pop(key, None)
+        current = self._postings.get(key)
+        if not added and not removed:
+            return current if current is not None else array("I")
+        ids = set(current) if current is not None else set()
+        if removed:
+            ids.difference_update(removed)
+        if added:
+            ids.update(added)
+        merged = array("I", sorted(ids))
+        if merged:
+            if current is None:
+                self._sorted_keys = None
+            self._postings[key] = merged
+        else:
+            self._postings.pop(key, None)
+            self._bitmaps.pop(key, None)
+            self._sorted_keys = None
+        return merged
+
+    # ---- 查询 ----
+
+    def postings(self, tag: str) -> array:
+        with self._lock:
+            return self._merged(normalize_tag_key(tag))
+
+    def count(self, tag: str) -> int:
+        return len(self.postings(tag))
+
+    def names_with(self, tags: Iterable[str]) -> Set[str]:
+        """包含任一给定标签（按规范化键比较）的记录名"""
+        return self.names_with_keys(normalize_tag_key(tag) for tag in tags)
+
+    def names_with_keys(self, keys: Iterable[str]) -> Set[str]:
+        """包含任一给定规范化键的记录名；键来自 tag_counts() 时使用，避免再次规范化"""
+        with self._lock:
+            ids: Set[int] = set()
+            for key in keys:
+                ids.update(self._merged(key))
+            return {self._names[record_id] for record_id in ids}
+
+    def select(self, records: Sequence[FileRecord], tags: Iterable[str]) -> List[FileRecord]:
+        """从 records 中筛出可能包含给定标签的记录，保持原有顺序"""
+        names = self.names_with(tags)
+        return [record for record in records if record.base_name in names]
+
+    def select_keys(self, records: Sequence[FileRecord], keys: Iterable[str]) -> List[FileRecord]:
+        names = self.names_with_keys(keys)
+        return [record for record in records if record.base_name in names]
+
+    def tag_counts(self) -> Dict[str, int]:
+        """每个规范化标签出现在多少个文件中（随写入增量维护，无需合并倒排表）"""
+        with self._lock:
+            return dict(self._doc_freq)
+
+    def spelling(self, key: str) -> str:
+        """规范化键在数据集中最常用的写法（文件数相同时取字典序最小的），键不存在时原样返回"""
+        with self._lock:
+            return self._spelling(key)
+
+    def _spelling(self, key: str) -> str:
+        counts = self._spellings.get(key)
+        if not counts:
+            return key
+        return min(counts, key=lambda form: (-counts[form], form))
+
+    def spelling_counts(self) -> Dict[str, int]:
+        """与 tag_counts() 相同的文件数，但以每个键最常用的实际写法为键"""
+        with self._lock:
+            return {self._spelling(key): count for key, count in self._doc_freq.items()}
+
+    def size_counts(self) -> Dict[int, int]:
+        """标签数量 → 文件数 的分布"""
+        with self._lock:
+            return dict(self._size_counts)
+
+    def record_count(self) -> int:
+        with self._lock:
+            return len(self._keys)
+
+    def locked_count(self) -> int:
+        with self._lock:
+            return len(self._locked_ids)
+
+    # ---- 位图 ----
+
+    def key_bitmap(self, key: str) -> int:
+        """单个规范化键的位图；首次查询时由有序数组生成，之后随写入增量维护"""
+        with self._lock:
+            bitmap = self._bitmaps.get(key)
+            if bitmap is None:
+                ids = self._merged(key)
+                if not ids:
+                    return 0
+                bitmap = self._bitmaps[key] = _Bitmap(bitmap_of(ids))
+            return bitmap.value()
+
+    def tag_bitmap(self, tag: str) -> int:
+        return self.key_bitmap(normalize_tag_key(tag))
+
+    def prefix_bitmap(self, prefix: str) -> int:
+        prefix = prefix.strip().lower()
+        with self._lock:
+            if self._sorted_keys is None:
+                for key in list(self._added):
+                    self._merged(key)
+                self._sorted_keys = sorted(self._postings)
+            keys = self._sorted_keys
+            bits = 0
+            start = bisect.bisect_left(keys, prefix)
+            for key in keys[start:]:
+                if not key.startswith(prefix):
+                    break
+                bits |= self.key_bitmap(key)
+            return bits
+
+    def universe(self) -> int:
+        with self._lock:
+            return self._alive.value()
+
+    def locked_bitmap(self) -> int:
+        with self._lock:
+            return self._locked.value() & self._alive.value()
+
+    def size_bitmap(self, accept: Callable[[int], bool]) -> int:
+        """标签数量满足条件的记录位图，各数量一张位图，按需合并"""
+        with self._lock:
+            if self._size_bitmaps is None:
+                grouped: Dict[int, List[int]] = {}
+                for record_id, size in self._sizes.items():
+                    grouped.setdefault(size, []).append(record_id)
+                self._size_bitmaps = {size: _Bitmap(bitmap_of(ids)) for size, ids in grouped.items()}
+            bits = 0
+            for size, bitmap in self._size_bitmaps.items():
+                if accept(size):
+                    bits |= bitmap.value()
+            return bits
+
+    def names_of(self, bits: int) -> Set[str]:
+        with self._lock:
+            return {self._names[record_id] for record_id in iter_bits(bits)}
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .config import TRANSLATION_CACHE_FLUSH, TRANSLATION_CACHE_PATH
+
+# SQLite 单条语句的参数个数上限较低，批量查询按块进行
+_QUERY_CHUNK = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS translations (
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    text TEXT NOT NULL,
+    translation TEXT NOT NULL,
+    translator TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (source, target, text)
+) WITHOUT ROWID;
+"""
+
+
+class TranslationCache:
+    """按 (源语言, 目标语言, 文本) 保存的持久翻译缓存，记录每条译文的来源翻译器与时间。
+
+    保存在 data/translation_cache.sqlite3 中，首次查询某个语言方向时一次读入该方向的全部译文，
+    之后命中都在内存中完成；内存未命中的文本再批量查询一次数据库，可以拿到其他进程新写入的译文。
+    新译文先暂存，累计 TRANSLATION_CACHE_FLUSH 条或调用 flush() 时在一个事务中写回；
+    数据库使用 WAL 模式，界面与命令行工具可以同时读写。数据库不可用时退化为只在内存中缓存。
+    """
+
+    def __init__(self, path: Path = TRANSLATION_CACHE_PATH) -> None:
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._broken = False
+        self._entries: Dict[Tuple[str, str, str], str] = {}
+        self._loaded: Set[Tuple[str, str]] = set()
+        self._pending: List[Tuple[str, str, str, str, str, float]] = []
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self._conn is None and not self._broken:
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                conn.commit()
+                self._conn = conn
+            except (OSError, sqlite3.Error):
+                self._broken = True
+        return self._conn
+
+    def _load(self, source: str, target: str) -> None:
+        if (source, target) in self._loaded:
+            return
+        self._loaded.add((source, target))
+        conn = self._connect()
+        if conn is None:
+            return
+        try:
+            rows = conn.execute(
+                "SELECT text, translation FROM translations WHERE source = ? AND target = ?", (source, target)
+            ).fetchall()
+        except sqlite3.Error:
+            return
+        for text, translation in rows:
+            self._entries.setdefault((source, target, text), translation)
+
+    def get(self, source: str, target: str, text: str) -> Optional[str]:
+        return self.get_many(source, target, [text]).get(text)
+
+    def get_many(self, source: str, target: str, texts: Iterable[str]) -> Dict[str, str]:
+        """返回已缓存的译文（文本 → 译文），未缓存的文本不出现在结果中"""
+        found: Dict[str, str] = {}
+        with self._lock:
+            self._load(source, target)
+            missing = []
+            for text in texts:
+                translation = self._entries.get((source, target, text))
+                if translation is None:
+                    missing.append(text)
+                else:
+                    found[text] = translation
+            conn = self._connect() if missing else None
+            if conn is None:
+                return found
+            missing = list(dict.fromkeys(missing))
+            try:
+                for start in range(0, len(missing), _QUERY_CHUNK):
+                    chunk = missing[start : start + _QUERY_CHUNK]
+                    rows = conn.execute(
+                        "SELECT text, translation FROM translations WHERE source = ? AND target = ? "
+                        f"AND text IN ({', '.join('?' * len(chunk))})",
+                        (source, target, *chunk),
+                    ).fetchall()
+                    for text, translation in rows:
+                        self._entries[(source, target, text)] = translation
+                        found[text] = translation
+            except sqlite3.Error:
+                pass
+        return found
+
+    def put(self, source: str, target: str, text: str, translation: str, translator: Optional[str]) -> None:
+        """登记译文；translator 为 None（所有翻译器都失败时原样返回的文本）只保留在内存中，下次启动会重新翻译"""
+        with self._lock:
+            self._entries[(source, target, text)] = translation
+            if translator is None:
+                return
+            self._pending.append((source, target, text, translation, translator, time.time()))
+            if len(self._pending) >= TRANSLATION_CACHE_FLUSH:
+                self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._pending:
+                return
+            conn = self._connect()
+            rows, self._pending = self._pending, []
+            if conn is None:
+                return
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO translations (source, target, text, translation, translator, created) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+            except sqlite3.Error:
+                pass
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def close(self) -> None:
+        with self._lock:
+            self.flush()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -1,16 +1,44 @@
 from __future__ import annotations
 
-from typing import Dict, Iterable, List, Optional, Tuple
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import quote
 
 import requests
+from requests.adapters import HTTPAdapter
 
-from .config import LIBRE_TRANSLATE_ENDPOINT, ensure_dictionary_file, DICTIONARY_PATH
+from .config import (
+    DICTIONARY_PATH,
+    GOOGLE_PACK_BYTES,
+    GOOGLE_TRANSLATE_ENDPOINT,
+    LIBRE_TRANSLATE_ENDPOINT,
+    TRANSLATION_DEADLINE,
+    TRANSLATION_TIMEOUT,
+    ensure_dictionary_file,
+)
+from .transcache import TranslationCache
 
-CacheKey = Tuple[str, str, str]
+
+def pooled_session(size: int) -> requests.Session:
+    """连接池大小与并发数一致的会话，并发请求复用已建立的 TLS 连接而不是各自握手"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, size))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
 
 class BaseTranslator:
     name = "base"
+    # 同时发出的请求数上限；本地翻译器保持 1，逐条执行
+    concurrency = 1
+    deadline = TRANSLATION_DEADLINE
+
+    def __init__(self) -> None:
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
 
     @property
     def available(self) -> bool:
@@ -22,19 +50,59 @@ class BaseTranslator:
     def translate_many(
         self, texts: Iterable[str], source: str, target: str
     ) -> List[Optional[str]]:
-        return [self.translate(text, source, target) for text in texts]
+        return self._translate_each(list(texts), source, target)
+
+    def _translate_each(
+        self, items: List[str], source: str, target: str, timeout: Optional[float] = None
+    ) -> List[Optional[str]]:
+        """逐条翻译；concurrency 大于 1 时并发执行，总耗时接近单次请求。
+
+        相同文本只请求一次；超过 timeout（默认 deadline）仍未返回的文本记为 None，由调用方交给下一个翻译器。
+        """
+        unique = list(dict.fromkeys(items))
+        if self.concurrency <= 1 or len(unique) <= 1:
+            serial = {text: self.translate(text, source, target) for text in unique}
+            return [serial[text] for text in items]
+        pool = self._pool()
+        futures = {text: pool.submit(self.translate, text, source, target) for text in unique}
+        done, _ = wait(futures.values(), timeout=self.deadline if timeout is None else timeout)
+        translated: Dict[str, Optional[str]] = {}
+        for text, future in futures.items():
+            if future in done and future.exception() is None:
+                translated[text] = future.result()
+            else:
+                future.cancel()
+                translated[text] = None
+        return [translated[text] for text in items]
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.concurrency, thread_name_prefix=f"translate-{self.name}"
+                )
+            return self._executor
+
+    def close(self) -> None:
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
 
 
 class GoogleTranslateTranslator(BaseTranslator):
     name = "Google"
-    _endpoint = "https://translate.googleapis.com/translate_a/single"
+    concurrency = 8
+    # 打包时的分隔符：接口按行分句并保留换行，标签本身不含换行
+    delimiter = "\n"
 
-    def __init__(self) -> None:
-        self.session = requests.Session()
+    def __init__(self, endpoint: str = GOOGLE_TRANSLATE_ENDPOINT, pack_bytes: int = GOOGLE_PACK_BYTES) -> None:
+        super().__init__()
+        self.endpoint = endpoint
+        self.pack_bytes = pack_bytes
+        self.session = pooled_session(self.concurrency)
 
-    def translate(self, text: str, source: str, target: str) -> Optional[str]:
-        if not text.strip():
-            return ""
+    def _request(self, text: str, source: str, target: str) -> Optional[str]:
         params = {
             "client": "gtx",
             "sl": source,
@@ -43,23 +111,98 @@ class GoogleTranslateTranslator(BaseTranslator):
             "q": text,
         }
         try:
-            resp = self.session.get(self._endpoint, params=params, timeout=8)
+            resp = self.session.get(self.endpoint, params=params, timeout=TRANSLATION_TIMEOUT)
             resp.raise_for_status()
             data = resp.json()
         except Exception:
             return None
         try:
-            return "".join(part[0] for part in data[0]).strip()
+            return "".join(part[0] for part in data[0] if part[0])
         except Exception:
             return None
 
+    def translate(self, text: str, source: str, target: str) -> Optional[str]:
+        if not text.strip():
+            return ""
+        translated = self._request(text, source, target)
+        return None if translated is None else translated.strip()
+
+    def translate_many(
+        self, texts: Iterable[str], source: str, target: str
+    ) -> List[Optional[str]]:
+        """把多个标签按行拼成一个请求，整个文件通常只需一到两次请求。
+
+        所有包并发发送，整批受 deadline 约束；行数对不上的包改为逐条并发翻译，使用剩余的时限。
+        """
+        started = time.monotonic()
+        items = list(texts)
+        unique = [text for text in dict.fromkeys(items) if text.strip()]
+        packs = self._pack(unique)
+        translated: Dict[str, Optional[str]] = {}
+        misaligned: List[str] = []
+        if packs:
+            pool = self._pool()
+            futures = [pool.submit(self._translate_pack, pack, source, target) for pack in packs]
+            done, _ = wait(futures, timeout=self.deadline)
+            for pack, future in zip(packs, futures):
+                if future in done and future.exception() is None:
+                    outputs = future.result()
+                    if outputs is None:
+                        misaligned.extend(pack)
+                    else:
+                        translated.update(zip(pack, outputs))
+                else:
+                    future.cancel()
+                    translated.update((text, None) for text in pack)
+        if misaligned:
+            remaining = max(0.0, self.deadline - (time.monotonic() - started))
+            translated.update(zip(misaligned, self._translate_each(misaligned, source, target, remaining)))
+        return [translated.get(text) if text.strip() else "" for text in items]
+
+    def _pack(self, items: List[str]) -> List[List[str]]:
+        """按 URL 编码后的长度把标签分成若干包；含分隔符的文本单独成包"""
+        packs: List[List[str]] = []
+        current: List[str] = []
+        size = 0
+        separator = len(quote(self.delimiter))
+        for text in items:
+            cost = len(quote(text)) + separator
+            if self.delimiter in text or (current and size + cost > self.pack_bytes):
+                if current:
+                    packs.append(current)
+                current, size = [], 0
+            if self.delimiter in text:
+                packs.append([text])
+                continue
+            current.append(text)
+            size += cost
+        if current:
+            packs.append(current)
+        return packs
+
+    def _translate_pack(self, pack: List[str], source: str, target: str) -> Optional[List[Optional[str]]]:
+        """翻译一个包并按分隔符拆回；行数对不上时返回 None，由调用方改为逐条翻译"""
+        if len(pack) == 1:
+            return [self.translate(pack[0], source, target)]
+        translated = self._request(self.delimiter.join(pack), source, target)
+        if translated is None:
+            # 网络或服务错误：逐条重试只会放大请求数，交给下一个翻译器
+            return [None] * len(pack)
+        parts = [part.strip() for part in translated.strip(self.delimiter).split(self.delimiter)]
+        if len(parts) == len(pack) and all(parts):
+            return parts
+        return None
+
 
 class LibreTranslateTranslator(BaseTranslator):
     name = "LibreTranslate"
+    # 公共实例有频率限制，逐条回退时只开少量并发
+    concurrency = 2
 
     def __init__(self, endpoint: str = LIBRE_TRANSLATE_ENDPOINT) -> None:
+        super().__init__()
         self.endpoint = endpoint
-        self.session = requests.Session()
+        self.session = pooled_session(self.concurrency)
         self.headers = {"Accept": "application/json"}
 
     def translate_many(
@@ -71,7 +214,7 @@ class LibreTranslateTranslator(BaseTranslator):
         payload = {"q": items, "source": source, "target": target, "format": "text"}
         try:
             resp = self.session.post(
-                self.endpoint, json=payload, headers=self.headers, timeout=8
+                self.endpoint, json=payload, headers=self.headers, timeout=TRANSLATION_TIMEOUT
             )
             resp.raise_for_status()
             translated = resp.json().get("translatedText", "")
@@ -84,14 +227,14 @@ class LibreTranslateTranslator(BaseTranslator):
         else:
             parts = []
         if len(parts) != len(items):
-            return [self.translate(text, source, target) for text in items]
+            return self._translate_each(items, source, target)
         return [str(part).strip() for part in parts]
 
     def translate(self, text: str, source: str, target: str) -> Optional[str]:
         payload = {"q": text, "source": source, "target": target, "format": "text"}
         try:
             resp = self.session.post(
-                self.endpoint, json=payload, headers=self.headers, timeout=8
+                self.endpoint, json=payload, headers=self.headers, timeout=TRANSLATION_TIMEOUT
             )
             resp.raise_for_status()
             translated = resp.json().get("translatedText", "")
@@ -104,6 +247,7 @@ class ArgosTranslateTranslator(BaseTranslator):
     name = "Argos"
 
     def __init__(self) -> None:
+        super().__init__()
         try:
             from argostranslate import translate
 
@@ -140,6 +284,7 @@ class DictionaryTranslator(BaseTranslator):
     name = "Dictionary"
 
     def __init__(self, mapping: Dict[str, str]) -> None:
+        super().__init__()
         self.mapping = mapping
         self.reverse = {value: key for key, value in mapping.items()}
 
@@ -155,9 +300,10 @@ class DictionaryTranslator(BaseTranslator):
 
 
 class TranslationManager:
-    def __init__(self) -> None:
+    def __init__(self, cache: Optional[TranslationCache] = None) -> None:
         dictionary = ensure_dictionary_file(DICTIONARY_PATH)
-        self.cache: Dict[CacheKey, str] = {}
+        # 持久缓存：已经翻译过的标签再次打开时不需要任何网络请求
+        self.cache = cache if cache is not None else TranslationCache()
         google = GoogleTranslateTranslator()
         libre = LibreTranslateTranslator()
         argos = ArgosTranslateTranslator()
@@ -185,13 +331,13 @@ class TranslationManager:
     def translate_many(self, texts: List[str], source: str, target: str) -> List[str]:
         results: List[Optional[str]] = [None] * len(texts)
         pending = []
+        cached = self.cache.get_many(source, target, [text.strip() for text in texts if text.strip()])
         for idx, text in enumerate(texts):
             trimmed = text.strip()
-            key = (source, target, trimmed)
             if not trimmed:
                 results[idx] = ""
-            elif key in self.cache:
-                results[idx] = self.cache[key]
+            elif trimmed in cached:
+                results[idx] = cached[trimmed]
             else:
                 pending.append(idx)
 
@@ -202,11 +348,9 @@ class TranslationManager:
             outputs = translator.translate_many(subset, source, target)
             next_pending: List[int] = []
             for idx, out in zip(pending, outputs):
-                trimmed = texts[idx].strip()
-                key = (source, target, trimmed)
                 if out and out.strip():
                     cleaned = out.strip()
-                    self.cache[key] = cleaned
+                    self.cache.put(source, target, texts[idx].strip(), cleaned, translator.name)
                     results[idx] = cleaned
                 else:
                     next_pending.append(idx)
@@ -215,18 +359,18 @@ class TranslationManager:
         for idx, text in enumerate(texts):
             if results[idx] is None:
                 trimmed = text.strip()
-                self.cache[(source, target, trimmed)] = trimmed
+                self.cache.put(source, target, trimmed, trimmed, None)
                 results[idx] = trimmed
+        self.cache.flush()
         return [value or "" for value in results]
 
     def translate_one(self, text: str, source: str, target: str) -> str:
-        trimmed = text.strip()
-        key = (source, target, trimmed)
-        if key in self.cache:
-            return self.cache[key]
-        result = self.translate_many([text], source, target)[0]
-        self.cache[key] = result
-        return result
+        return self.translate_many([text], source, target)[0]
+
+    def close(self) -> None:
+        for translator in {id(tran): tran for tran in self.en_to_zh + self.zh_to_en}.values():
+            translator.close()
+        self.cache.close()
 
     def describe_pipeline(self, source: str, target: str) -> str:
         chain = self._pipeline(source, target)
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+from PyQt5.QtCore import QFileSystemWatcher, QObject, QTimer, pyqtSignal
+
+from .dto import FileRecord
+
+DEBOUNCE_MS = 400
+MAX_DELAY_SECONDS = 2.0
+
+CREATED = "created"
+DELETED = "deleted"
+UPDATED = "updated"
+
+
+@dataclass
+class RecordChange:
+    kind: str
+    record: FileRecord
+
+
+def record_position(records: Sequence[FileRecord], base_name: str) -> int:
+    """records 按 base_name 排序，二分查找插入位置"""
+    low, high = 0, len(records)
+    while low < high:
+        mid = (low + high) // 2
+        if records[mid].base_name < base_name:
+            low = mid + 1
+        else:
+            high = mid
+    return low
+
+
+def diff_records(current: Iterable[FileRecord], scanned: Iterable[FileRecord]) -> List[RecordChange]:
+    """对比内存中的记录与重新扫描的结果，只返回新增、删除以及图片/锁定状态变化的条目"""
+    remaining: Dict[str, FileRecord] = {record.base_name: record for record in current}
+    changes: List[RecordChange] = []
+    for record in scanned:
+        existing = remaining.pop(record.base_name, None)
+        if existing is None:
+            changes.append(RecordChange(CREATED, record))
+        elif (
+            existing.image_path != record.image_path
+            or existing.tag_path != record.tag_path
+            or existing.locked != record.locked
+        ):
+            changes.append(RecordChange(UPDATED, record))
+    changes.extend(RecordChange(DELETED, record) for record in remaining.values())
+    return changes
+
+
+class DirectoryWatcher(QObject):
+    """监听数据集目录与当前打开的标签文件，合并短时间内的大量事件后统一通知"""
+
+    changed = pyqtSignal(object, object)
+
+    def __init__(self, parent: Optional[QObject] = None) -> None:
+        super().__init__(parent)
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._on_directory_changed)
+        self._watcher.fileChanged.connect(self._on_file_changed)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(DEBOUNCE_MS)
+        self._timer.timeout.connect(self._emit_pending)
+        self._dirty_dirs: Set[Path] = set()
+        self._dirty_files: Set[Path] = set()
+        self._first_event: Optional[float] = None
+
+    def watch_directories(self, folders: Iterable[Path]) -> None:
+        current = self._watcher.directories()
+        if current:
+            self._watcher.removePaths(current)
+        paths = [str(folder) for folder in folders]
+        if paths:
+            self._watcher.addPaths(paths)
+
+    def add_directories(self, folders: Iterable[Path]) -> None:
+        watched = set(self._watcher.directories())
+        paths = [str(folder) for folder in folders if str(folder) not in watched]
+        if paths:
+            self._watcher.addPaths(paths)
+
+    def watch_file(self, path: Optional[Path]) -> None:
+        current = self._watcher.files()
+        if current:
+            self._watcher.removePaths(current)
+        if path is not None and path.exists():
+            self._watcher.addPath(str(path))
+
+    def clear(self) -> None:
+        self.watch_directories([])
+        self.watch_file(None)
+        self._timer.stop()
+        self._dirty_dirs.clear()
+        self._dirty_files.clear()
+        self._first_event = None
+
+    def _on_directory_changed(self, path: str) -> None:
+        self._dirty_dirs.add(Path(path))
+        self._schedule()
+
+    def _on_file_changed(self, path: str) -> None:
+        target = Path(path)
+        self._dirty_files.add(target)
+        # 原子替换（临时文件 + rename）会让 inotify 丢失监听，需要重新加入
+        if target.exists() and path not in self._watcher.files():
+            self._watcher.addPath(path)
+        self._schedule()
+
+    def _schedule(self) -> None:
+        now = time.monotonic()
+        if self._first_event is None:
+            self._first_event = now
+        # 批量写入期间持续有事件，超过最大延迟后不再推迟，保证界面能及时刷新
+        if self._timer.isActive() and now - self._first_event >= MAX_DELAY_SECONDS:
+            return
+        self._timer.start()
+
+    def _emit_pending(self) -> None:
+        dirs, files = set(self._dirty_dirs), set(self._dirty_files)
+        self._dirty_dirs.clear()
+        self._dirty_files.clear()
+        self._first_event = None
+        if dirs or files:
+            self.changed.emit(dirs, files)
@@ -1,10 +1,13 @@
 from __future__ import annotations
 
-from typing import Optional
+from typing import Dict, List, Optional, Sequence, Tuple
 
 from PyQt5.QtCore import Qt, QSize, QRectF, pyqtSignal, QSignalBlocker
 from PyQt5.QtGui import QColor, QPainter, QPixmap, QTransform
-from PyQt5.QtWidgets import QFrame, QGraphicsPixmapItem, QGraphicsScene, QGraphicsView, QHBoxLayout, QLabel, QLineEdit, QSizePolicy, QToolButton, QWidget
+from PyQt5.QtWidgets import QDialog, QFrame, QGraphicsPixmapItem, QGraphicsScene, QGraphicsView, QHBoxLayout, QHeaderView, QLabel, QLineEdit, QPushButton, QSizePolicy, QTableWidget, QTableWidgetItem, QToolButton, QVBoxLayout, QWidget
+
+from .fuzzy import MergeCluster
+from .stats import DatasetStats
 
 
 class TagRowWidget(QFrame):
@@ -143,13 +146,17 @@ class ImageViewer(QGraphicsView):
         self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
         self.setResizeAnchor(QGraphicsView.AnchorUnderMouse)
 
-    def load_image(self, path: Optional[str]) -> None:
+    def load_image(self, path: Optional[str], data: Optional[bytes] = None) -> None:
         self.scene.clear()
         self.pix_item = None
         if not path:
             self._reset_zoom()
             return
-        pixmap = QPixmap(path)
+        if data is not None:
+            pixmap = QPixmap()
+            pixmap.loadFromData(data)
+        else:
+            pixmap = QPixmap(path)
         if pixmap.isNull():
             self._reset_zoom()
             return
@@ -204,3 +211,117 @@ class ImageViewer(QGraphicsView):
         super().resizeEvent(event)
         if self.pix_item and self.zoom == 1.0:
             self._fit_to_view()
+
+
+class StatsPanel(QDialog):
+    """数据集统计面板：汇总、标签文档频次与每文件标签数分布，数据由主窗口增量推送"""
+
+    exportRequested = pyqtSignal()
+    MAX_TAG_ROWS = 500
+
+    def __init__(self, parent: Optional[QWidget] = None):
+        super().__init__(parent)
+        self.setWindowTitle("数据集统计")
+        self.resize(520, 640)
+        layout = QVBoxLayout(self)
+        self.summary = QLabel(self)
+        layout.addWidget(self.summary)
+        self.tag_table = self._make_table(["标签", "文件数"])
+        layout.addWidget(self.tag_table, 3)
+        self.size_table = self._make_table(["每文件标签数", "文件数"])
+        layout.addWidget(self.size_table, 2)
+        buttons = QHBoxLayout()
+        buttons.addStretch(1)
+        export_button = QPushButton("导出 CSV", self)
+        export_button.clicked.connect(self.exportRequested.emit)
+        buttons.addWidget(export_button)
+        close_button = QPushButton("关闭", self)
+        close_button.clicked.connect(self.close)
+        buttons.addWidget(close_button)
+        layout.addLayout(buttons)
+
+    def _make_table(self, headers: List[str]) -> QTableWidget:
+        table = QTableWidget(0, len(headers), self)
+        table.setHorizontalHeaderLabels(headers)
+        table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        table.verticalHeader().setVisible(False)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        return table
+
+    @staticmethod
+    def _fill(table: QTableWidget, rows: Sequence[Tuple[object, int]]) -> None:
+        table.setRowCount(len(rows))
+        for row, (key, count) in enumerate(rows):
+            table.setItem(row, 0, QTableWidgetItem(str(key)))
+            item = QTableWidgetItem()
+            item.setData(Qt.DisplayRole, count)
+            table.setItem(row, 1, item)
+
+    def show_stats(self, stats: DatasetStats) -> None:
+        self.summary.setText(
+            f"文件 {stats.records} 个：已锁定 {stats.locked} / 未锁定 {stats.unlocked}\n"
+            f"不同标签 {stats.unique_tags} 个，平均每文件 {stats.mean_tags:.1f} 个标签"
+            + (f"（列表显示前 {self.MAX_TAG_ROWS} 个标签）" if stats.unique_tags > self.MAX_TAG_ROWS else "")
+        )
+        self._fill(self.tag_table, stats.doc_freq[: self.MAX_TAG_ROWS])
+        self._fill(self.size_table, stats.histogram)
+
+
+class FuzzyMergeDialog(QDialog):
+    """近似重复标签的合并建议：勾选要合并的组，目标写法可直接编辑"""
+
+    def __init__(self, clusters: Sequence[MergeCluster], parent: Optional[QWidget] = None):
+        super().__init__(parent)
+        self.clusters = list(clusters)
+        self.setWindowTitle("近似重复标签")
+        self.resize(640, 560)
+        layout = QVBoxLayout(self)
+        summary = QLabel(f"找到 {len(self.clusters)} 组拼写相近的标签，按出现次数排序；勾选的组将合并到目标写法。", self)
+        summary.setWordWrap(True)
+        layout.addWidget(summary)
+        self.table = QTableWidget(len(self.clusters), 3, self)
+        self.table.setHorizontalHeaderLabels(["目标写法", "合并的写法", "文件数"])
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        for row, cluster in enumerate(self.clusters):
+            target = QTableWidgetItem(cluster.target)
+            target.setFlags(target.flags() | Qt.ItemIsUserCheckable | Qt.ItemIsEditable)
+            target.setCheckState(Qt.Checked)
+            self.table.setItem(row, 0, target)
+            others = QTableWidgetItem(
+                ", ".join(f"{tag} ({count})" for tag, count in cluster.members if tag != cluster.target)
+            )
+            others.setFlags(others.flags() & ~Qt.ItemIsEditable)
+            self.table.setItem(row, 1, others)
+            total = QTableWidgetItem()
+            total.setData(Qt.DisplayRole, cluster.total)
+            total.setFlags(total.flags() & ~Qt.ItemIsEditable)
+            self.table.setItem(row, 2, total)
+        layout.addWidget(self.table)
+        buttons = QHBoxLayout()
+        for label, state in (("全选", Qt.Checked), ("全不选", Qt.Unchecked)):
+            button = QPushButton(label, self)
+            button.clicked.connect(lambda _=False, state=state: self._check_all(state))
+            buttons.addWidget(button)
+        buttons.addStretch(1)
+        merge_button = QPushButton("合并选中的组", self)
+        merge_button.clicked.connect(self.accept)
+        buttons.addWidget(merge_button)
+        cancel_button = QPushButton("取消", self)
+        cancel_button.clicked.connect(self.reject)
+        buttons.addWidget(cancel_button)
+        layout.addLayout(buttons)
+
+    def _check_all(self, state: Qt.CheckState) -> None:
+        for row in range(self.table.rowCount()):
+            self.table.item(row, 0).setCheckState(state)
+
+    def accepted_merges(self) -> Dict[str, str]:
+        """勾选的组合并后的映射：规范化键 → 目标写法"""
+        merges: Dict[str, str] = {}
+        for row, cluster in enumerate(self.clusters):
+            item = self.table.item(row, 0)
+            target = item.text().strip()
+            if item.checkState() == Qt.Checked and target:
+                merges.update(cluster.merges(target))
+        return merges
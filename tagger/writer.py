@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Callable, Dict, List, Optional, Set, Tuple
+
+from .archive import ArchiveError, find_member
+from .backup import BackupStore, backup_before_write
+from .changelog import TAGS, log_changes
+from .config import WRITE_GROUP_SIZE
+from .tagcache import tag_cache
+
+TEMP_SUFFIX = ".tmp"
+
+
+@dataclass
+class WriteStats:
+    files: int = 0
+    bytes: int = 0
+    fsyncs: int = 0
+    groups: int = 0
+    seconds: float = 0.0
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def megabytes_per_second(self) -> float:
+        return self.bytes / 1_048_576 / self.seconds if self.seconds > 0 else 0.0
+
+
+@dataclass
+class _Staged:
+    target: Path
+    temp: Path
+    handle: IO[bytes]
+    tags: List[str]
+    on_commit: Optional[Callable[[], None]]
+
+
+def clean_tags(tags: List[str]) -> List[str]:
+    # 逗号与换行在标签文件中就是分隔符，按读取时的规则拆开，缓存与回调拿到的列表才和读回的一致
+    pieces = (piece.strip() for tag in tags for piece in tag.replace("\n", ",").split(","))
+    return [piece for piece in pieces if piece]
+
+
+def _fsync_directory(folder: Path) -> bool:
+    # Windows 不支持对目录 fsync，rename 本身已由 NTFS 日志保证
+    try:
+        fd = os.open(str(folder), os.O_RDONLY)
+    except OSError:
+        return False
+    try:
+        os.fsync(fd)
+        return True
+    except OSError:
+        return False
+    finally:
+        os.close(fd)
+
+
+class TagWriteBatch:
+    """标签文件写入引擎：临时文件 + rename 保证任何时刻都不会出现写了一半的标签文件；
+    按目录分组提交，一组文件的 fsync 并发发出、目录只 fsync 一次（group commit）。
+    """
+
+    def __init__(
+        self,
+        group_size: int = WRITE_GROUP_SIZE,
+        durable: bool = True,
+        backup: bool = True,
+        journal: bool = True,
+    ) -> None:
+        self.group_size = max(1, group_size)
+        self.durable = durable
+        self.backup = backup
+        self.journal = journal
+        self.stats = WriteStats()
+        self.failures: List[Tuple[Path, OSError]] = []
+        self._staged: Dict[Path, List[_Staged]] = {}
+        self._stores: Set[BackupStore] = set()
+        self._count = 0
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._started: Optional[float] = None
+
+    def __enter__(self) -> "TagWriteBatch":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+    def write(
+        self, path: Path, tags: List[str], on_commit: Optional[Callable[[], None]] = None
+    ) -> List[str]:
+        """暂存一次写入，返回实际写入（也就是之后读回）的标签列表；打开或写入临时文件失败时直接抛出 OSError"""
+        if find_member(path) is not None:
+            raise ArchiveError(f"归档为只读，请先解包后再编辑：{path.name}")
+        if self._started is None:
+            self._started = time.perf_counter()
+        cleaned = clean_tags(tags)
+        data = ", ".join(cleaned).encode("utf-8")
+        folder = path.parent
+        if not folder.exists():
+            folder.mkdir(parents=True, exist_ok=True)
+        if self.backup:
+            store = backup_before_write(path)
+            if store is not None:
+                with self._lock:
+                    self._stores.add(store)
+        temp = folder / f".{path.name}.{os.getpid()}.{threading.get_ident()}{TEMP_SUFFIX}"
+        handle = open(temp, "wb")
+        try:
+            handle.write(data)
+            handle.flush()
+        except OSError:
+            handle.close()
+            _remove_quietly(temp)
+            raise
+        with self._lock:
+            self._staged.setdefault(folder, []).append(_Staged(path, temp, handle, cleaned, on_commit))
+            self._count += 1
+            self.stats.bytes += len(data)
+            full = self._count >= self.group_size
+        if full:
+            self.commit()
+        return list(cleaned)
+
+    def commit(self) -> None:
+        with self._commit_lock:
+            with self._lock:
+                staged, self._staged = self._staged, {}
+                stores, self._stores = self._stores, set()
+                self._count = 0
+            if not staged:
+                return
+            # 备份先落盘，再替换原文件
+            for store in stores:
+                try:
+                    store.flush()
+                except sqlite3.Error:
+                    pass
+            entries = [item for items in staged.values() for item in items]
+            written: Dict[Path, List] = {}
+            if self.durable:
+                # 同一组内的 fsync 并发发出，文件系统可以把它们合并到同一次日志提交中
+                workers = min(8, len(entries))
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    results = list(pool.map(self._sync_and_close, entries))
+                self.stats.fsyncs += len(entries)
+            else:
+                results = [self._close(item) for item in entries]
+            for item, error in zip(entries, results):
+                if error is None:
+                    try:
+                        os.replace(item.temp, item.target)
+                        stat = os.stat(item.target)
+                    except OSError as exc:
+                        error = exc
+                    else:
+                        tag_cache.put(item.target, (stat.st_mtime_ns, stat.st_size), item.tags)
+                if error is not None:
+                    _remove_quietly(item.temp)
+                    self.failures.append((item.target, error))
+                    continue
+                self.stats.files += 1
+                written.setdefault(item.target.parent, []).append((TAGS, item.target, item.tags, None, None))
+                if item.on_commit is not None:
+                    item.on_commit()
+            if self.durable:
+                for folder in staged:
+                    if _fsync_directory(folder):
+                        self.stats.fsyncs += 1
+            if self.journal:
+                # 只记录已经替换成功的文件，变更日志中的每一条都对应磁盘上的真实状态
+                for folder, changes in written.items():
+                    log_changes(folder, changes)
+            self.stats.groups += 1
+            if self._started is not None:
+                self.stats.seconds = time.perf_counter() - self._started
+
+    def abort(self) -> None:
+        with self._lock:
+            staged, self._staged = self._staged, {}
+            self._count = 0
+        for items in staged.values():
+            for item in items:
+                self._close(item)
+                _remove_quietly(item.temp)
+
+    @staticmethod
+    def _sync_and_close(item: _Staged) -> Optional[OSError]:
+        try:
+            os.fsync(item.handle.fileno())
+        except OSError as exc:
+            item.handle.close()
+            return exc
+        return TagWriteBatch._close(item)
+
+    @staticmethod
+    def _close(item: _Staged) -> Optional[OSError]:
+        try:
+            item.handle.close()
+        except OSError as exc:
+            return exc
+        return None
+
+
+def _remove_quietly(path: Path) -> None:
+    try:
+        path.unlink()
+    except OSError:
+        pass